@@ -1,27 +1,121 @@
-from flask import Flask
+from flask import Flask, jsonify
 from flask_cors import CORS
+from werkzeug.middleware.proxy_fix import ProxyFix
 from config import Config
 
-def create_app():
+def create_app(config_class=Config):
     app = Flask(__name__)
-    app.config.from_object(Config)
+    app.config.from_object(config_class)
+    
+    # Client addresses as the trusted proxies saw them; leftmost X-Forwarded-For entries are the client's to forge
+    if app.config['TRUSTED_PROXY_HOPS']:
+        app.wsgi_app = ProxyFix(app.wsgi_app, x_for=app.config['TRUSTED_PROXY_HOPS'])
     
     # Initialize extensions
     from app.extensions import db, jwt
+    from app import database, metrics
+    app.config['SQLALCHEMY_ENGINE_OPTIONS'] = database.engine_options(app.config)
     db.init_app(app)
+    database.init_app(app)
     jwt.init_app(app)
     CORS(app)
+    metrics.init_app(app)
+    
+    # Revoked access/refresh tokens
+    from app import denylist
+    denylist.init_app(app)
+    
+    # Changes announced to every worker and replica, for their caches to evict
+    from app import invalidation
+    invalidation.init_app(app)
+    
+    # Product and order changes recorded for the /api/changes feed
+    from app import outbox
+    outbox.init_app(app)
+    
+    # Stock shared by the pod's workers through /dev/shm
+    from app import stockshm
+    stockshm.init_app(app)
+    
+    # Identical concurrent reads share one computation
+    from app import coalesce
+    coalesce.init_app(app)
+    
+    # Co-purchase counts kept current as orders are confirmed
+    from app import copurchase
+    copurchase.init_app(app)
+    
+    # Stock levels and the low-stock watchlist, kept current as orders are confirmed
+    from app import lowstock
+    lowstock.init_app(app)
+    
+    # In-memory prefix index for type-ahead suggestions
+    from app import suggest
+    suggest.init_app(app)
+    
+    # Product documents rebuilt on commit, served by the catalog reads
+    from app import readmodel
+    readmodel.init_app(app)
+    
+    # Per-route SQL budgets and N+1 detection
+    from app import querybudget
+    querybudget.init_app(app)
+    
+    # Rate limits and concurrency caps
+    from app import ratelimit
+    ratelimit.init_app(app)
+    
+    # Statements over SLOW_QUERY_MS, with their plans
+    from app import slowlog
+    slowlog.init_app(app)
+    
+    # Opt-in request profiling, served under /api/admin/profiles
+    from app import profiling
+    profiling.init_app(app)
+    
+    # Accept-Encoding negotiation; runs before the other after_request hooks
+    from app import compression
+    compression.init_app(app)
+    
+    # Content-hashed, precompressed static files for the frontend
+    from app import assets
+    assets.init_app(app)
+    
+    from app.passwords import HashingBusy
+    
+    @app.errorhandler(HashingBusy)
+    def hashing_busy(error):
+        return jsonify({'error': 'Too many concurrent logins, retry shortly'}), 503, {'Retry-After': '1'}
     
     # Register blueprints
     with app.app_context():
-        from app.routes import auth, products, orders, users, reports
+        from app.routes import auth, products, orders, users, reports, admin, changes, batch
         app.register_blueprint(auth.bp)
         app.register_blueprint(products.bp)
         app.register_blueprint(orders.bp)
         app.register_blueprint(users.bp)
         app.register_blueprint(reports.bp)
+        app.register_blueprint(admin.bp)
+        app.register_blueprint(changes.bp)
+        app.register_blueprint(batch.bp)
         
-        # Create tables
-        db.create_all()
+        # Schema changes ship as migrations (flask db-upgrade); startup does no DDL
+        if app.config['SCHEMA_CHECK_ON_STARTUP']:
+            check_schema_version(app)
     
-    return app
\ No newline at end of file
+    return app
+
+def check_schema_version(app):
+    """Warn if the database is behind the migrations shipped with this code"""
+    from sqlalchemy.exc import SQLAlchemyError
+    from app.extensions import db
+    from app import migrations
+    try:
+        with db.engine.connect() as conn:
+            current = migrations.current_version(conn)
+    except SQLAlchemyError as error:
+        app.logger.warning('Schema version check skipped: %s', error)
+        return
+    if current < migrations.head():
+        app.logger.warning('Database schema is at version %s but the code expects %s; '
+                           'run flask db-upgrade', current, migrations.head())
\ No newline at end of file
@@ -0,0 +1,104 @@
+"""Fingerprinted static assets, hashed and precompressed once at startup.
+
+Every file under app/static is read when the app is created, named after its
+content hash (css/style.css -> css/style.3f2a9c1b0d4e.css) and compressed with
+every encoding app/compression.py can produce. Templates link to
+asset_url('css/style.css'); /assets/<name> serves the stored bytes with a
+one-year immutable Cache-Control, so a browser only fetches a file again once
+its content, and therefore its URL, changes. While the app is in debug mode
+(checked per request, since run.py only turns it on after the app is
+created) a file is re-fingerprinted when its mtime changes, so edits show up
+without a restart.
+"""
+import hashlib
+import mimetypes
+import os
+import threading
+from flask import Response, abort, current_app, request, url_for
+from app import compression
+
+MAX_AGE = 365 * 24 * 3600
+
+# Precompression runs once per file, so use the slowest, smallest settings
+LEVELS = {'gzip': 9, 'br': 11, 'zstd': 19}
+
+
+class Asset:
+    def __init__(self, path, data, mtime):
+        self.path = path
+        self.mtime = mtime
+        self.mimetype = mimetypes.guess_type(path)[0] or 'application/octet-stream'
+        self.etag = hashlib.sha256(data).hexdigest()[:12]
+        stem, ext = os.path.splitext(path)
+        self.name = f'{stem}.{self.etag}{ext}'
+        self.bodies = {None: data}
+        if self.mimetype.startswith('text/') or self.mimetype in compression.COMPRESSIBLE:
+            for encoding in compression.available_encodings():
+                compressed = compression.compress(data, encoding, LEVELS[encoding])
+                if len(compressed) < len(data):
+                    self.bodies[encoding] = compressed
+
+
+class AssetManifest:
+    """Assets by source path and by fingerprinted name"""
+
+    def __init__(self, folder):
+        self.folder = folder
+        self.by_path = {}
+        self.by_name = {}
+        self.lock = threading.Lock()
+        for root, _, files in os.walk(folder):
+            for filename in files:
+                self.load(os.path.relpath(os.path.join(root, filename), folder).replace(os.sep, '/'))
+
+    def load(self, path):
+        full_path = os.path.join(self.folder, path)
+        with open(full_path, 'rb') as f:
+            asset = Asset(path, f.read(), os.stat(full_path).st_mtime)
+        with self.lock:
+            old = self.by_path.get(path)
+            self.by_path[path] = asset
+            self.by_name[asset.name] = asset
+            if old is not None and old.name != asset.name:
+                self.by_name.pop(old.name, None)
+        return asset
+
+    def get(self, path, reload=False):
+        asset = self.by_path.get(path)
+        if asset is None:
+            raise KeyError(f'No static asset {path!r} in {self.folder}')
+        if reload and os.stat(os.path.join(self.folder, path)).st_mtime != asset.mtime:
+            asset = self.load(path)
+        return asset
+
+
+def asset_url(path):
+    """URL of the current version of a file under app/static"""
+    asset = current_app.extensions['assets'].get(path, reload=current_app.debug)
+    return url_for('asset', name=asset.name)
+
+
+def serve_asset(name):
+    asset = current_app.extensions['assets'].by_name.get(name)
+    if asset is None:
+        abort(404)
+    encodings = [encoding for encoding in asset.bodies if encoding is not None]
+    encoding = request.accept_encodings.best_match(encodings) if encodings else None
+    response = Response(asset.bodies[encoding], mimetype=asset.mimetype)
+    if encoding is not None:
+        response.headers['Content-Encoding'] = encoding
+    if encodings:
+        response.vary.add('Accept-Encoding')
+    response.cache_control.public = True
+    response.cache_control.max_age = MAX_AGE
+    response.cache_control.immutable = True
+    # Already in its final encoding; also keeps app/compression.py off it
+    response.cache_control.no_transform = True
+    response.set_etag(f'{asset.etag}-{encoding}' if encoding else asset.etag)
+    return response.make_conditional(request)
+
+
+def init_app(app):
+    app.extensions['assets'] = AssetManifest(app.static_folder)
+    app.add_url_rule('/assets/<path:name>', 'asset', serve_asset)
+    app.add_template_global(asset_url)
@@ -0,0 +1,283 @@
+"""Single-flight request coalescing for hot read endpoints.
+
+Requests to a @coalesce view with the same endpoint, view arguments and
+query string (and role, with vary_on_role) that arrive while one of them is
+being computed wait for it and get a copy of its response instead of
+running the view themselves. Streamed responses are shared as they are
+produced, so followers get the first chunk when the leader does.
+
+With COALESCE_LOCK_DIR set, the leaders of different workers also
+serialize on a per-key flock in that directory. A worker that had to wait
+uses the response the previous holder wrote there, provided it finished
+after the wait began. Point it at tmpfs; it holds one small lock file and
+the last response per key, stored as a JSON header line (status and
+headers) followed by the raw body.
+"""
+import fcntl
+import functools
+import hashlib
+import json
+import os
+import threading
+import time
+from flask import Response, current_app, request
+from flask_jwt_extended import get_jwt
+from app.metrics import Counter
+
+COALESCED = Counter('http_coalesced_requests_total',
+                    'Requests answered with the response of an identical in-flight request',
+                    ['endpoint', 'scope'])
+
+
+def coalesce(vary_on_role=False):
+    """Share one computation between concurrent identical requests.
+
+    Goes below @jwt_required(), so only authorized requests are coalesced:
+
+        @bp.route('/')
+        @query_budget(2)
+        @coalesce()
+        def get_products(): ...
+    """
+    def decorator(view):
+        @functools.wraps(view)
+        def wrapper(*args, **kwargs):
+            if not current_app.config['COALESCE_ENABLED']:
+                return view(*args, **kwargs)
+            return current_app.extensions['coalesce'].run(request_key(vary_on_role),
+                                                          lambda: view(*args, **kwargs))
+        return wrapper
+    return decorator
+
+
+def request_key(vary_on_role):
+    parts = [request.endpoint, sorted(request.view_args.items()), sorted(request.args.items(multi=True))]
+    if vary_on_role:
+        parts.append(get_jwt().get('role'))
+    return repr(parts)
+
+
+class Body:
+    """Chunks of a response body, readable by any number of threads while they are produced"""
+
+    def __init__(self):
+        self.chunks = []
+        self.done = False
+        self.failed = False
+        self.condition = threading.Condition()
+
+    def append(self, chunk):
+        with self.condition:
+            self.chunks.append(chunk)
+            self.condition.notify_all()
+
+    def finish(self, failed=False):
+        with self.condition:
+            self.done = True
+            self.failed = failed
+            self.condition.notify_all()
+
+    def __iter__(self):
+        index = 0
+        while True:
+            with self.condition:
+                while index >= len(self.chunks) and not self.done:
+                    self.condition.wait()
+                if index < len(self.chunks):
+                    chunk = self.chunks[index]
+                elif self.failed:
+                    raise RuntimeError('Coalesced response was not completed by its leader')
+                else:
+                    return
+            index += 1
+            yield chunk
+
+
+class Flight:
+    def __init__(self):
+        self.ready = threading.Event()
+        self.status = None
+        self.headers = None
+        self.body = Body()
+
+    def start(self, status, headers):
+        self.status = status
+        self.headers = [(name, value) for name, value in headers if name.lower() != 'content-length']
+        self.ready.set()
+
+    def response(self, timeout):
+        """A copy of the leader's response, or None if it failed or took longer than timeout"""
+        if not self.ready.wait(timeout) or self.status is None:
+            return None
+        with self.body.condition:
+            complete = self.body.done and not self.body.failed
+            body = b''.join(self.body.chunks) if complete else self.body
+        return Response(body, status=self.status, headers=self.headers)
+
+
+class Tee:
+    """The leader's streamed body, recorded for followers as it passes through.
+
+    A class rather than a generator so that close() finishes the flight even
+    when the body is never iterated.
+    """
+
+    def __init__(self, flights, key, flight, source, lock_fd):
+        self.flights = flights
+        self.key = key
+        self.flight = flight
+        self.source = source
+        self.lock_fd = lock_fd
+        self.finished = False
+
+    def __iter__(self):
+        try:
+            for chunk in self.source:
+                if isinstance(chunk, str):
+                    chunk = chunk.encode()
+                self.flight.body.append(chunk)
+                yield chunk
+        except GeneratorExit:
+            # The server stopped reading; close() finishes the body
+            raise
+        except BaseException:
+            # A dead source yields nothing more, so close() would take the partial body as complete
+            self.finish(False)
+            raise
+        self.finish(True)
+
+    def close(self):
+        if not self.finished:
+            # The leader's client went away; finish the body for the followers
+            try:
+                for chunk in self.source:
+                    self.flight.body.append(chunk.encode() if isinstance(chunk, str) else chunk)
+                complete = True
+            except Exception:
+                complete = False
+            self.finish(complete)
+
+    def finish(self, complete):
+        if self.finished:
+            return
+        self.finished = True
+        if hasattr(self.source, 'close'):
+            self.source.close()
+        if complete:
+            self.flights.publish(self.key, self.flight, self.lock_fd)
+        else:
+            self.flights.release(self.lock_fd)
+            self.flights.land(self.key, self.flight, failed=True)
+
+
+class SingleFlight:
+    def __init__(self, lock_dir, timeout):
+        self.lock_dir = lock_dir
+        self.timeout = timeout
+        self.lock = threading.Lock()
+        self.flights = {}
+        if lock_dir:
+            os.makedirs(lock_dir, mode=0o700, exist_ok=True)
+
+    def run(self, key, compute):
+        with self.lock:
+            flight = self.flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = self.flights[key] = Flight()
+        if not leader:
+            response = flight.response(self.timeout)
+            if response is not None:
+                COALESCED.inc(endpoint=request.endpoint, scope='worker')
+                return response
+            return compute()
+        try:
+            return self.lead(key, flight, compute)
+        except BaseException:
+            self.land(key, flight, failed=True)
+            raise
+
+    def land(self, key, flight, failed=False):
+        flight.body.finish(failed)
+        if flight.status is None:
+            flight.ready.set()
+        with self.lock:
+            if self.flights.get(key) is flight:
+                del self.flights[key]
+
+    def lead(self, key, flight, compute):
+        lock_fd, shared = self.acquire(key)
+        if shared is not None:
+            status, headers, body = shared
+            flight.start(status, headers)
+            flight.body.append(body)
+            self.land(key, flight)
+            self.release(lock_fd)
+            COALESCED.inc(endpoint=request.endpoint, scope='pod')
+            return Response(body, status=status, headers=headers)
+
+        try:
+            response = current_app.make_response(compute())
+        except BaseException:
+            self.release(lock_fd)
+            raise
+        flight.start(response.status_code, response.headers)
+        if response.is_streamed:
+            response.response = Tee(self, key, flight, response.response, lock_fd)
+            return response
+        flight.body.append(response.get_data())
+        self.publish(key, flight, lock_fd)
+        return response
+
+    def publish(self, key, flight, lock_fd):
+        if lock_fd is not None:
+            path = self.path(key, 'result')
+            header = json.dumps({'status': flight.status, 'headers': flight.headers})
+            with open(path + '.tmp', 'wb') as f:
+                f.write(header.encode() + b'\n')
+                f.write(b''.join(flight.body.chunks))
+            os.replace(path + '.tmp', path)
+        self.release(lock_fd)
+        self.land(key, flight)
+
+    def path(self, key, suffix):
+        return os.path.join(self.lock_dir, f'{hashlib.sha1(key.encode()).hexdigest()}.{suffix}')
+
+    def acquire(self, key):
+        """Take the key's cross-worker lock: (fd, response another worker finished while we waited)"""
+        if not self.lock_dir:
+            return None, None
+        fd = os.open(self.path(key, 'lock'), os.O_RDWR | os.O_CREAT, 0o600)
+        waited_since = time.time_ns()
+        deadline = time.monotonic() + self.timeout
+        waited = False
+        while True:
+            try:
+                fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                break
+            except BlockingIOError:
+                if time.monotonic() > deadline:
+                    # Give up on the other worker and compute without the lock
+                    os.close(fd)
+                    return None, None
+                waited = True
+                time.sleep(0.002)
+        if waited:
+            try:
+                result = self.path(key, 'result')
+                if os.stat(result).st_mtime_ns >= waited_since:
+                    with open(result, 'rb') as f:
+                        header = json.loads(f.readline())
+                        return fd, (header['status'], [tuple(pair) for pair in header['headers']], f.read())
+            except (OSError, ValueError, KeyError, TypeError):
+                pass
+        return fd, None
+
+    def release(self, lock_fd):
+        if lock_fd is not None:
+            fcntl.flock(lock_fd, fcntl.LOCK_UN)
+            os.close(lock_fd)
+
+
+def init_app(app):
+    app.extensions['coalesce'] = SingleFlight(app.config['COALESCE_LOCK_DIR'], app.config['COALESCE_TIMEOUT'])
@@ -0,0 +1,132 @@
+"""Response compression negotiated from Accept-Encoding.
+
+gzip is always available; br and zstd come from the `brotli` and `zstandard`
+packages in requirements.txt and are left out of negotiation when those are
+missing from an environment. Buffered responses are compressed
+when they are at least COMPRESSION_MIN_SIZE bytes. Streamed responses are
+always compressed, chunk by chunk, with a flush after every chunk so each one
+reaches the client as soon as it is encoded.
+"""
+import zlib
+from flask import current_app, request
+from werkzeug.wsgi import ClosingIterator
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+COMPRESSIBLE = ('application/json', 'application/javascript', 'image/svg+xml')
+
+
+class GzipStream:
+    def __init__(self, level):
+        self.compressor = zlib.compressobj(level, zlib.DEFLATED, 31)
+
+    def compress(self, data):
+        return self.compressor.compress(data) + self.compressor.flush(zlib.Z_SYNC_FLUSH)
+
+    def finish(self):
+        return self.compressor.flush()
+
+
+class BrotliStream:
+    def __init__(self, level):
+        self.compressor = brotli.Compressor(quality=level)
+
+    def compress(self, data):
+        return self.compressor.process(data) + self.compressor.flush()
+
+    def finish(self):
+        return self.compressor.finish()
+
+
+class ZstdStream:
+    def __init__(self, level):
+        self.compressor = zstandard.ZstdCompressor(level=level).compressobj()
+
+    def compress(self, data):
+        return self.compressor.compress(data) + self.compressor.flush(zstandard.COMPRESSOBJ_FLUSH_BLOCK)
+
+    def finish(self):
+        return self.compressor.flush()
+
+
+def available_encodings():
+    """Encodings this process can produce, in order of preference"""
+    encodings = []
+    if zstandard is not None:
+        encodings.append('zstd')
+    if brotli is not None:
+        encodings.append('br')
+    encodings.append('gzip')
+    return encodings
+
+
+STREAMS = {'gzip': GzipStream, 'br': BrotliStream, 'zstd': ZstdStream}
+
+
+def compress(data, encoding, level):
+    if encoding == 'zstd':
+        return zstandard.ZstdCompressor(level=level).compress(data)
+    if encoding == 'br':
+        return brotli.compress(data, quality=level)
+    return zlib.compress(data, level, wbits=31)
+
+
+def compress_stream(body, encoding, level):
+    stream = STREAMS[encoding](level)
+    try:
+        for chunk in body:
+            if isinstance(chunk, str):
+                chunk = chunk.encode()
+            if chunk:
+                yield stream.compress(chunk)
+        yield stream.finish()
+    finally:
+        # Closing the wrapped body is what ends stream_with_context's request context
+        if hasattr(body, 'close'):
+            body.close()
+
+
+def compressible(response):
+    mimetype = response.mimetype or ''
+    return mimetype.startswith('text/') or mimetype in COMPRESSIBLE
+
+
+def compress_response(response):
+    if (request.method == 'HEAD' or response.status_code < 200 or response.status_code in (204, 206, 304)
+            or response.direct_passthrough or 'Content-Encoding' in response.headers
+            or not compressible(response)):
+        return response
+    response.vary.add('Accept-Encoding')
+    if 'no-transform' in (response.headers.get('Cache-Control') or ''):
+        return response
+    if not response.is_streamed and len(response.get_data()) < current_app.config['COMPRESSION_MIN_SIZE']:
+        return response
+    encoding = request.accept_encodings.best_match(current_app.extensions['compression_encodings'])
+    if encoding is None:
+        return response
+
+    level = current_app.config['COMPRESSION_LEVELS'][encoding]
+    if response.is_streamed:
+        # ClosingIterator closes the body even if the stream is never started
+        response.response = ClosingIterator(compress_stream(response.response, encoding, level),
+                                            getattr(response.response, 'close', None))
+        response.headers.pop('Content-Length', None)
+    else:
+        response.set_data(compress(response.get_data(), encoding, level))
+    response.headers['Content-Encoding'] = encoding
+    return response
+
+
+def init_app(app):
+    if not app.config['COMPRESSION_ENABLED']:
+        return
+    app.extensions['compression_encodings'] = available_encodings()
+    app.after_request(compress_response)
@@ -0,0 +1,210 @@
+"""Co-purchase index behind GET /api/products/<id>/related.
+
+product_copurchases holds, for each product, how many sold orders also had
+each other product, in both directions. The related products of a product are
+its rows with the highest counts, read with a backward scan of
+ix_product_copurchases_top, so a lookup costs the same however long the
+order history is.
+
+build() recounts everything from order_items, one order at a time. Pairs
+go into PairCounts, a sparse accumulator that keeps sorted arrays of pair
+keys and counts and merges in batches of BUFFER_SIZE. Each product then
+keeps only its COPURCHASE_KEEP strongest partners, picked in one pass over
+the counts with a bounded heap per product. From then on, every transaction that
+moves an order into or out of a sold status, or deletes a sold one, adjusts
+the counts of its pairs before it commits, so the counts of archived months
+(app/partitions.py) stay in. A build only sees the months not yet archived
+and would drop them, so it is not a periodic job: flask db-upgrade builds
+the table when it is empty, and flask build-copurchases refuses to recount
+once a month is archived unless forced. Pairs outside a product's kept
+partners start again from zero when they are next bought together.
+"""
+import heapq
+from array import array
+from collections import Counter
+from itertools import combinations, groupby
+from sqlalchemy import bindparam, case, delete, event, inspect, insert, select, update
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.orm import raiseload
+from app.database import lift_statement_timeout
+from app.extensions import db
+from app.models import Product, ProductCopurchase, Order, OrderItem
+
+SOLD_STATUSES = ('confirmed', 'shipped', 'delivered')
+
+# Pair keys buffered before they are sorted and merged into the counts
+BUFFER_SIZE = 1 << 20
+# Product ids and counts are packed into 32 bits each
+MASK = 0xFFFFFFFF
+INSERT_BATCH_SIZE = 5000
+
+
+class PairCounts:
+    """Orders per unordered product pair, as parallel sorted arrays of pair keys and counts"""
+
+    def __init__(self):
+        self.keys = array('Q')
+        self.counts = array('L')
+        self.buffer = array('Q')
+
+    def add(self, product_ids):
+        """Count one order's distinct products"""
+        self.buffer.extend((low << 32) | high for low, high in combinations(sorted(product_ids), 2))
+        if len(self.buffer) >= BUFFER_SIZE:
+            self.compact()
+
+    def compact(self):
+        if not self.buffer:
+            return
+        batch = sorted(self.buffer)
+        self.buffer = array('Q')
+        merged = heapq.merge(zip(self.keys, self.counts), ((key, 1) for key in batch))
+        keys, counts = array('Q'), array('L')
+        for key, group in groupby(merged, key=lambda pair: pair[0]):
+            keys.append(key)
+            counts.append(sum(count for _, count in group))
+        self.keys, self.counts = keys, counts
+
+    def top(self, keep):
+        """Each product's keep strongest partners, as {product_id: [(orders, related_id), ...]}"""
+        self.compact()
+        # Per product, a min-heap of its keep strongest (orders, related_id) so far; ties go to the higher id
+        heaps = {}
+        for key, count in zip(self.keys, self.counts):
+            low, high = key >> 32, key & MASK
+            for product_id, related_id in ((low, high), (high, low)):
+                heap = heaps.setdefault(product_id, [])
+                if len(heap) < keep:
+                    heapq.heappush(heap, (count, related_id))
+                elif (count, related_id) > heap[0]:
+                    heapq.heapreplace(heap, (count, related_id))
+        return {product_id: sorted(heap, reverse=True) for product_id, heap in heaps.items()}
+
+
+def build(keep, session=None):
+    """Recount every pair from the sold orders; returns how many rows were written"""
+    session = session or db.session
+    lift_statement_timeout(session.connection())
+    counts = PairCounts()
+    rows = session.execute(
+        select(OrderItem.order_id, OrderItem.product_id)
+        .select_from(Order).join(Order.items)
+        .where(Order.status.in_(SOLD_STATUSES))
+        .order_by(OrderItem.order_id)
+        .execution_options(yield_per=INSERT_BATCH_SIZE)
+    )
+    for _, items in groupby(rows, key=lambda row: row[0]):
+        product_ids = {product_id for _, product_id in items}
+        if len(product_ids) > 1:
+            counts.add(product_ids)
+
+    session.execute(delete(ProductCopurchase))
+    written = [
+        {'product_id': product_id, 'related_product_id': related_id, 'orders': orders}
+        for product_id, partners in sorted(counts.top(keep).items())
+        for orders, related_id in partners
+    ]
+    for start in range(0, len(written), INSERT_BATCH_SIZE):
+        session.execute(insert(ProductCopurchase), written[start:start + INSERT_BATCH_SIZE])
+    session.commit()
+    return len(written)
+
+
+def is_built(session=None):
+    session = session or db.session
+    return session.scalar(select(ProductCopurchase.product_id).limit(1)) is not None
+
+
+def related(product_id, limit):
+    """(product, orders) for the products most often bought with product_id"""
+    return db.session.query(Product, ProductCopurchase.orders) \
+        .options(raiseload('*')) \
+        .join(ProductCopurchase, ProductCopurchase.related_product_id == Product.id) \
+        .filter(ProductCopurchase.product_id == product_id, ProductCopurchase.orders > 0) \
+        .order_by(ProductCopurchase.orders.desc(), ProductCopurchase.related_product_id.desc()) \
+        .limit(limit) \
+        .all()
+
+
+def was_sold(order):
+    history = inspect(order).attrs.status.history
+    status = history.deleted[0] if history.deleted else order.status
+    return status in SOLD_STATUSES
+
+
+def collect(session, flush_context, instances):
+    """Remember which orders this flush moves into or out of the sold statuses"""
+    pending = session.info.setdefault('copurchases', {})
+    for obj in session.new:
+        if isinstance(obj, Order) and obj.status in SOLD_STATUSES:
+            pending.setdefault(obj, [0, None])[0] += 1
+    for obj in session.dirty:
+        if isinstance(obj, Order):
+            delta = (obj.status in SOLD_STATUSES) - was_sold(obj)
+            if delta:
+                pending.setdefault(obj, [0, None])[0] += delta
+    for obj in session.deleted:
+        if isinstance(obj, Order) and was_sold(obj):
+            # Its items are gone once the flush runs, so take them now
+            entry = pending.setdefault(obj, [0, None])
+            entry[0] -= 1
+            entry[1] = {item.product_id for item in obj.items}
+
+
+def apply(session):
+    """Adjust the pair counts of the transaction's orders before it commits"""
+    session.flush()
+    pending = session.info.pop('copurchases', None)
+    if not pending:
+        return
+    unresolved = [order.id for order, (delta, product_ids) in pending.items() if delta and product_ids is None]
+    items = {}
+    if unresolved:
+        for order_id, product_id in session.execute(
+                select(OrderItem.order_id, OrderItem.product_id).where(OrderItem.order_id.in_(unresolved))):
+            items.setdefault(order_id, set()).add(product_id)
+
+    deltas = Counter()
+    for order, (delta, product_ids) in pending.items():
+        if not delta:
+            continue
+        product_ids = product_ids if product_ids is not None else items.get(order.id, ())
+        for low, high in combinations(sorted(product_ids), 2):
+            deltas[(low, high)] += delta
+            deltas[(high, low)] += delta
+    increments = sorted((pair, delta) for pair, delta in deltas.items() if delta > 0)
+    decrements = sorted((pair, -delta) for pair, delta in deltas.items() if delta < 0)
+    if increments:
+        upsert = postgresql.insert if session.get_bind().dialect.name == 'postgresql' else sqlite.insert
+        statement = upsert(ProductCopurchase)
+        statement = statement.on_conflict_do_update(
+            index_elements=['product_id', 'related_product_id'],
+            set_={'orders': ProductCopurchase.orders + statement.excluded.orders},
+        )
+        session.execute(statement, [
+            {'product_id': product_id, 'related_product_id': related_id, 'orders': delta}
+            for (product_id, related_id), delta in increments
+        ])
+    if decrements:
+        # Only pairs still kept; a count that reaches zero is skipped by related() until the next build
+        table = ProductCopurchase.__table__
+        session.execute(
+            update(table)
+            .where(table.c.product_id == bindparam('pair_product'),
+                   table.c.related_product_id == bindparam('pair_related'))
+            .values(orders=case((table.c.orders > bindparam('delta'), table.c.orders - bindparam('delta')), else_=0)),
+            [{'pair_product': product_id, 'pair_related': related_id, 'delta': delta}
+             for (product_id, related_id), delta in decrements]
+        )
+
+
+def discard(session, *args):
+    session.info.pop('copurchases', None)
+
+
+def init_app(app):
+    session_class = db.session.session_factory.class_
+    for name, listener in [('before_flush', collect), ('before_commit', apply),
+                           ('after_commit', discard), ('after_rollback', discard)]:
+        if not event.contains(session_class, name, listener):
+            event.listen(session_class, name, listener)
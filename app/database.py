@@ -0,0 +1,98 @@
+"""Engine options, connection pool instrumentation and per-blueprint statement timeouts"""
+import time
+from flask import current_app, has_app_context, has_request_context, request
+from sqlalchemy import event
+from sqlalchemy.pool import QueuePool
+from app.extensions import db
+from app.metrics import Counter, Gauge, Histogram
+
+POOL_WAIT = Histogram('db_pool_wait_seconds', 'Time spent waiting to check out a pooled connection')
+POOL_CHECKOUTS = Counter('db_pool_checkouts_total', 'Connections checked out of the pool')
+POOL_CONNECTS = Counter('db_pool_connects_total', 'New database connections opened')
+
+
+class InstrumentedQueuePool(QueuePool):
+    """QueuePool that records how long each checkout waited"""
+
+    def _do_get(self):
+        start = time.perf_counter()
+        try:
+            return super()._do_get()
+        finally:
+            POOL_WAIT.observe(time.perf_counter() - start)
+
+
+def _pool_stats():
+    """The serving app's pool, read through its app context so only live engines are reported"""
+    if not has_app_context():
+        return None
+    pool = db.engine.pool
+    if hasattr(pool, 'checkedout'):
+        return {('checked_out',): pool.checkedout(), ('idle',): pool.checkedin(),
+                ('overflow',): max(pool.overflow(), 0)}
+    return None
+
+
+POOL_CONNECTIONS = Gauge('db_pool_connections', 'Pooled connections by state', ['state'], callback=_pool_stats)
+
+
+def engine_options(config):
+    """SQLALCHEMY_ENGINE_OPTIONS built from the DB_* settings (Postgres only)"""
+    options = {}
+    if config['SQLALCHEMY_DATABASE_URI'].startswith('postgresql'):
+        options.update(
+            poolclass=InstrumentedQueuePool,
+            pool_size=config['DB_POOL_SIZE'],
+            max_overflow=config['DB_MAX_OVERFLOW'],
+            pool_timeout=config['DB_POOL_TIMEOUT'],
+            pool_recycle=config['DB_POOL_RECYCLE'],
+            pool_pre_ping=config['DB_POOL_PRE_PING'],
+        )
+        # PgBouncer in transaction mode rejects startup options; requests
+        # still get their timeout through SET LOCAL below. Partition-wise
+        # joins and aggregates (app/partitions.py) are off by default; behind
+        # PgBouncer, turn them on with ALTER DATABASE ... SET instead
+        if not config['DB_PGBOUNCER']:
+            options['connect_args'] = {
+                'options': f"-c statement_timeout={config['DB_STATEMENT_TIMEOUT_MS']} "
+                           '-c enable_partitionwise_join=on -c enable_partitionwise_aggregate=on'
+            }
+    options.update(config.get('SQLALCHEMY_ENGINE_OPTIONS') or {})
+    return options
+
+
+def statement_timeout_ms():
+    config = current_app.config
+    return config['STATEMENT_TIMEOUTS_MS'].get(request.blueprint, config['DB_STATEMENT_TIMEOUT_MS'])
+
+
+def lift_statement_timeout(conn):
+    """Let a migration or maintenance transaction run past DB_STATEMENT_TIMEOUT_MS (Postgres only)"""
+    if conn.dialect.name == 'postgresql':
+        # The connection's -c statement_timeout applies outside requests too
+        conn.exec_driver_sql('SET LOCAL statement_timeout = 0')
+
+
+def set_statement_timeout(session, transaction, connection):
+    """Apply the blueprint's statement_timeout to each transaction a request opens"""
+    if connection.dialect.name != 'postgresql' or not has_request_context():
+        return
+    # SET LOCAL ends with the transaction, so it is safe behind PgBouncer
+    connection.exec_driver_sql(f'SET LOCAL statement_timeout = {int(statement_timeout_ms())}')
+
+
+def count_checkout(dbapi_connection, connection_record, connection_proxy):
+    POOL_CHECKOUTS.inc()
+
+
+def count_connect(dbapi_connection, connection_record):
+    POOL_CONNECTS.inc()
+
+
+def init_app(app):
+    with app.app_context():
+        engine = db.engine
+    event.listen(engine, 'checkout', count_checkout)
+    event.listen(engine, 'connect', count_connect)
+    if not event.contains(db.session, 'after_begin', set_statement_timeout):
+        event.listen(db.session, 'after_begin', set_statement_timeout)
@@ -0,0 +1,71 @@
+"""Revoked JWT ids, remembered until the token would have expired anyway.
+
+They are kept in the revoked_tokens table, so a token revoked through one
+worker is refused by every worker and replica, and a rotated refresh token
+cannot be replayed anywhere. The lookup runs on the request's own session, so
+it takes no second pooled connection; revocations commit on a connection of
+their own, outside the request's transaction. If the database cannot answer,
+the token is refused. flask prune-revoked-tokens, scheduled by
+09-prune-revoked-tokens-cronjob.yaml, deletes the rows of tokens past their
+expiry.
+"""
+import logging
+import time
+from flask import current_app
+from sqlalchemy import delete, select
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.exc import SQLAlchemyError
+from app.extensions import db, jwt
+from app.models import RevokedToken
+
+logger = logging.getLogger(__name__)
+
+
+class Denylist:
+    """Revoked token ids in the database"""
+
+    def __init__(self, engine):
+        self.engine = engine
+
+    def revoke(self, jti, exp):
+        """Revoke a token id; returns False if it was already revoked"""
+        upsert = postgresql.insert if self.engine.dialect.name == 'postgresql' else sqlite.insert
+        with self.engine.begin() as conn:
+            # The primary key settles a race between two uses of one refresh token
+            result = conn.execute(
+                upsert(RevokedToken).values(jti=jti, exp=exp).on_conflict_do_nothing(index_elements=['jti'])
+            )
+        return result.rowcount == 1
+
+    def is_revoked(self, jti):
+        try:
+            return db.session.scalar(select(RevokedToken.jti).where(RevokedToken.jti == jti)) is not None
+        except SQLAlchemyError:
+            db.session.rollback()
+            # Fail closed: a token that might be revoked is not honoured
+            logger.exception('Token denylist unavailable, refusing token')
+            return True
+
+    def prune(self):
+        """Delete the ids of tokens past their expiry; returns how many were deleted"""
+        with self.engine.begin() as conn:
+            return conn.execute(delete(RevokedToken).where(RevokedToken.exp <= int(time.time()))).rowcount
+
+
+def init_app(app):
+    with app.app_context():
+        app.extensions['jwt_denylist'] = Denylist(db.engine)
+
+
+def get_denylist():
+    return current_app.extensions['jwt_denylist']
+
+
+def revoke_token(claims):
+    """Revoke a decoded token; returns False if it was already revoked"""
+    return get_denylist().revoke(claims['jti'], claims['exp'])
+
+
+@jwt.token_in_blocklist_loader
+def token_is_revoked(jwt_header, jwt_payload):
+    return get_denylist().is_revoked(jwt_payload['jti'])
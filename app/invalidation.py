@@ -0,0 +1,235 @@
+"""Cross-replica cache invalidation over Postgres LISTEN/NOTIFY.
+
+Every commit that changes a product, category, brand, size, color or order,
+or the stock of a product, announces what it changed with one NOTIFY on
+INVALIDATION_CHANNEL:
+
+    {"origin": "<host>:<pid>", "version": <txid>, "at": <unix time>,
+     "changes": {"product": [3, 9], "stock": [3, 4]}}
+
+NOTIFY is transactional, so listeners only hear about committed changes, in
+commit order. Each worker runs a listener thread on its own connection and
+hands every change to the callbacks registered with subscribe(); the
+committing worker delivers its own changes right after the commit instead.
+LISTEN needs a session of its own, so behind PgBouncer in transaction mode
+set INVALIDATION_LISTEN_URL to a direct connection. That connection sits
+outside the pool; the connection budget in config.py counts it.
+
+ids is None when a subscriber must drop everything of that entity: the change
+was too large for one NOTIFY, or the listener reconnected and may have missed
+changes. On other databases, changes only reach the committing process.
+"""
+import json
+import logging
+import os
+import select
+import socket
+import threading
+import time
+from collections import defaultdict, namedtuple
+from sqlalchemy import create_engine, event, inspect, select as select_query, text
+from sqlalchemy.pool import NullPool
+from flask import current_app
+from app.extensions import db
+from app.metrics import Counter, Histogram
+from app.models import Product, Category, Brand, Size, Color, Order, OrderItem
+from app import readmodel
+
+logger = logging.getLogger(__name__)
+
+HOST = socket.gethostname()
+
+# NOTIFY payloads must stay under 8000 bytes
+MAX_PAYLOAD = 7500
+
+Change = namedtuple('Change', 'entity ids version origin')
+
+RECEIVED = Counter('cache_invalidations_received_total',
+                   'Change notifications received from other workers and replicas', ['entity'])
+LAG = Histogram('cache_invalidation_lag_seconds',
+                'Time from a commit in another worker or replica to its invalidation here',
+                buckets=(0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 5))
+
+ENTITIES = {Product: 'product', Category: 'category', Brand: 'brand', Size: 'size', Color: 'color',
+            Order: 'order'}
+
+
+def origin():
+    return f'{HOST}:{os.getpid()}'
+
+
+def from_this_pod(change):
+    """Whether the change was committed by a worker sharing this pod's /dev/shm"""
+    return change.origin is not None and change.origin.rsplit(':', 1)[0] == HOST
+
+
+class InvalidationBus:
+    def __init__(self, channel, listen_url=None):
+        self.channel = channel
+        self.listen_url = listen_url
+        self.subscribers = defaultdict(list)
+        self.lock = threading.Lock()
+        self.pid = None
+
+    def subscribe(self, entity, callback):
+        """Call callback(change) for every committed change to entity"""
+        self.subscribers[entity].append(callback)
+
+    def deliver(self, changes, version, origin):
+        for entity, ids in changes.items():
+            change = Change(entity, None if ids is None else frozenset(ids), version, origin)
+            for callback in self.subscribers.get(entity, ()):
+                try:
+                    callback(change)
+                except Exception:
+                    logger.exception('Invalidation subscriber %r failed on %s', callback, entity)
+
+    def receive(self, payload):
+        message = json.loads(payload)
+        if message['origin'] == origin():
+            return
+        LAG.observe(max(0.0, time.time() - message['at']))
+        for entity in message['changes']:
+            RECEIVED.inc(entity=entity)
+        self.deliver(message['changes'], message['version'], message['origin'])
+
+    def start(self):
+        """Start this process's listener thread, once per pid (forked workers need their own)"""
+        if self.listen_url is None or self.pid == os.getpid():
+            return
+        with self.lock:
+            if self.pid == os.getpid():
+                return
+            self.pid = os.getpid()
+            threading.Thread(target=self.listen, name='invalidation-listener', daemon=True).start()
+
+    def listen(self):
+        engine = create_engine(self.listen_url, poolclass=NullPool)
+        connected_before = False
+        delay = 0.1
+        while True:
+            try:
+                connection = engine.raw_connection()
+                try:
+                    dbapi = connection.driver_connection
+                    dbapi.autocommit = True
+                    cursor = dbapi.cursor()
+                    cursor.execute(f'LISTEN {self.channel}')
+                    if connected_before:
+                        # Changes committed while we were disconnected were not delivered
+                        self.deliver({entity: None for entity in self.subscribers}, None, None)
+                    connected_before = True
+                    delay = 0.1
+                    while True:
+                        if select.select([dbapi], [], [], 5) == ([], [], []):
+                            # Idle; make sure the connection is still there
+                            cursor.execute('SELECT 1')
+                            continue
+                        dbapi.poll()
+                        while dbapi.notifies:
+                            self.receive(dbapi.notifies.pop(0).payload)
+                finally:
+                    connection.close()
+            except Exception:
+                logger.exception('Invalidation listener lost its connection; retrying in %.1fs', delay)
+                time.sleep(delay)
+                delay = min(delay * 2, 5)
+
+
+def collect(session, flush_context):
+    """Remember what this flush changed"""
+    pending = session.info.setdefault('invalidations', defaultdict(set))
+    for obj in session.new | session.deleted:
+        entity = ENTITIES.get(type(obj))
+        if entity:
+            pending[entity].add(obj.id)
+        if isinstance(obj, Product):
+            pending['stock'].add(obj.id)
+        elif isinstance(obj, OrderItem):
+            pending['stock'].add(obj.product_id)
+    for obj in session.dirty:
+        entity = ENTITIES.get(type(obj))
+        if isinstance(obj, Product):
+            if readmodel.changed(obj, ('order_items',)):
+                pending['product'].add(obj.id)
+            if has_changes(obj, 'initial_quantity'):
+                pending['stock'].add(obj.id)
+        elif isinstance(obj, Order):
+            if readmodel.changed(obj, ('items',)):
+                pending['order'].add(obj.id)
+            if has_changes(obj, 'status'):
+                pending['order_status'].add(obj.id)
+        elif isinstance(obj, OrderItem):
+            if readmodel.changed(obj, ()):
+                # Both the old and the new product when an item is moved
+                pending['stock'].update(inspect(obj).attrs.product_id.history.sum())
+        elif entity and readmodel.changed(obj, ('products',)):
+            pending[entity].add(obj.id)
+
+
+def announce(session, entity, ids):
+    """Add changes made outside the ORM flush (Core inserts) to the transaction's notice"""
+    session.info.setdefault('invalidations', defaultdict(set))[entity].update(ids)
+
+
+def has_changes(obj, key):
+    return inspect(obj).attrs[key].history.has_changes()
+
+
+def publish(session):
+    """NOTIFY the changes of the committing transaction"""
+    session.flush()
+    pending = session.info.pop('invalidations', None)
+    bus = current_app.extensions.get('invalidation')
+    if not pending or bus is None:
+        return
+    # A status change moves the stock of every product on the order
+    orders = pending.pop('order_status', None)
+    if orders:
+        pending['stock'].update(session.scalars(
+            select_query(OrderItem.product_id).where(OrderItem.order_id.in_(orders)).distinct()
+        ))
+    changes = {entity: sorted(ids - {None}) for entity, ids in pending.items() if ids - {None}}
+    if not changes:
+        return
+    version = None
+    if bus.listen_url is not None:
+        encoded = json.dumps(changes, separators=(',', ':'))
+        if len(encoded) > MAX_PAYLOAD:
+            changes = {entity: None for entity in changes}
+            encoded = json.dumps(changes)
+        version = session.execute(text(
+            "SELECT txid_current() AS version, pg_notify(:channel, json_build_object("
+            "'origin', :origin, 'version', txid_current(), 'at', :at, 'changes', CAST(:changes AS json))::text)"
+        ), {'channel': bus.channel, 'origin': origin(), 'at': time.time(), 'changes': encoded}).scalar()
+    session.info['published_invalidations'] = (changes, version)
+
+
+def deliver_committed(session):
+    """Hand the committed changes to this process's subscribers"""
+    session.info.pop('invalidations', None)
+    published = session.info.pop('published_invalidations', None)
+    if published is not None:
+        current_app.extensions['invalidation'].deliver(*published, origin())
+
+
+def discard(session, *args):
+    session.info.pop('invalidations', None)
+    session.info.pop('published_invalidations', None)
+
+
+def subscribe(app, entity, callback):
+    app.extensions['invalidation'].subscribe(entity, callback)
+
+
+def init_app(app):
+    notify = app.config['INVALIDATION_NOTIFY'] and app.config['SQLALCHEMY_DATABASE_URI'].startswith('postgresql')
+    listen_url = app.config['INVALIDATION_LISTEN_URL'] or app.config['SQLALCHEMY_DATABASE_URI']
+    bus = app.extensions['invalidation'] = InvalidationBus(app.config['INVALIDATION_CHANNEL'],
+                                                           listen_url if notify else None)
+    app.before_request(bus.start)
+    session_class = db.session.session_factory.class_
+    for name, listener in [('after_flush', collect), ('before_commit', publish),
+                           ('after_commit', deliver_committed), ('after_rollback', discard)]:
+        if not event.contains(session_class, name, listener):
+            event.listen(session_class, name, listener)
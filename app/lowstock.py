@@ -0,0 +1,198 @@
+"""Low-stock watchlist behind GET /api/products/low-stock.
+
+stock_levels holds one row per product: its available units (initial,
+less archived and live sold units) and its margin, available less the
+product's reorder_threshold. ix_stock_levels_low is partial, over the rows
+with margin <= 0 only, so reading the watchlist costs the products on it
+however large the catalog is.
+
+build() recomputes every row from the order history. From then on, every
+transaction that moves an order into or out of a sold status, deletes a
+sold one, creates a product or changes its initial quantity or threshold
+adjusts the rows it touches before it commits, relatively, so concurrent
+checkouts never overwrite each other. Confirmations committed while a build
+runs can be missed; flask build-stock-levels recomputes them.
+
+With LOW_STOCK_EVENTS on, a product whose margin crosses zero also gets a
+'low_stock' or 'restocked' event on the /api/changes feed (app/outbox.py),
+committed with the change that crossed it.
+"""
+from collections import Counter
+from flask import current_app
+from sqlalchemy import case, delete, event, func, inspect, insert, literal_column, select
+from sqlalchemy.dialects import postgresql, sqlite
+from app import outbox
+from app.database import lift_statement_timeout
+from app.extensions import db
+from app.models import Product, StockLevel, Order, OrderItem
+
+SOLD_STATUSES = ('confirmed', 'shipped', 'delivered')
+
+
+def levels():
+    """product_id, available and margin of every product, from the order history"""
+    sold = select(OrderItem.product_id, func.sum(OrderItem.quantity).label('quantity')) \
+        .select_from(Order).join(Order.items) \
+        .where(Order.status.in_(SOLD_STATUSES)) \
+        .group_by(OrderItem.product_id) \
+        .subquery()
+    available = Product.initial_quantity - Product.archived_sold_quantity - func.coalesce(sold.c.quantity, 0)
+    return select(Product.id, available, available - Product.reorder_threshold) \
+        .outerjoin(sold, sold.c.product_id == Product.id)
+
+
+def build(session=None):
+    """Recompute every product's stock level; returns how many rows were written"""
+    session = session or db.session
+    lift_statement_timeout(session.connection())
+    session.execute(delete(StockLevel))
+    result = session.execute(insert(StockLevel).from_select(['product_id', 'available', 'margin'], levels()))
+    session.commit()
+    return result.rowcount
+
+
+def is_built(session=None):
+    session = session or db.session
+    return session.scalar(select(StockLevel.product_id).limit(1)) is not None
+
+
+def watchlist(limit):
+    """(stock level, product name) for the products at or below their threshold, furthest below first"""
+    # A literal, not a parameter, so the planner can match the partial index's predicate
+    return db.session.query(StockLevel, Product.name) \
+        .join(Product, Product.id == StockLevel.product_id) \
+        .filter(StockLevel.margin <= literal_column('0')) \
+        .order_by(StockLevel.margin, StockLevel.product_id) \
+        .limit(limit) \
+        .all()
+
+
+def was_sold(order):
+    history = inspect(order).attrs.status.history
+    status = history.deleted[0] if history.deleted else order.status
+    return status in SOLD_STATUSES
+
+
+def collect(session, flush_context, instances):
+    """Remember the sold orders and product quantities this flush changes"""
+    pending = session.info.setdefault('lowstock', {'orders': {}, 'products': Counter(), 'thresholds': Counter(),
+                                                   'created': set(), 'recount': set()})
+    for obj in session.new:
+        if isinstance(obj, Order) and obj.status in SOLD_STATUSES:
+            pending['orders'].setdefault(obj, [0, None])[0] += 1
+        elif isinstance(obj, Product):
+            pending['created'].add(obj)
+    for obj in session.dirty:
+        if isinstance(obj, Order):
+            delta = (obj.status in SOLD_STATUSES) - was_sold(obj)
+            if delta:
+                pending['orders'].setdefault(obj, [0, None])[0] += delta
+        elif isinstance(obj, Product) and obj not in pending['created']:
+            for key, changes in [('initial_quantity', pending['products']), ('reorder_threshold', pending['thresholds'])]:
+                history = inspect(obj).attrs[key].history
+                if history.added and not history.deleted:
+                    # Set without its old value ever loaded, so there is no difference to apply
+                    pending['recount'].add(obj)
+                elif history.added:
+                    changes[obj.id] += (history.added[0] or 0) - (history.deleted[0] or 0)
+    for obj in session.deleted:
+        if isinstance(obj, Order) and was_sold(obj):
+            # Its items are gone once the flush runs, so take them now
+            entry = pending['orders'].setdefault(obj, [0, None])
+            entry[0] -= 1
+            entry[1] = [(item.product_id, item.quantity) for item in obj.items]
+
+
+def notify(session, product_id, available, margin, old_margin):
+    if (old_margin is None or old_margin > 0) and margin <= 0:
+        action = 'low_stock'
+    elif old_margin is not None and old_margin <= 0 and margin > 0:
+        action = 'restocked'
+    else:
+        return
+    outbox.notify(session, 'product', product_id, action,
+                  {'current_quantity': available, 'reorder_threshold': available - margin})
+
+
+def apply(session):
+    """Adjust the stock levels of the transaction's products before it commits"""
+    session.flush()
+    pending = session.info.pop('lowstock', None)
+    if not pending:
+        return
+    events = current_app.config['LOW_STOCK_EVENTS']
+    dialect = session.get_bind().dialect.name
+    table = StockLevel.__table__
+
+    # Recomputed from what this transaction has flushed, which already counts its own orders
+    created = {product.id for product in pending['created'] if inspect(product).persistent}
+    recount = created | {product.id for product in pending['recount'] if inspect(product).persistent}
+    if recount:
+        upsert = postgresql.insert if dialect == 'postgresql' else sqlite.insert
+        statement = upsert(table).from_select(
+            ['product_id', 'available', 'margin'], levels().where(Product.id.in_(sorted(recount)))
+        )
+        # A reused id takes over whatever row a deleted product left behind
+        statement = statement.on_conflict_do_update(
+            index_elements=['product_id'],
+            set_={'available': statement.excluded.available, 'margin': statement.excluded.margin},
+        )
+        rows = session.execute(statement.returning(table.c.product_id, table.c.available, table.c.margin)).all()
+        if events:
+            for product_id, level, margin in rows:
+                if product_id in created:
+                    notify(session, product_id, level, margin, None)
+
+    orders = pending['orders']
+    unresolved = [order.id for order, (delta, items) in orders.items() if delta and items is None]
+    items = {}
+    if unresolved:
+        for order_id, product_id, quantity in session.execute(
+                select(OrderItem.order_id, OrderItem.product_id, OrderItem.quantity)
+                .where(OrderItem.order_id.in_(unresolved))):
+            items.setdefault(order_id, []).append((product_id, quantity))
+
+    available = Counter(pending['products'])
+    for order, (delta, order_items) in orders.items():
+        if not delta:
+            continue
+        for product_id, quantity in order_items if order_items is not None else items.get(order.id, ()):
+            available[product_id] -= delta * quantity
+    margins = Counter(available)
+    margins.subtract(pending['thresholds'])
+    changed = sorted(product_id for product_id in set(margins) - recount
+                     if available[product_id] or margins[product_id])
+    if not changed:
+        return
+    if dialect == 'postgresql':
+        # Row locks in product order, so checkouts sharing products queue up instead of deadlocking
+        session.execute(select(table.c.product_id).where(table.c.product_id.in_(changed))
+                        .order_by(table.c.product_id).with_for_update())
+    rows = session.execute(
+        table.update()
+        .where(table.c.product_id.in_(changed))
+        .values(
+            available=table.c.available + case(
+                {product_id: available[product_id] for product_id in changed}, value=table.c.product_id, else_=0),
+            margin=table.c.margin + case(
+                {product_id: margins[product_id] for product_id in changed}, value=table.c.product_id, else_=0),
+        )
+        .returning(table.c.product_id, table.c.available, table.c.margin)
+    ).all()
+    if events:
+        for product_id, level, margin in rows:
+            notify(session, product_id, level, margin, margin - margins[product_id])
+
+
+def discard(session, *args):
+    session.info.pop('lowstock', None)
+
+
+def init_app(app):
+    session_class = db.session.session_factory.class_
+    for name, listener in [('before_flush', collect), ('after_commit', discard), ('after_rollback', discard)]:
+        if not event.contains(session_class, name, listener):
+            event.listen(session_class, name, listener)
+    # Ahead of outbox.write, which inserts the events notify() adds
+    if not event.contains(session_class, 'before_commit', apply):
+        event.listen(session_class, 'before_commit', apply, insert=True)
@@ -0,0 +1,223 @@
+"""In-process metrics, exposed in Prometheus text format on /metrics.
+
+Each worker process keeps its own values; Prometheus should scrape every
+worker (or sum over the pod) rather than assume one scrape covers the pod.
+
+Every statement on the app's engine is timed once, here; the slow-query log
+and the profiler get each (statement, duration) through observe_statements().
+"""
+import threading
+import time
+from abc import ABC, abstractmethod
+from flask import Response, current_app, g, has_request_context, request
+from sqlalchemy import event
+from app.streaming import after_body
+
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+REGISTRY = []
+
+
+class Metric(ABC):
+    kind = None
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+        REGISTRY.append(self)
+
+    def _key(self, labels):
+        return tuple(str(labels.get(name, '')) for name in self.labelnames)
+
+    def _format_labels(self, key, extra=None):
+        pairs = list(zip(self.labelnames, key))
+        if extra:
+            pairs.append(extra)
+        if not pairs:
+            return ''
+        escaped = (value.replace('\\', '\\\\').replace('"', '\\"') for _, value in pairs)
+        return '{' + ','.join(f'{name}="{value}"' for (name, _), value in zip(pairs, escaped)) + '}'
+
+    @abstractmethod
+    def samples(self):
+        """Exposition lines for the current values"""
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} {self.kind}']
+        lines.extend(self.samples())
+        return lines
+
+
+class Counter(Metric):
+    kind = 'counter'
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def samples(self):
+        with self._lock:
+            items = list(self._values.items())
+        return [f'{self.name}{self._format_labels(key)} {value}' for key, value in items]
+
+
+class Gauge(Metric):
+    """A value that is set directly, or read from a callback at scrape time"""
+    kind = 'gauge'
+
+    def __init__(self, name, documentation, labelnames=(), callback=None):
+        super().__init__(name, documentation, labelnames)
+        self.callback = callback
+
+    def set(self, value, **labels):
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+    def samples(self):
+        if self.callback is not None:
+            values = self.callback()
+            if values is None:
+                return []
+            if not isinstance(values, dict):
+                values = {(): values}
+        else:
+            with self._lock:
+                values = dict(self._values)
+        return [f'{self.name}{self._format_labels(key)} {value}' for key, value in values.items()]
+
+
+class Histogram(Metric):
+    kind = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            counts = self._values.get(key)
+            if counts is None:
+                # one slot per bucket plus +Inf, then sum
+                counts = self._values[key] = [0] * (len(self.buckets) + 1) + [0.0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[i] += 1
+                    break
+            else:
+                counts[len(self.buckets)] += 1
+            counts[-1] += value
+
+    def samples(self):
+        with self._lock:
+            items = [(key, list(counts)) for key, counts in self._values.items()]
+        lines = []
+        for key, counts in items:
+            cumulative = 0
+            for bound, count in zip(self.buckets + ('+Inf',), counts):
+                cumulative += count
+                le = ('le', bound if isinstance(bound, str) else repr(float(bound)))
+                lines.append(f'{self.name}_bucket{self._format_labels(key, le)} {cumulative}')
+            lines.append(f'{self.name}_sum{self._format_labels(key)} {counts[-1]}')
+            lines.append(f'{self.name}_count{self._format_labels(key)} {cumulative}')
+        return lines
+
+
+HTTP_LATENCY = Histogram('http_request_duration_seconds', 'Request latency',
+                         ['endpoint', 'method', 'status'])
+SQL_STATEMENTS = Histogram('http_request_sql_statements', 'SQL statements issued per request',
+                           ['endpoint'], buckets=(0, 1, 2, 5, 10, 20, 50, 100, 200, 500, 1000))
+SQL_TIME = Histogram('http_request_db_seconds', 'Total time spent in SQL per request', ['endpoint'])
+RESPONSE_SIZE = Histogram('http_response_size_bytes', 'Response body size', ['endpoint'],
+                          buckets=(256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304, 16777216))
+
+
+class StatementTimer:
+    """Times each statement on an engine and hands it to every observer"""
+
+    def __init__(self):
+        self.observers = [count_statement]
+
+    def before_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault('query_start', []).append(time.perf_counter())
+
+    def after_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        elapsed = time.perf_counter() - conn.info['query_start'].pop()
+        for observer in self.observers:
+            observer(conn, statement, parameters, executemany, elapsed)
+
+    def handle_error(self, context):
+        """A failed statement never reaches after_cursor_execute"""
+        starts = context.connection.info.get('query_start') if context.connection else None
+        if starts:
+            starts.pop()
+
+
+def count_statement(conn, statement, parameters, executemany, elapsed):
+    if has_request_context() and 'request_start' in g:
+        g.sql_count += 1
+        g.sql_time += elapsed
+
+
+def observe_statements(app, observer):
+    """Call observer(conn, statement, parameters, executemany, elapsed) after each statement of app's engine"""
+    app.extensions['statement_timer'].observers.append(observer)
+
+
+def start_request():
+    g.request_start = time.perf_counter()
+    g.sql_count = 0
+    g.sql_time = 0.0
+
+
+def finish_request(response):
+    if 'request_start' not in g:
+        return response
+    state = g._get_current_object()
+    endpoint = request.endpoint or 'unmatched'
+    method = request.method
+    if current_app.config['METRICS_SERVER_TIMING']:
+        # Sent with the headers, so a streamed body's later batches are not in it
+        response.headers['Server-Timing'] = (
+            f'app;dur={(time.perf_counter() - state.request_start) * 1000:.1f}, '
+            f'db;dur={state.sql_time * 1000:.1f};desc="{state.sql_count} queries"'
+        )
+
+    def observe():
+        elapsed = time.perf_counter() - state.request_start
+        HTTP_LATENCY.observe(elapsed, endpoint=endpoint, method=method, status=response.status_code)
+        SQL_STATEMENTS.observe(state.sql_count, endpoint=endpoint)
+        SQL_TIME.observe(state.sql_time, endpoint=endpoint)
+        if not response.is_streamed:
+            RESPONSE_SIZE.observe(response.calculate_content_length() or 0, endpoint=endpoint)
+
+    after_body(response, observe)
+    return response
+
+
+def render():
+    lines = []
+    for metric in REGISTRY:
+        lines.extend(metric.render())
+    return '\n'.join(lines) + '\n'
+
+
+def init_app(app):
+    from app.extensions import db
+    with app.app_context():
+        engine = db.engine
+    timer = app.extensions['statement_timer'] = StatementTimer()
+    event.listen(engine, 'before_cursor_execute', timer.before_cursor_execute)
+    event.listen(engine, 'after_cursor_execute', timer.after_cursor_execute)
+    event.listen(engine, 'handle_error', timer.handle_error)
+    app.before_request(start_request)
+    app.after_request(finish_request)
+
+    @app.route('/metrics')
+    def metrics_endpoint():
+        """Prometheus scrape endpoint"""
+        return Response(render(), mimetype='text/plain; version=0.0.4')
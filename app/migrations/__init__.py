@@ -0,0 +1,124 @@
+"""Versioned schema migrations.
+
+Every module in this package named ``vNNNN_<description>.py`` defines
+``upgrade(conn)``. Applied versions are recorded in ``schema_version``.
+Migrations run once per deploy (``flask --app run db-upgrade``, see
+08-migrate-job.yaml); the app itself never issues DDL on startup.
+
+A module that sets ``TRANSACTIONAL = False`` runs in autocommit mode, for
+statements Postgres refuses inside a transaction such as CREATE INDEX
+CONCURRENTLY. It is recorded once it has finished, so it must be safe to run
+again after an interruption.
+"""
+import importlib
+import itertools
+import pkgutil
+from datetime import datetime
+from sqlalchemy import text, inspect
+from app.database import lift_statement_timeout
+
+VERSION_TABLE = 'schema_version'
+
+# Arbitrary key for pg_advisory_lock so concurrent upgrades queue up. The lock is held by the
+# session, so migrate over a direct connection rather than through a transaction-pooling PgBouncer.
+LOCK_KEY = 7268031
+
+
+def available():
+    """All migrations in this package as (version, name, module), oldest first"""
+    found = []
+    for info in pkgutil.iter_modules(__path__):
+        if info.name.startswith('v') and info.name[1:5].isdigit():
+            module = importlib.import_module(f'{__name__}.{info.name}')
+            found.append((int(info.name[1:5]), info.name[6:], module))
+    return sorted(found, key=lambda migration: migration[0])
+
+
+def head():
+    """Version of the newest migration shipped with the code"""
+    migrations = available()
+    return migrations[-1][0] if migrations else 0
+
+
+def current_version(conn):
+    """Newest applied version, or 0 for an unmanaged database"""
+    if not inspect(conn).has_table(VERSION_TABLE):
+        return 0
+    return conn.execute(text(f'SELECT MAX(version) FROM {VERSION_TABLE}')).scalar() or 0
+
+
+def upgrade(engine, target=None, log=print):
+    """Apply pending migrations up to target (default: all).
+
+    Consecutive transactional migrations share one transaction; each
+    TRANSACTIONAL = False one commits what came before and runs on its own.
+    """
+    with engine.connect() as conn:
+        postgres = conn.dialect.name == 'postgresql'
+        if postgres:
+            conn.execute(text('SELECT pg_advisory_lock(:key)'), {'key': LOCK_KEY})
+            conn.commit()
+        try:
+            with conn.begin():
+                lift_statement_timeout(conn)
+                conn.execute(text(
+                    f'CREATE TABLE IF NOT EXISTS {VERSION_TABLE} '
+                    '(version INTEGER PRIMARY KEY, name VARCHAR(100) NOT NULL, applied_at TIMESTAMP NOT NULL)'
+                ))
+                current = current_version(conn)
+            pending = [migration for migration in available()
+                       if migration[0] > current and (target is None or migration[0] <= target)]
+            for transactional, group in itertools.groupby(
+                    pending, key=lambda migration: getattr(migration[2], 'TRANSACTIONAL', True)):
+                if transactional:
+                    with conn.begin():
+                        lift_statement_timeout(conn)
+                        for version, name, module in group:
+                            apply(conn, version, name, module, log)
+                else:
+                    for version, name, module in group:
+                        apply_outside_transaction(conn, version, name, module, log)
+            with conn.begin():
+                return current_version(conn)
+        finally:
+            if postgres:
+                conn.execute(text('SELECT pg_advisory_unlock(:key)'), {'key': LOCK_KEY})
+                conn.commit()
+
+
+def apply(conn, version, name, module, log):
+    log(f'Applying migration {version:04d} {name}...')
+    module.upgrade(conn)
+    record(conn, version, name)
+
+
+def apply_outside_transaction(conn, version, name, module, log):
+    log(f'Applying migration {version:04d} {name} outside a transaction...')
+    isolation_level = conn.get_isolation_level()
+    conn.execution_options(isolation_level='AUTOCOMMIT')
+    postgres = conn.dialect.name == 'postgresql'
+    try:
+        if postgres:
+            # SET LOCAL has no transaction to live in here
+            conn.exec_driver_sql('SET statement_timeout = 0')
+        module.upgrade(conn)
+    finally:
+        if postgres:
+            conn.exec_driver_sql('RESET statement_timeout')
+        # Ends SQLAlchemy's bookkeeping transaction; every statement is already committed
+        conn.commit()
+        conn.execution_options(isolation_level=isolation_level)
+    with conn.begin():
+        record(conn, version, name)
+
+
+def record(conn, version, name):
+    conn.execute(
+        text(f'INSERT INTO {VERSION_TABLE} (version, name, applied_at) VALUES (:v, :n, :t)'),
+        {'v': version, 'n': name, 't': datetime.utcnow()}
+    )
+
+
+def drop_version_table(engine):
+    with engine.begin() as conn:
+        conn.execute(text(f'DROP TABLE IF EXISTS {VERSION_TABLE}'))
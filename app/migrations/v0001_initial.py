@@ -0,0 +1,96 @@
+"""Initial schema, frozen as of the first managed release.
+
+Uses checkfirst, so databases created by the old db.create_all() on startup
+adopt version 1 without changes.
+"""
+from sqlalchemy import (
+    MetaData, Table, Column, Integer, String, Float, Text, DateTime, ForeignKey
+)
+
+metadata = MetaData()
+
+Table('users', metadata,
+    Column('id', Integer, primary_key=True),
+    Column('username', String(80), unique=True, nullable=False),
+    Column('email', String(120), unique=True, nullable=False),
+    Column('password_hash', String(255), nullable=False),
+    Column('role', String(20), nullable=False),
+    Column('created_at', DateTime)
+)
+
+Table('categories', metadata,
+    Column('id', Integer, primary_key=True),
+    Column('name', String(50), unique=True, nullable=False),
+    Column('description', Text)
+)
+
+Table('brands', metadata,
+    Column('id', Integer, primary_key=True),
+    Column('name', String(50), unique=True, nullable=False),
+    Column('description', Text)
+)
+
+Table('sizes', metadata,
+    Column('id', Integer, primary_key=True),
+    Column('name', String(10), unique=True, nullable=False)
+)
+
+Table('colors', metadata,
+    Column('id', Integer, primary_key=True),
+    Column('name', String(30), unique=True, nullable=False),
+    Column('hex_code', String(7))
+)
+
+Table('products', metadata,
+    Column('id', Integer, primary_key=True),
+    Column('name', String(100), nullable=False),
+    Column('description', Text),
+    Column('price', Float, nullable=False),
+    Column('discount_percentage', Float),
+    Column('gender', String(20), nullable=False),
+    Column('initial_quantity', Integer, nullable=False),
+    Column('category_id', Integer, ForeignKey('categories.id'), nullable=False),
+    Column('brand_id', Integer, ForeignKey('brands.id'), nullable=False),
+    Column('created_at', DateTime),
+    Column('updated_at', DateTime)
+)
+
+Table('product_sizes', metadata,
+    Column('product_id', Integer, ForeignKey('products.id'), primary_key=True),
+    Column('size_id', Integer, ForeignKey('sizes.id'), primary_key=True)
+)
+
+Table('product_colors', metadata,
+    Column('product_id', Integer, ForeignKey('products.id'), primary_key=True),
+    Column('color_id', Integer, ForeignKey('colors.id'), primary_key=True)
+)
+
+Table('clients', metadata,
+    Column('id', Integer, primary_key=True),
+    Column('name', String(100), nullable=False),
+    Column('email', String(120), unique=True, nullable=False),
+    Column('phone', String(20)),
+    Column('address', Text),
+    Column('created_at', DateTime)
+)
+
+Table('orders', metadata,
+    Column('id', Integer, primary_key=True),
+    Column('client_id', Integer, ForeignKey('clients.id'), nullable=False),
+    Column('status', String(20), nullable=False),
+    Column('total_amount', Float, nullable=False),
+    Column('created_at', DateTime),
+    Column('updated_at', DateTime)
+)
+
+Table('order_items', metadata,
+    Column('id', Integer, primary_key=True),
+    Column('order_id', Integer, ForeignKey('orders.id'), nullable=False),
+    Column('product_id', Integer, ForeignKey('products.id'), nullable=False),
+    Column('quantity', Integer, nullable=False),
+    Column('price_at_purchase', Float, nullable=False)
+)
+
+
+def upgrade(conn):
+    metadata.create_all(conn, checkfirst=True)
@@ -0,0 +1,52 @@
+"""Secondary indexes derived from the queries the routes actually issue.
+
+- orders (status, created_at): report filters and the status summary
+- orders (created_at) WHERE status is a sold status: earnings reports
+- orders (client_id): orders by client
+- order_items (product_id, order_id) INCLUDE (quantity, price_at_purchase):
+  stock sums and top-selling/category/brand aggregates without heap visits
+- order_items (order_id): loading an order's items
+- products (category_id), (brand_id): sales by category/brand, search joins
+- product_sizes (size_id, product_id), product_colors (color_id, product_id):
+  the reverse direction of the primary keys, for size/color search filters
+
+On Postgres the indexes are built CONCURRENTLY, so the tables stay writable,
+which means running outside a transaction. A build that was interrupted
+leaves an invalid index behind; it is dropped and built again.
+"""
+
+TRANSACTIONAL = False
+
+SOLD_STATUSES = "status IN ('confirmed', 'shipped', 'delivered')"
+
+# (name, table, columns, include, where)
+INDEXES = [
+    ('ix_orders_status_created_at', 'orders', '(status, created_at)', None, None),
+    ('ix_orders_sold_created_at', 'orders', '(created_at)', None, SOLD_STATUSES),
+    ('ix_orders_client_id', 'orders', '(client_id)', None, None),
+    ('ix_order_items_product_order', 'order_items', '(product_id, order_id)',
+     '(quantity, price_at_purchase)', None),
+    ('ix_order_items_order_id', 'order_items', '(order_id)', None, None),
+    ('ix_products_category_id', 'products', '(category_id)', None, None),
+    ('ix_products_brand_id', 'products', '(brand_id)', None, None),
+    ('ix_product_sizes_size_product', 'product_sizes', '(size_id, product_id)', None, None),
+    ('ix_product_colors_color_product', 'product_colors', '(color_id, product_id)', None, None),
+]
+
+
+def upgrade(conn):
+    postgres = conn.dialect.name == 'postgresql'
+    for name, table, columns, include, where in INDEXES:
+        if postgres and conn.exec_driver_sql(
+                'SELECT NOT indisvalid FROM pg_index WHERE indexrelid = to_regclass(%(name)s)',
+                {'name': name}).scalar():
+            conn.exec_driver_sql(f'DROP INDEX CONCURRENTLY {name}')
+        concurrently = ' CONCURRENTLY' if postgres else ''
+        sql = f'CREATE INDEX{concurrently} IF NOT EXISTS {name} ON {table} {columns}'
+        if include and postgres:
+            sql += f' INCLUDE {include}'
+        if where:
+            sql += f' WHERE {where}'
+        conn.exec_driver_sql(sql)
+    if postgres:
+        conn.exec_driver_sql('ANALYZE orders, order_items, products, product_sizes, product_colors')
@@ -0,0 +1,15 @@
+"""Product read model: one serialized document per product.
+
+Documents are written by the application (app/readmodel.py); this migration
+only creates the table. flask db-upgrade fills in documents for existing
+products afterwards.
+"""
+
+
+def upgrade(conn):
+    conn.exec_driver_sql(
+        'CREATE TABLE IF NOT EXISTS product_documents ('
+        'product_id INTEGER PRIMARY KEY REFERENCES products (id) ON DELETE CASCADE, '
+        'document TEXT NOT NULL, '
+        'updated_at TIMESTAMP NOT NULL)'
+    )
@@ -0,0 +1,21 @@
+"""Transactional outbox behind /api/changes.
+
+Rows are written by the application (app/outbox.py) in the transaction that
+made the change; flask prune-outbox deletes old ones.
+"""
+
+
+def upgrade(conn):
+    id_column = 'id SERIAL PRIMARY KEY' if conn.dialect.name == 'postgresql' else 'id INTEGER PRIMARY KEY'
+    conn.exec_driver_sql(
+        'CREATE TABLE IF NOT EXISTS outbox_events ('
+        f'{id_column}, '
+        'entity VARCHAR(20) NOT NULL, '
+        'entity_id INTEGER NOT NULL, '
+        'action VARCHAR(10) NOT NULL, '
+        'data TEXT, '
+        'created_at TIMESTAMP NOT NULL)'
+    )
+    conn.exec_driver_sql(
+        'CREATE INDEX IF NOT EXISTS ix_outbox_events_created_at ON outbox_events (created_at)'
+    )
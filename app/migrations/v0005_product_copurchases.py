@@ -0,0 +1,20 @@
+"""Co-purchase counts behind /api/products/<id>/related.
+
+Counts are written by the application (app/copurchase.py); this migration
+only creates the table. flask db-upgrade builds them from the order history
+afterwards.
+"""
+
+
+def upgrade(conn):
+    conn.exec_driver_sql(
+        'CREATE TABLE IF NOT EXISTS product_copurchases ('
+        'product_id INTEGER NOT NULL REFERENCES products (id) ON DELETE CASCADE, '
+        'related_product_id INTEGER NOT NULL REFERENCES products (id) ON DELETE CASCADE, '
+        'orders INTEGER NOT NULL, '
+        'PRIMARY KEY (product_id, related_product_id))'
+    )
+    conn.exec_driver_sql(
+        'CREATE INDEX IF NOT EXISTS ix_product_copurchases_top '
+        'ON product_copurchases (product_id, orders, related_product_id)'
+    )
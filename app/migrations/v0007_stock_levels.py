@@ -0,0 +1,27 @@
+"""Reorder thresholds and the stock levels behind /api/products/low-stock.
+
+- products.reorder_threshold: see app/lowstock.py
+- stock_levels: each product's stock and margin over its threshold, with a
+  partial index over the products at or below it
+
+Stock levels are written by the application; flask db-upgrade builds them
+afterwards. Product documents gain reorder_threshold, so they are dropped
+here for db-upgrade to rebuild.
+"""
+
+
+def upgrade(conn):
+    conn.exec_driver_sql(
+        'ALTER TABLE products ADD COLUMN reorder_threshold INTEGER NOT NULL DEFAULT 0'
+    )
+    conn.exec_driver_sql(
+        'CREATE TABLE IF NOT EXISTS stock_levels ('
+        'product_id INTEGER NOT NULL PRIMARY KEY REFERENCES products (id) ON DELETE CASCADE, '
+        'available INTEGER NOT NULL, '
+        'margin INTEGER NOT NULL)'
+    )
+    conn.exec_driver_sql(
+        'CREATE INDEX IF NOT EXISTS ix_stock_levels_low '
+        'ON stock_levels (margin, product_id) WHERE margin <= 0'
+    )
+    conn.exec_driver_sql('DELETE FROM product_documents')
@@ -0,0 +1,16 @@
+"""Revoked JWT ids, shared by every worker and replica (app/denylist.py).
+
+Rows are written on refresh and logout; flask prune-revoked-tokens, run daily
+by 09-prune-revoked-tokens-cronjob.yaml, deletes the expired ones.
+"""
+
+
+def upgrade(conn):
+    conn.exec_driver_sql(
+        'CREATE TABLE IF NOT EXISTS revoked_tokens ('
+        'jti VARCHAR(64) NOT NULL PRIMARY KEY, '
+        'exp INTEGER NOT NULL)'
+    )
+    conn.exec_driver_sql(
+        'CREATE INDEX IF NOT EXISTS ix_revoked_tokens_exp ON revoked_tokens (exp)'
+    )
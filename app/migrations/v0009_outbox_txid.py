@@ -0,0 +1,17 @@
+"""Commit-ordered /api/changes cursors without a writers' lock.
+
+- outbox_events.txid: the writing transaction's id on Postgres, 0 elsewhere;
+  rows written before this release keep 0 and stay ordered by id
+- ix_outbox_events_txid: (txid, id), the order the feed reads in
+
+See app/outbox.py.
+"""
+
+
+def upgrade(conn):
+    conn.exec_driver_sql('ALTER TABLE outbox_events ADD COLUMN txid BIGINT NOT NULL DEFAULT 0')
+    if conn.dialect.name == 'postgresql':
+        conn.exec_driver_sql('ALTER TABLE outbox_events ALTER COLUMN txid SET DEFAULT txid_current()')
+    conn.exec_driver_sql(
+        'CREATE INDEX IF NOT EXISTS ix_outbox_events_txid ON outbox_events (txid, id)'
+    )
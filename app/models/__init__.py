@@ -1,4 +1,5 @@
 from app.models.models import (
     User, Category, Brand, Size, Color, 
-    Product, Client, Order, OrderItem
+    Product, ProductDocument, ProductCopurchase, StockLevel, RevokedToken, OutboxEvent, OrderArchive,
+    DailyOrderRollup, MonthlyProductRollup, Client, Order, OrderItem
 )
\ No newline at end of file
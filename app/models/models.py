@@ -1,21 +1,27 @@
+import json
 from datetime import datetime
-from werkzeug.security import generate_password_hash, check_password_hash
-from sqlalchemy import Column, Integer, String, Float, Text, DateTime, ForeignKey, Table
-from sqlalchemy.orm import relationship
+from sqlalchemy import Column, BigInteger, Integer, String, Float, Text, Date, DateTime, ForeignKey, Table, Index, text
+from sqlalchemy.orm import relationship, joinedload, selectinload
 from flask_sqlalchemy import SQLAlchemy
 
 # This will be initialized in __init__.py
 from app.extensions import db
+from app.passwords import hash_password, verify_password, needs_rehash
+
+# Matches the sold-status filter used by stock checks and reports
+_sold_predicate = text("status IN ('confirmed', 'shipped', 'delivered')")
 
 # Association tables for many-to-many relationships
 product_sizes = Table('product_sizes', db.Model.metadata,
     Column('product_id', Integer, ForeignKey('products.id'), primary_key=True),
-    Column('size_id', Integer, ForeignKey('sizes.id'), primary_key=True)
+    Column('size_id', Integer, ForeignKey('sizes.id'), primary_key=True),
+    Index('ix_product_sizes_size_product', 'size_id', 'product_id')
 )
 
 product_colors = Table('product_colors', db.Model.metadata,
     Column('product_id', Integer, ForeignKey('products.id'), primary_key=True),
-    Column('color_id', Integer, ForeignKey('colors.id'), primary_key=True)
+    Column('color_id', Integer, ForeignKey('colors.id'), primary_key=True),
+    Index('ix_product_colors_color_product', 'color_id', 'product_id')
 )
 
 class User(db.Model):
@@ -29,10 +35,13 @@ class User(db.Model):
     created_at = Column(DateTime, default=datetime.utcnow)
     
     def set_password(self, password):
-        self.password_hash = generate_password_hash(password)
+        self.password_hash = hash_password(password)
     
     def check_password(self, password):
-        return check_password_hash(self.password_hash, password)
+        return verify_password(self.password_hash, password)
+    
+    def password_needs_rehash(self):
+        return needs_rehash(self.password_hash)
     
     def to_dict(self):
         return {
@@ -101,6 +110,10 @@ class Color(db.Model):
 
 class Product(db.Model):
     __tablename__ = 'products'
+    __table_args__ = (
+        Index('ix_products_category_id', 'category_id'),
+        Index('ix_products_brand_id', 'brand_id'),
+    )
     
     id = Column(Integer, primary_key=True)
     name = Column(String(100), nullable=False)
@@ -109,6 +122,10 @@ class Product(db.Model):
     discount_percentage = Column(Float, default=0.0)
     gender = Column(String(20), nullable=False)
     initial_quantity = Column(Integer, nullable=False, default=0)
+    # Units sold by orders since archived (app/partitions.py), which stock still counts
+    archived_sold_quantity = Column(Integer, nullable=False, default=0, server_default='0')
+    # At or below this many units the product is on the low-stock watchlist (app/lowstock.py)
+    reorder_threshold = Column(Integer, nullable=False, default=0, server_default='0')
     category_id = Column(Integer, ForeignKey('categories.id'), nullable=False)
     brand_id = Column(Integer, ForeignKey('brands.id'), nullable=False)
     created_at = Column(DateTime, default=datetime.utcnow)
@@ -129,13 +146,38 @@ class Product(db.Model):
         """Calculate current quantity by subtracting sold items"""
         from sqlalchemy import func
         sold_quantity = db.session.query(func.sum(OrderItem.quantity))\
-            .join(Order)\
+            .select_from(Order).join(Order.items)\
             .filter(OrderItem.product_id == self.id)\
             .filter(Order.status.in_(['confirmed', 'shipped', 'delivered']))\
             .scalar() or 0
-        return self.initial_quantity - sold_quantity
+        return self.initial_quantity - self.archived_sold_quantity - sold_quantity
+    
+    @staticmethod
+    def current_quantities(products):
+        """Current quantity for many products with a single query, keyed by product id"""
+        from sqlalchemy import func
+        products = list(products)
+        if not products:
+            return {}
+        sold = dict(
+            db.session.query(OrderItem.product_id, func.sum(OrderItem.quantity))
+            .select_from(Order).join(Order.items)
+            .filter(OrderItem.product_id.in_([product.id for product in products]))
+            .filter(Order.status.in_(['confirmed', 'shipped', 'delivered']))
+            .group_by(OrderItem.product_id)
+            .all()
+        )
+        return {
+            product.id: product.initial_quantity - product.archived_sold_quantity - (sold.get(product.id) or 0)
+            for product in products
+        }
     
-    def to_dict(self, include_quantity=False):
+    @staticmethod
+    def eager_options():
+        """Loader options for serializing products without per-row queries"""
+        return (joinedload(Product.category), joinedload(Product.brand))
+    
+    def to_dict(self, include_quantity=False, current_quantity=None):
         data = {
             'id': self.id,
             'name': self.name,
@@ -145,6 +187,7 @@ class Product(db.Model):
             'discounted_price': self.get_discounted_price(),
             'gender': self.gender,
             'initial_quantity': self.initial_quantity,
+            'reorder_threshold': self.reorder_threshold,
             'category': self.category.to_dict() if self.category else None,
             'brand': self.brand.to_dict() if self.brand else None,
             'sizes': [size.to_dict() for size in self.sizes],
@@ -153,10 +196,110 @@ class Product(db.Model):
             'updated_at': self.updated_at.isoformat()
         }
         if include_quantity:
-            data['current_quantity'] = self.get_current_quantity()
-            data['in_stock'] = self.get_current_quantity() > 0
+            if current_quantity is None:
+                current_quantity = self.get_current_quantity()
+            data['current_quantity'] = current_quantity
+            data['in_stock'] = current_quantity > 0
         return data
 
+class ProductDocument(db.Model):
+    """Serialized Product.to_dict(), kept current by app/readmodel.py"""
+    __tablename__ = 'product_documents'
+    
+    product_id = Column(Integer, ForeignKey('products.id', ondelete='CASCADE'), primary_key=True)
+    document = Column(Text, nullable=False)
+    updated_at = Column(DateTime, nullable=False, default=datetime.utcnow)
+
+class ProductCopurchase(db.Model):
+    """How many sold orders had both products, kept current by app/copurchase.py"""
+    __tablename__ = 'product_copurchases'
+    __table_args__ = (
+        # Covers "top related products" with a backward scan of one product's range
+        Index('ix_product_copurchases_top', 'product_id', 'orders', 'related_product_id'),
+    )
+    
+    product_id = Column(Integer, ForeignKey('products.id', ondelete='CASCADE'), primary_key=True)
+    related_product_id = Column(Integer, ForeignKey('products.id', ondelete='CASCADE'), primary_key=True)
+    orders = Column(Integer, nullable=False)
+
+class StockLevel(db.Model):
+    """A product's current stock and its margin over the reorder threshold, kept current by app/lowstock.py"""
+    __tablename__ = 'stock_levels'
+    __table_args__ = (
+        # Only the products at or below their threshold, most short first
+        Index('ix_stock_levels_low', 'margin', 'product_id',
+              postgresql_where=text('margin <= 0'), sqlite_where=text('margin <= 0')),
+    )
+    
+    product_id = Column(Integer, ForeignKey('products.id', ondelete='CASCADE'), primary_key=True)
+    available = Column(Integer, nullable=False)
+    # available - reorder_threshold
+    margin = Column(Integer, nullable=False)
+
+class RevokedToken(db.Model):
+    """A revoked JWT id, kept until the token's own expiry (app/denylist.py)"""
+    __tablename__ = 'revoked_tokens'
+    
+    jti = Column(String(64), primary_key=True)
+    # The token's exp claim, in seconds since the epoch
+    exp = Column(Integer, nullable=False, index=True)
+
+class OutboxEvent(db.Model):
+    """A committed product or order change, for the /api/changes feed (app/outbox.py)"""
+    __tablename__ = 'outbox_events'
+    __table_args__ = (
+        Index('ix_outbox_events_txid', 'txid', 'id'),
+    )
+    
+    id = Column(Integer, primary_key=True)
+    entity = Column(String(20), nullable=False)
+    entity_id = Column(Integer, nullable=False)
+    action = Column(String(10), nullable=False)
+    data = Column(Text)
+    created_at = Column(DateTime, nullable=False, default=datetime.utcnow, index=True)
+    # Writing transaction's id on Postgres, where v0009 makes txid_current() the default
+    txid = Column(BigInteger, nullable=False, server_default='0')
+    
+    def to_dict(self):
+        event = {
+            'cursor': self.id,
+            'entity': self.entity,
+            'id': self.entity_id,
+            'action': self.action,
+            'at': self.created_at.isoformat(),
+        }
+        if self.data:
+            event.update(json.loads(self.data))
+        return event
+
+class OrderArchive(db.Model):
+    """A month of orders moved out of the live tables by app/partitions.py"""
+    __tablename__ = 'order_archives'
+    
+    month = Column(Date, primary_key=True)
+    orders = Column(Integer, nullable=False)
+    items = Column(Integer, nullable=False)
+    path = Column(String(255))
+    archived_at = Column(DateTime, nullable=False, default=datetime.utcnow)
+
+class DailyOrderRollup(db.Model):
+    """Orders of an archived day per status, for the reports"""
+    __tablename__ = 'daily_order_rollups'
+    
+    day = Column(Date, primary_key=True)
+    status = Column(String(20), primary_key=True)
+    orders = Column(Integer, nullable=False)
+    total_amount = Column(Float, nullable=False)
+
+class MonthlyProductRollup(db.Model):
+    """Units and revenue sold per product in an archived month, for the reports"""
+    __tablename__ = 'monthly_product_rollups'
+    
+    month = Column(Date, primary_key=True)
+    product_id = Column(Integer, ForeignKey('products.id', ondelete='CASCADE'), primary_key=True)
+    quantity = Column(Integer, nullable=False)
+    revenue = Column(Float, nullable=False)
+
 class Client(db.Model):
     __tablename__ = 'clients'
     
@@ -181,15 +324,35 @@ class Client(db.Model):
 
 class Order(db.Model):
     __tablename__ = 'orders'
+    __table_args__ = (
+        Index('ix_orders_status_created_at', 'status', 'created_at'),
+        Index('ix_orders_sold_created_at', 'created_at',
+              postgresql_where=_sold_predicate, sqlite_where=_sold_predicate),
+        Index('ix_orders_client_id', 'client_id'),
+    )
     
     id = Column(Integer, primary_key=True)
     client_id = Column(Integer, ForeignKey('clients.id'), nullable=False)
     status = Column(String(20), nullable=False, default='pending')
     total_amount = Column(Float, nullable=False)
-    created_at = Column(DateTime, default=datetime.utcnow)
+    # The partition key on Postgres (app/partitions.py), copied onto every item
+    created_at = Column(DateTime, nullable=False, default=datetime.utcnow)
     updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     
-    items = relationship('OrderItem', backref='order', lazy=True, cascade='all, delete-orphan')
+    # Also joined on the partition key: items added here get their order's
+    # created_at, and Postgres joins queries through it partition by partition
+    items = relationship('OrderItem', back_populates='order', lazy=True, cascade='all, delete-orphan',
+                         primaryjoin='and_(Order.id == foreign(OrderItem.order_id), '
+                                     'Order.created_at == foreign(OrderItem.order_created_at))')
+    
+    @staticmethod
+    def eager_options(include_items=True):
+        """Loader options for serializing orders without per-row queries"""
+        options = [joinedload(Order.client)]
+        if include_items:
+            product = selectinload(Order.items).joinedload(OrderItem.product)
+            options += [product.joinedload(Product.category), product.joinedload(Product.brand)]
+        return options
     
     def to_dict(self, include_items=True):
         data = {
@@ -206,13 +369,22 @@ class Order(db.Model):
 
 class OrderItem(db.Model):
     __tablename__ = 'order_items'
+    __table_args__ = (
+        Index('ix_order_items_product_order', 'product_id', 'order_id',
+              postgresql_include=['quantity', 'price_at_purchase']),
+        Index('ix_order_items_order_id', 'order_id'),
+    )
     
     id = Column(Integer, primary_key=True)
     order_id = Column(Integer, ForeignKey('orders.id'), nullable=False)
+    # Its order's created_at, so items are partitioned alongside their order
+    order_created_at = Column(DateTime, nullable=False)
     product_id = Column(Integer, ForeignKey('products.id'), nullable=False)
     quantity = Column(Integer, nullable=False)
     price_at_purchase = Column(Float, nullable=False)
     
+    # By id alone, so an item's order comes from the identity map
+    order = relationship('Order', back_populates='items')
     product = relationship('Product', backref='order_items')
     
     def to_dict(self):
@@ -0,0 +1,172 @@
+"""Transactional outbox behind the /api/changes feed.
+
+Flushes that create, change or delete a product or an order are recorded,
+and right before the transaction commits one outbox_events row per changed
+entity is inserted in that same transaction, so the feed holds exactly the
+committed changes. Events are thin (entity, id, action, changed fields and,
+for orders, the status); consumers fetch the entities they need. Other
+modules add events of their own with notify() (app/lowstock.py, for one),
+from before_commit listeners that run ahead of write().
+
+Writers never wait on each other. On Postgres every event carries the id of
+the transaction that wrote it (txid, a column default), and the feed reads
+in (txid, id) order, only up to the oldest transaction still running when
+its snapshot was taken: every transaction before that one has committed or
+rolled back, and any event still to come gets a later txid. So a cursor, the
+id of the last event read, never skips an event that commits later. A long
+transaction holds the feed back until it ends. SQLite serializes writers,
+so txid stays 0 and ids are already in commit order.
+
+Commits are announced through app/invalidation.py, which wakes waiting
+long-polls in every worker and, on Postgres, every replica.
+"""
+import json
+import threading
+from datetime import datetime, timedelta
+from flask import current_app
+from sqlalchemy import delete, event, func, insert, inspect, select, tuple_
+from app import invalidation, readmodel
+from app.extensions import db
+from app.models import Product, Order, OutboxEvent
+
+# Collections that other writes fill through backrefs; not a change of the entity itself
+IGNORED = {Product: ('order_items',), Order: ('items',)}
+ENTITIES = {Product: 'product', Order: 'order'}
+
+
+class Feed:
+    """How many commits with events were announced to this process, for long-polls to wait on"""
+
+    def __init__(self, max_waiters):
+        self.announced = 0
+        self.waiters = 0
+        self.max_waiters = max_waiters
+        self.condition = threading.Condition()
+
+    def advance(self, change):
+        with self.condition:
+            self.announced += 1
+            self.condition.notify_all()
+
+    def wait(self, announced, timeout):
+        """Block until more than announced commits are announced or timeout passes; False if too many are waiting"""
+        with self.condition:
+            if self.waiters >= self.max_waiters:
+                return False
+            self.waiters += 1
+            try:
+                self.condition.wait_for(lambda: self.announced != announced, timeout)
+            finally:
+                self.waiters -= 1
+        return True
+
+
+def collect(session, flush_context):
+    """Remember which products and orders this flush changed"""
+    pending = session.info.setdefault('outbox', {})
+    for obj in session.new:
+        if type(obj) in ENTITIES:
+            pending[(ENTITIES[type(obj)], obj.id)] = {'action': 'created', 'fields': set(), 'obj': obj}
+    for obj in session.dirty:
+        if type(obj) in ENTITIES and readmodel.changed(obj, IGNORED[type(obj)]):
+            entry = pending.setdefault((ENTITIES[type(obj)], obj.id),
+                                       {'action': 'updated', 'fields': set(), 'obj': obj})
+            entry['fields'].update(attr.key for attr in inspect(obj).attrs
+                                   if attr.key not in IGNORED[type(obj)] and attr.history.has_changes())
+    for obj in session.deleted:
+        if type(obj) in ENTITIES:
+            key = (ENTITIES[type(obj)], obj.id)
+            if pending.get(key, {}).get('action') == 'created':
+                # Never committed, so never seen by a consumer
+                del pending[key]
+            else:
+                pending[key] = {'action': 'deleted', 'fields': set(), 'obj': None}
+
+
+def event_row(entity, entity_id, entry, now):
+    data = {}
+    if entry['action'] == 'updated':
+        data['fields'] = sorted(entry['fields'])
+    if entity == 'order' and entry['obj'] is not None:
+        data['status'] = entry['obj'].status
+    return {'entity': entity, 'entity_id': entity_id, 'action': entry['action'],
+            'data': json.dumps(data, separators=(',', ':')) if data else None, 'created_at': now}
+
+
+def notify(session, entity, entity_id, action, data=None):
+    """Add an event of the caller's own to the transaction's"""
+    session.info.setdefault('outbox_notices', []).append({
+        'entity': entity, 'entity_id': entity_id, 'action': action,
+        'data': json.dumps(data, separators=(',', ':')) if data else None,
+    })
+
+
+def write(session):
+    """Insert the transaction's events just before it commits"""
+    session.flush()
+    pending = session.info.pop('outbox', None) or {}
+    notices = session.info.pop('outbox_notices', None) or []
+    if not pending and not notices:
+        return
+    now = datetime.utcnow()
+    rows = [event_row(entity, entity_id, entry, now) for (entity, entity_id), entry in sorted(pending.items())]
+    rows += [dict(notice, created_at=now) for notice in notices]
+    # NULL data rendered rather than omitted, so rows with and without it share one INSERT
+    ids = session.scalars(insert(OutboxEvent).returning(OutboxEvent.id).execution_options(render_nulls=True),
+                          rows).all()
+    invalidation.announce(session, 'outbox', ids)
+
+
+def discard(session, *args):
+    session.info.pop('outbox', None)
+    session.info.pop('outbox_notices', None)
+
+
+def readable(query):
+    """Limit query to the events of transactions older than every one still running"""
+    if db.session.get_bind().dialect.name != 'postgresql':
+        return query
+    return query.where(OutboxEvent.txid < func.txid_snapshot_xmin(func.txid_current_snapshot()))
+
+
+def latest_cursor():
+    """Cursor of the newest readable event; reading from it skips nothing still to come"""
+    return db.session.scalar(
+        readable(select(OutboxEvent.id)).order_by(OutboxEvent.txid.desc(), OutboxEvent.id.desc()).limit(1)
+    ) or 0
+
+
+def events_after(since, limit):
+    # A cursor whose event was pruned reads from the start of what is left
+    since_txid = select(OutboxEvent.txid).where(OutboxEvent.id == since).scalar_subquery()
+    return db.session.scalars(
+        readable(select(OutboxEvent))
+        .where(tuple_(OutboxEvent.txid, OutboxEvent.id) > tuple_(func.coalesce(since_txid, 0), since))
+        .order_by(OutboxEvent.txid, OutboxEvent.id)
+        .limit(limit)
+    ).all()
+
+
+def prune(days):
+    """Delete events older than days; returns how many were deleted"""
+    result = db.session.execute(
+        delete(OutboxEvent).where(OutboxEvent.created_at < datetime.utcnow() - timedelta(days=days))
+    )
+    db.session.commit()
+    return result.rowcount
+
+
+def get_feed():
+    return current_app.extensions['outbox']
+
+
+def init_app(app):
+    feed = app.extensions['outbox'] = Feed(app.config['OUTBOX_MAX_WAITERS'])
+    invalidation.subscribe(app, 'outbox', feed.advance)
+    session_class = db.session.session_factory.class_
+    for name, listener in [('after_flush', collect), ('after_commit', discard), ('after_rollback', discard)]:
+        if not event.contains(session_class, name, listener):
+            event.listen(session_class, name, listener)
+    # Ahead of invalidation.publish, which sends the ids write() announces
+    if not event.contains(session_class, 'before_commit', write):
+        event.listen(session_class, 'before_commit', write, insert=True)
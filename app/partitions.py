@@ -0,0 +1,242 @@
+"""Monthly partitions of orders and order_items, and archival of old months.
+
+On Postgres both tables are range partitioned by month: orders by created_at,
+order_items by order_created_at, the order's created_at copied onto each of
+its items. An order and its items always share a month, so queries joining
+them on both columns are joined partition by partition, and a created_at
+filter only scans the months it covers. Rows for a month without partitions
+go to the DEFAULT partitions; create_partition() moves them out when it
+creates the month, and flask maintain-partitions keeps PARTITION_MONTHS_AHEAD
+months created ahead so that seldom happens.
+
+archive_month() retires a month in one transaction:
+
+- its orders per day and status go to daily_order_rollups, and its sold
+  items per product to monthly_product_rollups, which the reports read for
+  archived months
+- the units sold move to products.archived_sold_quantity, so stock is unchanged
+- its orders and their items are written to ORDER_ARCHIVE_DIR as gzipped
+  JSON lines, one order per line
+- its partitions are dropped, or only detached with keep_tables (no file is
+  written then); SQLite has no partitions, so the rows are deleted instead
+- order_archives records the month
+"""
+import gzip
+import json
+import os
+from datetime import date, datetime
+from itertools import groupby
+from sqlalchemy import Date, and_, delete, func, insert, literal, select, update
+from app.database import lift_statement_timeout
+from app.models import Order, OrderItem, Product, OrderArchive, DailyOrderRollup, MonthlyProductRollup
+
+SOLD_STATUSES = ('confirmed', 'shipped', 'delivered')
+
+# (table, partition key), referenced table first
+TABLES = [('orders', 'created_at'), ('order_items', 'order_created_at')]
+
+EXPORT_BATCH_SIZE = 5000
+
+
+def month_of(moment):
+    return date(moment.year, moment.month, 1)
+
+
+def add_months(month, count):
+    index = month.year * 12 + month.month - 1 + count
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def month_range(month):
+    """[start, end) of month as datetimes, for comparing with created_at"""
+    return datetime(month.year, month.month, 1), datetime.combine(add_months(month, 1), datetime.min.time())
+
+
+def partition_name(table, month):
+    return f'{table}_p{month:%Y_%m}'
+
+
+def partitioned_months(conn):
+    """Months that have partitions, oldest first"""
+    names = conn.exec_driver_sql(
+        'SELECT child.relname FROM pg_inherits '
+        'JOIN pg_class child ON child.oid = pg_inherits.inhrelid '
+        "WHERE pg_inherits.inhparent = 'orders'::regclass"
+    ).scalars()
+    return sorted(datetime.strptime(name, 'orders_p%Y_%m').date() for name in names if name != 'orders_default')
+
+
+def create_partition(conn, month):
+    """Create month's partitions of both tables, taking over any of its rows from the default partitions"""
+    start, end = (moment.isoformat(' ') for moment in month_range(month))
+    # Filled while detached; items leave the default partition before the orders they reference
+    for table, key in reversed(TABLES):
+        name = partition_name(table, month)
+        conn.exec_driver_sql(f'CREATE TABLE {name} (LIKE {table} INCLUDING DEFAULTS)')
+        conn.exec_driver_sql(
+            f"WITH moved AS (DELETE FROM {table}_default WHERE {key} >= '{start}' AND {key} < '{end}' RETURNING *) "
+            f'INSERT INTO {name} SELECT * FROM moved'
+        )
+    for table, key in TABLES:
+        conn.exec_driver_sql(
+            f"ALTER TABLE {table} ATTACH PARTITION {partition_name(table, month)} FOR VALUES FROM ('{start}') TO ('{end}')"
+        )
+
+
+def create_upcoming(engine, months_ahead, since=None, log=print):
+    """Create the missing partitions from since (default: this month) to months_ahead months ahead (Postgres only)"""
+    if engine.dialect.name != 'postgresql':
+        return []
+    this_month = month_of(datetime.utcnow())
+    month = month_of(since) if since else this_month
+    created = []
+    with engine.begin() as conn:
+        lift_statement_timeout(conn)
+        existing = set(partitioned_months(conn))
+        while month <= add_months(this_month, months_ahead):
+            if month not in existing:
+                create_partition(conn, month)
+                log(f'Created the {month:%Y-%m} partitions')
+                created.append(month)
+            month = add_months(month, 1)
+    return created
+
+
+def has_archives(conn):
+    return conn.scalar(select(OrderArchive.month).limit(1)) is not None
+
+
+def months_to_archive(conn, before):
+    """Months before `before` with live orders (or, on Postgres, partitions), oldest first"""
+    if conn.dialect.name == 'postgresql':
+        return [month for month in partitioned_months(conn) if month < before]
+    months = []
+    cutoff = month_range(before)[0]
+    oldest = conn.scalar(select(func.min(Order.created_at)).where(Order.created_at < cutoff))
+    while oldest:
+        months.append(month_of(oldest))
+        oldest = conn.scalar(select(func.min(Order.created_at))
+                             .where(Order.created_at >= month_range(months[-1])[1], Order.created_at < cutoff))
+    return months
+
+
+def export(conn, month, path):
+    """Write month's orders with their items to path; returns (orders, items) written"""
+    start, end = month_range(month)
+    rows = conn.execute(
+        select(Order.id, Order.client_id, Order.status, Order.total_amount, Order.created_at, Order.updated_at,
+               OrderItem.id.label('item_id'), OrderItem.product_id, OrderItem.quantity, OrderItem.price_at_purchase)
+        .outerjoin(Order.items)
+        .where(Order.created_at >= start, Order.created_at < end)
+        .order_by(Order.id, OrderItem.id)
+        .execution_options(yield_per=EXPORT_BATCH_SIZE)
+    )
+    orders = items = 0
+    # Renamed into place once complete, so a file under the final name is never partial
+    with gzip.open(path + '.tmp', 'wt', encoding='utf-8') as out:
+        for _, group in groupby(rows, key=lambda row: row.id):
+            group = list(group)
+            order = group[0]
+            record = {
+                'id': order.id,
+                'client_id': order.client_id,
+                'status': order.status,
+                'total_amount': order.total_amount,
+                'created_at': order.created_at.isoformat(),
+                'updated_at': order.updated_at.isoformat() if order.updated_at else None,
+                'items': [
+                    {'id': row.item_id, 'product_id': row.product_id, 'quantity': row.quantity,
+                     'price_at_purchase': row.price_at_purchase}
+                    for row in group if row.item_id is not None
+                ],
+            }
+            out.write(json.dumps(record) + '\n')
+            orders += 1
+            items += len(record['items'])
+    os.replace(path + '.tmp', path)
+    return orders, items
+
+
+def archive_month(conn, month, directory, keep_tables=False):
+    """Move month's orders out of the live tables into the rollups; returns (orders, items) archived"""
+    lift_statement_timeout(conn)
+    start, end = month_range(month)
+    postgres = conn.dialect.name == 'postgresql'
+    orders_table, items_table = partition_name('orders', month), partition_name('order_items', month)
+    if postgres:
+        # A write between the rollups and the drop would be lost
+        conn.exec_driver_sql(f'LOCK TABLE {orders_table}, {items_table} IN SHARE MODE')
+    in_month = and_(Order.created_at >= start, Order.created_at < end)
+
+    day = func.date(Order.created_at)
+    conn.execute(insert(DailyOrderRollup).from_select(
+        ['day', 'status', 'orders', 'total_amount'],
+        select(day, Order.status, func.count(Order.id), func.sum(Order.total_amount))
+        .where(in_month)
+        .group_by(day, Order.status)
+    ))
+    conn.execute(insert(MonthlyProductRollup).from_select(
+        ['month', 'product_id', 'quantity', 'revenue'],
+        select(literal(month, Date), OrderItem.product_id, func.sum(OrderItem.quantity),
+               func.sum(OrderItem.quantity * OrderItem.price_at_purchase))
+        .select_from(Order).join(Order.items)
+        .where(in_month, OrderItem.order_created_at >= start, OrderItem.order_created_at < end,
+               Order.status.in_(SOLD_STATUSES))
+        .group_by(OrderItem.product_id)
+    ))
+    rollup = MonthlyProductRollup
+    conn.execute(
+        update(Product)
+        .where(Product.id.in_(select(rollup.product_id).where(rollup.month == month)))
+        .values(
+            archived_sold_quantity=Product.archived_sold_quantity + select(rollup.quantity)
+            .where(rollup.month == month, rollup.product_id == Product.id)
+            .scalar_subquery(),
+            # Stock is unchanged, so the product is too; keep its stored document current
+            updated_at=Product.updated_at,
+        )
+    )
+
+    if keep_tables:
+        path = None
+        orders = conn.scalar(select(func.count(Order.id)).where(in_month))
+        items = conn.scalar(select(func.count(OrderItem.id))
+                            .where(OrderItem.order_created_at >= start, OrderItem.order_created_at < end))
+    else:
+        path = os.path.join(directory, f'orders-{month:%Y-%m}.jsonl.gz')
+        orders, items = export(conn, month, path)
+
+    if postgres and keep_tables:
+        conn.exec_driver_sql(f'ALTER TABLE order_items DETACH PARTITION {items_table}')
+        # Detached items still reference orders, which would refuse to let their month go
+        for name in conn.exec_driver_sql(
+                f"SELECT conname FROM pg_constraint WHERE conrelid = '{items_table}'::regclass AND contype = 'f'"
+                ).scalars().all():
+            conn.exec_driver_sql(f'ALTER TABLE {items_table} DROP CONSTRAINT {name}')
+        conn.exec_driver_sql(f'ALTER TABLE orders DETACH PARTITION {orders_table}')
+    elif postgres:
+        conn.exec_driver_sql(f'DROP TABLE {items_table}')
+        conn.exec_driver_sql(f'ALTER TABLE orders DETACH PARTITION {orders_table}')
+        conn.exec_driver_sql(f'DROP TABLE {orders_table}')
+    else:
+        conn.execute(delete(OrderItem).where(OrderItem.order_id.in_(select(Order.id).where(in_month))))
+        conn.execute(delete(Order).where(in_month))
+
+    conn.execute(insert(OrderArchive).values(
+        month=month, orders=orders, items=items, path=path, archived_at=datetime.utcnow()
+    ))
+    return orders, items
+
+
+def archive(engine, retention_months, directory, keep_tables=False, log=print):
+    """Archive every month older than retention_months, one transaction each; returns the months archived"""
+    before = add_months(month_of(datetime.utcnow()), -retention_months)
+    with engine.connect() as conn:
+        months = months_to_archive(conn, before)
+    if months and not keep_tables:
+        os.makedirs(directory, exist_ok=True)
+    for month in months:
+        with engine.begin() as conn:
+            orders, items = archive_month(conn, month, directory, keep_tables)
+        log(f'Archived {month:%Y-%m}: {orders} orders, {items} items')
+    return months
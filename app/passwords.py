@@ -0,0 +1,90 @@
+"""Password hashing offloaded to a bounded process pool"""
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from flask import current_app
+from werkzeug.security import (
+    generate_password_hash, check_password_hash, DEFAULT_PBKDF2_ITERATIONS
+)
+
+_context = multiprocessing.get_context('forkserver')
+_context.set_forkserver_preload(['werkzeug.security'])
+
+_lock = threading.Lock()
+_executor = None
+_slots = None
+_key = None
+
+
+class HashingBusy(Exception):
+    """Raised when no hashing slot frees up within the queue timeout"""
+
+
+def _pool():
+    """Return the executor and slot semaphore, created once per process and setting"""
+    global _executor, _slots, _key
+    config = current_app.config
+    workers = config['PASSWORD_HASH_WORKERS']
+    key = (os.getpid(), workers, config['PASSWORD_HASH_MAX_CONCURRENCY'])
+    with _lock:
+        if _key != key:
+            if _executor is not None and _key[0] == key[0]:
+                _executor.shutdown(wait=False)
+            # Forking this threaded process could copy a lock some other thread holds, so the
+            # hashing processes are forked from a single-threaded fork server instead
+            _executor = ProcessPoolExecutor(
+                max_workers=workers,
+                mp_context=_context
+            ) if workers > 0 else None
+            _slots = threading.BoundedSemaphore(config['PASSWORD_HASH_MAX_CONCURRENCY'])
+            _key = key
+    return _executor, _slots
+
+
+def _run(fn, *args):
+    executor, slots = _pool()
+    if not slots.acquire(timeout=current_app.config['PASSWORD_HASH_QUEUE_TIMEOUT']):
+        raise HashingBusy()
+    try:
+        if executor is None:
+            return fn(*args)
+        return executor.submit(fn, *args).result()
+    finally:
+        slots.release()
+
+
+def _canonical_method(method):
+    """Expand a method string the way Werkzeug records it in the hash"""
+    name, *args = method.split(':')
+    if name == 'scrypt' and not args:
+        args = ['32768', '8', '1']
+    elif name == 'pbkdf2':
+        if not args:
+            args = ['sha256']
+        if len(args) == 1:
+            args.append(str(DEFAULT_PBKDF2_ITERATIONS))
+    return ':'.join([name, *args])
+
+
+def hash_password(password):
+    """Hash a password with the configured method"""
+    config = current_app.config
+    return _run(generate_password_hash, password,
+                config['PASSWORD_HASH_METHOD'], config['PASSWORD_SALT_LENGTH'])
+
+
+def verify_password(pwhash, password):
+    """Check a password against a stored hash"""
+    return _run(check_password_hash, pwhash, password)
+
+
+def needs_rehash(pwhash):
+    """True if the hash was made with different parameters than configured"""
+    config = current_app.config
+    try:
+        method, salt, _ = pwhash.split('$', 2)
+    except ValueError:
+        return True
+    return (method != _canonical_method(config['PASSWORD_HASH_METHOD'])
+            or len(salt) != config['PASSWORD_SALT_LENGTH'])
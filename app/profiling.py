@@ -0,0 +1,227 @@
+"""Opt-in profiling of live requests.
+
+A request is profiled when an admin sends `X-Profile: 1` (or `X-Profile:
+sampler`), or at random with probability PROFILE_SAMPLE_RATE. The profile and
+the SQL the request issued go into a per-worker ring buffer of
+PROFILE_BUFFER_SIZE entries, served by the /api/admin/profiles routes. Only
+the worker that took a profile can serve it, so profiled responses name it in
+X-Profile-Worker (host:pid). With neither trigger configured no hooks are
+installed at all.
+"""
+import cProfile
+import itertools
+import marshal
+import os
+import random
+import socket
+import sys
+import threading
+import time
+from collections import Counter, deque
+from datetime import datetime
+from flask import current_app, g, has_request_context, request
+from flask_jwt_extended import get_jwt, verify_jwt_in_request
+from app import metrics
+from app.streaming import after_body
+
+MODES = ('cprofile', 'sampler')
+
+_profiles = deque(maxlen=20)
+_profiles_lock = threading.Lock()
+_ids = itertools.count(1)
+
+
+class Sampler:
+    """Statistical profiler: one daemon thread samples the stacks of registered threads.
+
+    Collapsed stacks ("outer;inner;leaf count") feed flamegraph.pl or speedscope.
+    """
+
+    def __init__(self, interval):
+        self.interval = interval
+        self.threads = {}
+        self.lock = threading.Lock()
+        self.wakeup = threading.Condition(self.lock)
+        self.thread = None
+
+    def start(self, ident):
+        with self.lock:
+            counts = self.threads[ident] = Counter()
+            if self.thread is None:
+                self.thread = threading.Thread(target=self.run, name='profile-sampler', daemon=True)
+                self.thread.start()
+            self.wakeup.notify()
+        return counts
+
+    def stop(self, ident):
+        with self.lock:
+            return self.threads.pop(ident, Counter())
+
+    def run(self):
+        while True:
+            with self.lock:
+                while not self.threads:
+                    self.wakeup.wait()
+                idents = list(self.threads)
+            frames = sys._current_frames()
+            for ident in idents:
+                frame = frames.get(ident)
+                if frame is None:
+                    continue
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append(f'{code.co_name} ({code.co_filename}:{code.co_firstlineno})')
+                    frame = frame.f_back
+                with self.lock:
+                    counts = self.threads.get(ident)
+                    if counts is not None:
+                        counts[';'.join(reversed(stack))] += 1
+            time.sleep(self.interval)
+
+
+_sampler = None
+
+
+def sampler():
+    global _sampler
+    if _sampler is None:
+        _sampler = Sampler(current_app.config['PROFILE_SAMPLER_INTERVAL_MS'] / 1000)
+    return _sampler
+
+
+def requested_mode():
+    """Profiling mode for this request, or None"""
+    header = request.headers.get('X-Profile')
+    if header and current_app.config['PROFILE_HEADER_ENABLED']:
+        try:
+            verify_jwt_in_request(optional=True)
+            admin = get_jwt().get('role') == 'admin'
+        except Exception:
+            admin = False
+        if admin:
+            return header if header in MODES else current_app.config['PROFILE_MODE']
+    rate = current_app.config['PROFILE_SAMPLE_RATE']
+    if rate and random.random() < rate:
+        return current_app.config['PROFILE_MODE']
+    return None
+
+
+def start_profile():
+    mode = requested_mode()
+    if mode is None:
+        return
+    g.profile = {
+        'mode': mode,
+        'started_at': datetime.utcnow().isoformat() + 'Z',
+        'start': time.perf_counter(),
+        'statements': [],
+    }
+    if mode == 'sampler':
+        sampler().start(threading.get_ident())
+    else:
+        g.profile['profiler'] = profiler = cProfile.Profile()
+        profiler.enable()
+
+
+def finish_profile(response):
+    profile = g.get('profile')
+    if profile is None:
+        return response
+    # Left in g so record_statement still sees a streamed body's statements
+    profile['finishing'] = True
+    record = {
+        'id': next(_ids),
+        **worker(),
+        'method': request.method,
+        'path': request.full_path.rstrip('?'),
+        'endpoint': request.endpoint,
+        'status': response.status_code,
+        'mode': profile['mode'],
+        'started_at': profile['started_at'],
+        'statements': profile['statements'],
+    }
+    ident = threading.get_ident()
+
+    def store():
+        record['duration_ms'] = round((time.perf_counter() - profile['start']) * 1000, 2)
+        if profile['mode'] == 'sampler':
+            record['stacks'] = dict(sampler().stop(ident))
+        else:
+            profiler = profile['profiler']
+            profiler.disable()
+            profiler.create_stats()
+            record['pstats'] = marshal.dumps(profiler.stats)
+        with _profiles_lock:
+            _profiles.append(record)
+
+    response.headers['X-Profile-Id'] = str(record['id'])
+    response.headers['X-Profile-Worker'] = f"{record['host']}:{record['pid']}"
+    after_body(response, store)
+    return response
+
+
+def discard_profile(exc):
+    """Stop a profile that finish_profile never saw, so the thread is not left profiled"""
+    profile = g.pop('profile', None)
+    if profile is None or profile.get('finishing'):
+        return
+    if profile['mode'] == 'sampler':
+        sampler().stop(threading.get_ident())
+    else:
+        profile['profiler'].disable()
+
+
+def record_statement(conn, statement, parameters, executemany, elapsed):
+    if has_request_context() and 'profile' in g:
+        g.profile['statements'].append({'sql': ' '.join(statement.split()), 'ms': round(elapsed * 1000, 3)})
+
+
+def worker():
+    """Where this process's profiles live"""
+    return {'host': socket.gethostname(), 'pid': os.getpid()}
+
+
+def recent():
+    """Stored profiles, newest first"""
+    with _profiles_lock:
+        return list(reversed(_profiles))
+
+
+def get(profile_id):
+    with _profiles_lock:
+        for record in _profiles:
+            if record['id'] == profile_id:
+                return record
+    return None
+
+
+def top_functions(record, limit=30):
+    """Functions with the most cumulative time in a cProfile record"""
+    stats = marshal.loads(record['pstats'])
+    rows = sorted(stats.items(), key=lambda item: item[1][3], reverse=True)[:limit]
+    return [{
+        'function': f'{name} ({filename}:{line})',
+        'calls': calls,
+        'total_ms': round(total * 1000, 3),
+        'cumulative_ms': round(cumulative * 1000, 3),
+    } for (filename, line, name), (_, calls, total, cumulative, _) in rows]
+
+
+def collapsed(record):
+    """Collapsed-stack text of a sampler profile"""
+    return ''.join(f'{stack} {count}\n' for stack, count in sorted(record['stacks'].items()))
+
+
+def init_app(app):
+    global _profiles
+    if app.config['PROFILE_MODE'] not in MODES:
+        raise ValueError(f"PROFILE_MODE must be one of {MODES}, not {app.config['PROFILE_MODE']!r}")
+    _profiles = deque(_profiles, maxlen=app.config['PROFILE_BUFFER_SIZE'])
+    if not app.config['PROFILE_HEADER_ENABLED'] and not app.config['PROFILE_SAMPLE_RATE']:
+        return
+
+    metrics.observe_statements(app, record_statement)
+    app.before_request(start_profile)
+    app.after_request(finish_profile)
+    app.teardown_request(discard_profile)
@@ -0,0 +1,100 @@
+"""Per-route SQL statement budgets and a development-mode N+1 detector"""
+import logging
+import os
+import traceback
+from flask import current_app, g, has_request_context, request
+from sqlalchemy import event
+from app.streaming import after_body
+
+logger = logging.getLogger(__name__)
+
+APP_ROOT = os.path.dirname(os.path.abspath(__file__))
+
+
+class QueryBudgetExceeded(AssertionError):
+    """Raised when QUERY_BUDGET_ENFORCE is on and a route goes over its budget"""
+
+
+def query_budget(max_statements, per_batch=0):
+    """Declare the most SQL statements a route may issue per request.
+
+    Goes directly under the route decorator:
+
+        @bp.route('/')
+        @query_budget(4)
+        def get_products(): ...
+
+    A streamed route reads keyset batches until one comes back short; per_batch
+    is what each batch after the first may add to max_statements.
+    """
+    def decorator(view):
+        view.query_budget = max_statements
+        view.query_budget_per_batch = per_batch
+        return view
+    return decorator
+
+
+def call_site(depth=3):
+    """The innermost frames inside the app package, innermost first"""
+    frames = [
+        frame for frame in traceback.extract_stack()
+        if frame.filename.startswith(APP_ROOT) and frame.filename != __file__
+    ]
+    root = os.path.dirname(APP_ROOT)
+    return ' <- '.join(
+        f'{os.path.relpath(frame.filename, root)}:{frame.lineno} in {frame.name}'
+        for frame in reversed(frames[-depth:])
+    ) or 'unknown'
+
+
+def record_statement(conn, cursor, statement, parameters, context, executemany):
+    if has_request_context() and 'query_shapes' in g:
+        shape = g.query_shapes.get(statement)
+        if shape is None:
+            g.query_shapes[statement] = [1, call_site()]
+        else:
+            shape[0] += 1
+
+
+def start_request():
+    if current_app.config['QUERY_DEBUG']:
+        g.query_shapes = {}
+
+
+def check_request(response):
+    endpoint = request.endpoint
+    view = current_app.view_functions.get(endpoint)
+    budget = getattr(view, 'query_budget', None)
+    per_batch = getattr(view, 'query_budget_per_batch', 0)
+    enforce = current_app.config['QUERY_BUDGET_ENFORCE']
+    threshold = current_app.config['N_PLUS_ONE_THRESHOLD']
+    state = g._get_current_object()
+
+    def check():
+        count = getattr(state, 'sql_count', 0)
+        batches = getattr(state, 'stream_batches', 1)
+        allowed = None if budget is None else budget + per_batch * max(0, batches - 1)
+        if allowed is not None and count > allowed:
+            message = f'{endpoint} issued {count} SQL statements, budget is {allowed}'
+            if enforce:
+                raise QueryBudgetExceeded(message)
+            logger.warning(message)
+
+        # Each keyset batch repeats the route's statements once
+        for statement, (repeats, site) in getattr(state, 'query_shapes', {}).items():
+            if repeats >= threshold * batches:
+                logger.warning('Possible N+1 in %s: %d x "%s" at %s',
+                               endpoint, repeats, ' '.join(statement.split())[:200], site)
+
+    # A streamed body's statements are only all in once it is closed, too late to change the status
+    after_body(response, check)
+    return response
+
+
+def init_app(app):
+    from app.extensions import db
+    with app.app_context():
+        engine = db.engine
+    event.listen(engine, 'before_cursor_execute', record_statement)
+    app.before_request(start_request)
+    app.after_request(check_request)
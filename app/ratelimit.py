@@ -0,0 +1,138 @@
+"""Admission control: token-bucket rate limits and concurrency caps per endpoint class.
+
+The caps count in-flight requests per worker process. Besides its own cap,
+a request of any class other than checkout takes a slot of
+RATELIMIT_SHARED_CONCURRENCY, so together they leave checkout a thread.
+"""
+import threading
+import time
+from collections import OrderedDict
+from flask import g, jsonify, request
+from flask_jwt_extended import decode_token
+
+# Endpoint classes; anything not listed here is not limited
+CHECKOUT_ENDPOINTS = {'orders.create_order'}
+BLUEPRINT_CLASSES = {'products': 'catalog', 'reports': 'reports', 'auth': 'auth'}
+
+
+class TokenBucket:
+    __slots__ = ('rate', 'capacity', 'tokens', 'updated')
+
+    def __init__(self, rate, capacity, now):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = now
+
+    def take(self, now):
+        """Take one token; returns 0 on success or the seconds until one is available"""
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return 0
+        return (1 - self.tokens) / self.rate
+
+
+class RateLimiter:
+    """Per-process limiter state, created by init_app"""
+
+    def __init__(self, config):
+        self.rates = {name: parse_rate(rule) for name, rule in config['RATELIMIT_RATES'].items()}
+        self.role_multipliers = config['RATELIMIT_ROLE_MULTIPLIERS']
+        self.max_keys = config['RATELIMIT_MAX_KEYS']
+        self.slots = {
+            name: threading.BoundedSemaphore(limit)
+            for name, limit in config['RATELIMIT_CONCURRENCY'].items() if limit > 0
+        }
+        shared = config['RATELIMIT_SHARED_CONCURRENCY']
+        self.shared = threading.BoundedSemaphore(shared) if shared > 0 else None
+        self._buckets = OrderedDict()
+        self._lock = threading.Lock()
+
+    def take(self, endpoint_class, key, role):
+        """Returns 0 if the request may proceed, else seconds to wait"""
+        if endpoint_class not in self.rates:
+            return 0
+        rate, burst = self.rates[endpoint_class]
+        multiplier = self.role_multipliers.get(role, 1)
+        now = time.monotonic()
+        with self._lock:
+            bucket = self._buckets.get((endpoint_class, key))
+            if bucket is None:
+                bucket = TokenBucket(rate * multiplier, burst * multiplier, now)
+                self._buckets[(endpoint_class, key)] = bucket
+                if len(self._buckets) > self.max_keys:
+                    self._buckets.popitem(last=False)
+            else:
+                self._buckets.move_to_end((endpoint_class, key))
+            return bucket.take(now)
+
+
+def parse_rate(rule):
+    """Parse "<requests per second>/<burst>" into floats"""
+    rate, _, burst = rule.partition('/')
+    return float(rate), float(burst or rate)
+
+
+def endpoint_class():
+    if request.endpoint in CHECKOUT_ENDPOINTS:
+        return 'checkout'
+    return BLUEPRINT_CLASSES.get(request.blueprint)
+
+
+def client_identity():
+    """Bucket key and role: the JWT identity if a valid token is sent, else the client IP"""
+    auth = request.headers.get('Authorization', '')
+    if auth.startswith('Bearer '):
+        try:
+            claims = decode_token(auth[7:], allow_expired=True)
+            return f"user:{claims['sub']}", claims.get('role')
+        except Exception:
+            pass
+    # Behind TRUSTED_PROXY_HOPS proxies, ProxyFix has already set remote_addr from X-Forwarded-For
+    return f'ip:{request.remote_addr}', None
+
+
+def too_many(status, retry_after, message):
+    response = jsonify({'error': message})
+    response.status_code = status
+    response.headers['Retry-After'] = str(max(1, int(retry_after + 0.999)))
+    return response
+
+
+def init_app(app):
+    if not app.config['RATELIMIT_ENABLED']:
+        return
+    limiter = RateLimiter(app.config)
+    app.extensions['ratelimit'] = limiter
+
+    @app.before_request
+    def admit_request():
+        if request.method == 'OPTIONS':
+            return None
+        name = endpoint_class()
+        if name is None:
+            return None
+
+        key, role = client_identity()
+        wait = limiter.take(name, key, role)
+        if wait:
+            return too_many(429, wait, 'Rate limit exceeded')
+
+        held = []
+        for slots in (limiter.slots.get(name), limiter.shared if name != 'checkout' else None):
+            if slots is None:
+                continue
+            if not slots.acquire(blocking=False):
+                for taken in held:
+                    taken.release()
+                return too_many(503, 1, 'Server busy, retry shortly')
+            held.append(slots)
+        g.ratelimit_slots = held
+        return None
+
+    @app.teardown_request
+    def release_slot(error=None):
+        for slots in g.pop('ratelimit_slots', ()):
+            slots.release()
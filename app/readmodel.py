@@ -0,0 +1,144 @@
+"""Product read model: precomputed JSON documents, one per product.
+
+product_documents holds Product.to_dict() already encoded. Catalog reads
+splice the volatile stock fields into the stored text instead of building and
+serializing ORM objects. Documents are rebuilt in the committing transaction
+whenever a flush touches a product (including its discount and its size and
+color links) or a category, brand, size or color it refers to. Writes that
+bypass the ORM session (bulk COPY, raw SQL) must be followed by rebuild().
+"""
+import json
+import logging
+from datetime import datetime
+from sqlalchemy import delete, event, inspect, select
+from sqlalchemy.dialects import postgresql, sqlite
+from app import stockshm
+from app.database import lift_statement_timeout
+from app.extensions import db
+from app.models import Product, ProductDocument, Category, Brand, Size, Color
+from app.models.models import product_sizes, product_colors
+
+logger = logging.getLogger(__name__)
+
+REBUILD_BATCH_SIZE = 500
+
+
+def encode(product):
+    return json.dumps(product.to_dict(), sort_keys=True, separators=(',', ':'))
+
+
+def with_stock(document, quantity):
+    """Stored document with current_quantity and in_stock appended"""
+    return f'{document[:-1]},"current_quantity":{quantity},"in_stock":{"true" if quantity > 0 else "false"}}}'
+
+
+def store(session, product_ids):
+    """Rebuild the documents of product_ids"""
+    product_ids = sorted(product_ids)
+    insert = postgresql.insert if session.get_bind().dialect.name == 'postgresql' else sqlite.insert
+    for start in range(0, len(product_ids), REBUILD_BATCH_SIZE):
+        batch = product_ids[start:start + REBUILD_BATCH_SIZE]
+        products = session.query(Product).options(*Product.eager_options()).filter(Product.id.in_(batch)).all()
+        if not products:
+            continue
+        now = datetime.utcnow()
+        statement = insert(ProductDocument)
+        statement = statement.on_conflict_do_update(
+            index_elements=['product_id'],
+            set_={'document': statement.excluded.document, 'updated_at': statement.excluded.updated_at},
+        )
+        session.execute(statement, [
+            {'product_id': product.id, 'document': encode(product), 'updated_at': now} for product in products
+        ])
+
+
+def rebuild(session=None, missing_only=False):
+    """Rebuild every document, or only those of products without one; returns how many were written"""
+    session = session or db.session
+    lift_statement_timeout(session.connection())
+    query = select(Product.id)
+    if missing_only:
+        query = query.outerjoin(ProductDocument).where(ProductDocument.product_id.is_(None))
+    product_ids = session.scalars(query).all()
+    store(session, product_ids)
+    session.commit()
+    return len(product_ids)
+
+
+def changed(obj, ignore):
+    """Whether a flushed object has changes outside the ignored attributes"""
+    return any(attr.history.has_changes() for attr in inspect(obj).attrs if attr.key not in ignore)
+
+
+def collect(session, flush_context):
+    """Remember which documents this flush made stale"""
+    stale = session.info.setdefault('stale_documents', {
+        'products': set(), 'deleted': set(), Category: set(), Brand: set(), Size: set(), Color: set(),
+    })
+    for obj in session.new:
+        if isinstance(obj, Product):
+            stale['products'].add(obj.id)
+    for obj in session.dirty:
+        # Backref collections (an order item added to product.order_items,
+        # a product added to size.products) do not change the document
+        if isinstance(obj, Product) and changed(obj, ('order_items',)):
+            stale['products'].add(obj.id)
+        elif isinstance(obj, (Category, Brand, Size, Color)) and changed(obj, ('products',)):
+            stale[type(obj)].add(obj.id)
+    for obj in session.deleted:
+        if isinstance(obj, Product):
+            stale['deleted'].add(obj.id)
+
+
+def refresh(session):
+    """Rewrite stale documents before the transaction commits"""
+    session.flush()
+    stale = session.info.pop('stale_documents', None)
+    if not stale:
+        return
+    product_ids = set(stale['products'])
+    for column, ids in [
+        (Product.category_id, stale[Category]),
+        (Product.brand_id, stale[Brand]),
+        (product_sizes.c.size_id, stale[Size]),
+        (product_colors.c.color_id, stale[Color]),
+    ]:
+        if ids:
+            source = Product.id if column.table is Product.__table__ else column.table.c.product_id
+            product_ids.update(session.scalars(select(source).where(column.in_(ids))))
+    if stale['deleted']:
+        session.execute(delete(ProductDocument).where(ProductDocument.product_id.in_(stale['deleted'])))
+    product_ids -= stale['deleted']
+    if product_ids:
+        store(session, product_ids)
+
+
+def discard(session, *args):
+    session.info.pop('stale_documents', None)
+
+
+def encoded_products(rows):
+    """JSON texts for (id, initial_quantity, archived_sold_quantity, document) rows, stock included"""
+    quantities = stockshm.current_quantities(rows)
+    missing = [row.id for row in rows if row.document is None]
+    built = {}
+    if missing:
+        logger.warning('%d products have no stored document; run flask rebuild-product-documents', len(missing))
+        for product in Product.query.options(*Product.eager_options()).filter(Product.id.in_(missing)):
+            built[product.id] = encode(product)
+    return [with_stock(row.document or built[row.id], quantities[row.id]) for row in rows]
+
+
+def product_rows():
+    """Query of (id, initial_quantity, archived_sold_quantity, document) for every product"""
+    return db.session.query(Product.id, Product.initial_quantity, Product.archived_sold_quantity,
+                            ProductDocument.document) \
+        .outerjoin(ProductDocument, ProductDocument.product_id == Product.id)
+
+
+def init_app(app):
+    session_class = db.session.session_factory.class_
+    for name, listener in [('after_flush', collect), ('before_commit', refresh),
+                           ('after_rollback', discard)]:
+        if not event.contains(session_class, name, listener):
+            event.listen(session_class, name, listener)
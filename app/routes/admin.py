@@ -0,0 +1,126 @@
+from flask import Blueprint, Response, jsonify
+from flask_jwt_extended import jwt_required, get_jwt
+from app import profiling
+from app.slowlog import get_slow_log
+from app.querybudget import query_budget
+
+bp = Blueprint('admin', __name__, url_prefix='/api/admin')
+
+def require_admin():
+    """Check if user is an admin"""
+    claims = get_jwt()
+    return claims.get('role') == 'admin'
+
+def summary(record):
+    return {
+        'id': record['id'],
+        'host': record['host'],
+        'pid': record['pid'],
+        'method': record['method'],
+        'path': record['path'],
+        'endpoint': record['endpoint'],
+        'status': record['status'],
+        'duration_ms': record['duration_ms'],
+        'mode': record['mode'],
+        'started_at': record['started_at'],
+        'sql_count': len(record['statements']),
+        'sql_ms': round(sum(statement['ms'] for statement in record['statements']), 3),
+    }
+
+def profile_not_found():
+    """404 naming this worker: profiles are only held by the worker that took them"""
+    return jsonify({'error': 'Profile not found on this worker', **profiling.worker()}), 404
+
+@bp.route('/profiles', methods=['GET'])
+@query_budget(1)
+@jwt_required()
+def list_profiles():
+    """Profiles held by this worker, newest first"""
+    if not require_admin():
+        return jsonify({'error': 'Insufficient permissions'}), 403
+    return jsonify([summary(record) for record in profiling.recent()]), 200
+
+@bp.route('/profiles/<int:profile_id>', methods=['GET'])
+@query_budget(1)
+@jwt_required()
+def get_profile(profile_id):
+    """Profile summary with its SQL statements and hottest functions or stacks"""
+    if not require_admin():
+        return jsonify({'error': 'Insufficient permissions'}), 403
+    record = profiling.get(profile_id)
+    if not record:
+        return profile_not_found()
+    
+    data = summary(record)
+    data['statements'] = record['statements']
+    if record['mode'] == 'sampler':
+        stacks = sorted(record['stacks'].items(), key=lambda item: item[1], reverse=True)[:30]
+        data['top_stacks'] = [{'stack': stack, 'samples': count} for stack, count in stacks]
+    else:
+        data['top_functions'] = profiling.top_functions(record)
+    return jsonify(data), 200
+
+@bp.route('/profiles/<int:profile_id>/pstats', methods=['GET'])
+@query_budget(1)
+@jwt_required()
+def download_pstats(profile_id):
+    """cProfile data, readable with python -m pstats or snakeviz"""
+    if not require_admin():
+        return jsonify({'error': 'Insufficient permissions'}), 403
+    record = profiling.get(profile_id)
+    if not record:
+        return profile_not_found()
+    if 'pstats' not in record:
+        return jsonify({'error': 'Profile was taken with the sampler, download /collapsed instead'}), 404
+    
+    return Response(record['pstats'], mimetype='application/octet-stream', headers={
+        'Content-Disposition': f'attachment; filename=profile-{profile_id}.prof'
+    })
+
+@bp.route('/profiles/<int:profile_id>/collapsed', methods=['GET'])
+@query_budget(1)
+@jwt_required()
+def download_collapsed(profile_id):
+    """Collapsed stacks for flamegraph.pl or speedscope"""
+    if not require_admin():
+        return jsonify({'error': 'Insufficient permissions'}), 403
+    record = profiling.get(profile_id)
+    if not record:
+        return profile_not_found()
+    if 'stacks' not in record:
+        return jsonify({'error': 'Profile was taken with cProfile, download /pstats instead'}), 404
+    
+    return Response(profiling.collapsed(record), mimetype='text/plain', headers={
+        'Content-Disposition': f'attachment; filename=profile-{profile_id}.folded'
+    })
+
+@bp.route('/slow-queries', methods=['GET'])
+@query_budget(1)
+@jwt_required()
+def list_slow_queries():
+    """Slow statements on this worker by fingerprint, worst first"""
+    if not require_admin():
+        return jsonify({'error': 'Insufficient permissions'}), 403
+    return jsonify(get_slow_log().snapshot()), 200
+
+@bp.route('/slow-queries/<string:key>', methods=['GET'])
+@query_budget(1)
+@jwt_required()
+def get_slow_query(key):
+    """One slow statement with the plan of its worst execution"""
+    if not require_admin():
+        return jsonify({'error': 'Insufficient permissions'}), 403
+    entry = get_slow_log().get(key)
+    if not entry:
+        return jsonify({'error': 'Slow query not found'}), 404
+    return jsonify(entry), 200
+
+@bp.route('/slow-queries', methods=['DELETE'])
+@query_budget(1)
+@jwt_required()
+def clear_slow_queries():
+    """Forget this worker's slow statements"""
+    if not require_admin():
+        return jsonify({'error': 'Insufficient permissions'}), 403
+    get_slow_log().clear()
+    return jsonify({'message': 'Slow query log cleared'}), 200
@@ -1,11 +1,26 @@
 from flask import Blueprint, request, jsonify
-from flask_jwt_extended import create_access_token, jwt_required, get_jwt_identity
+from flask_jwt_extended import (
+    create_access_token, create_refresh_token, decode_token,
+    jwt_required, get_jwt, get_jwt_identity
+)
+from jwt.exceptions import PyJWTError
 from app.extensions import db
+from app.querybudget import query_budget
 from app.models import User
+from app.denylist import revoke_token
 
 bp = Blueprint('auth', __name__, url_prefix='/api/auth')
 
+def issue_tokens(user):
+    """Create a short-lived access token and a long-lived refresh token"""
+    claims = {'role': user.role}
+    return {
+        'access_token': create_access_token(identity=user.id, additional_claims=claims),
+        'refresh_token': create_refresh_token(identity=user.id, additional_claims=claims)
+    }
+
 @bp.route('/register', methods=['POST'])
+@query_budget(4)
 def register():
     """Register a new user"""
     data = request.get_json()
@@ -19,6 +34,9 @@ def register():
     if User.query.filter_by(email=data['email']).first():
         return jsonify({'error': 'Email already exists'}), 400
     
+    # Give the connection back to the pool while the password is hashed
+    db.session.rollback()
+    
     user = User(
         username=data['username'],
         email=data['email'],
@@ -35,6 +53,7 @@ def register():
     }), 201
 
 @bp.route('/login', methods=['POST'])
+@query_budget(2)
 def login():
     """Login and get JWT token"""
     data = request.get_json()
@@ -44,17 +63,58 @@ def login():
     
     user = User.query.filter_by(username=data['username']).first()
     
+    # Give the connection back to the pool while the hash is checked
+    if user:
+        db.session.expunge(user)
+    db.session.rollback()
+    
     if not user or not user.check_password(data['password']):
         return jsonify({'error': 'Invalid credentials'}), 401
     
-    access_token = create_access_token(identity=user.id, additional_claims={'role': user.role})
+    # Upgrade hashes made with old parameters while we have the plaintext
+    if user.password_needs_rehash():
+        user.set_password(data['password'])
+        db.session.add(user)
+        db.session.commit()
     
     return jsonify({
-        'access_token': access_token,
+        **issue_tokens(user),
         'user': user.to_dict()
     }), 200
 
+@bp.route('/refresh', methods=['POST'])
+@query_budget(3)
+@jwt_required(refresh=True)
+def refresh():
+    """Exchange a refresh token for a new access/refresh pair (no password check)"""
+    # Rotation: each refresh token works once
+    if not revoke_token(get_jwt()):
+        return jsonify({'error': 'Refresh token already used'}), 401
+    
+    user = User.query.get(get_jwt_identity())
+    if not user:
+        return jsonify({'error': 'User not found'}), 401
+    
+    return jsonify(issue_tokens(user)), 200
+
+@bp.route('/logout', methods=['POST'])
+@query_budget(3)
+@jwt_required(verify_type=False)
+def logout():
+    """Revoke the presented token and, if given, the refresh token in the body"""
+    revoke_token(get_jwt())
+    
+    data = request.get_json(silent=True) or {}
+    if data.get('refresh_token'):
+        try:
+            revoke_token(decode_token(data['refresh_token']))
+        except PyJWTError:
+            pass
+    
+    return jsonify({'message': 'Logged out successfully'}), 200
+
 @bp.route('/me', methods=['GET'])
+@query_budget(2)
 @jwt_required()
 def get_current_user():
     """Get current user info"""
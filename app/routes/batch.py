@@ -0,0 +1,21 @@
+from flask import Blueprint, current_app, request, jsonify
+from app import subrequests
+from app.querybudget import query_budget
+
+bp = Blueprint('batch', __name__, url_prefix='/api/batch')
+
+@bp.route('', methods=['POST'])
+@query_budget(0)
+def run_batch():
+    """Run several API requests in one round trip; each keeps its own status and budget"""
+    data = request.get_json(silent=True)
+    if not isinstance(data, dict) or not isinstance(data.get('requests'), list):
+        return jsonify({'error': 'Missing requests list'}), 400
+    
+    max_requests = current_app.config['BATCH_MAX_REQUESTS']
+    if len(data['requests']) > max_requests:
+        return jsonify({'error': f'At most {max_requests} requests per batch'}), 400
+    
+    return jsonify({
+        'responses': subrequests.run(data['requests'], parallel=bool(data.get('parallel')))
+    }), 200
@@ -0,0 +1,42 @@
+from flask import Blueprint, current_app, request, jsonify
+from flask_jwt_extended import jwt_required, get_jwt
+from app.extensions import db
+from app import outbox
+from app.querybudget import query_budget
+
+bp = Blueprint('changes', __name__, url_prefix='/api/changes')
+
+@bp.route('/', methods=['GET'])
+@query_budget(3)
+@jwt_required()
+def get_changes():
+    """Product and order changes after a cursor, never skipping a later commit (Admin and Advanced users only)"""
+    claims = get_jwt()
+    role = claims.get('role')
+
+    if role not in ['admin', 'advanced_user']:
+        return jsonify({'error': 'Insufficient permissions'}), 403
+
+    # Without a cursor, start from now: take it before the initial full export
+    since = request.args.get('since', type=int)
+    if since is None:
+        return jsonify({'events': [], 'cursor': outbox.latest_cursor(), 'more': False}), 200
+
+    config = current_app.config
+    limit = max(1, min(request.args.get('limit', config['OUTBOX_PAGE_SIZE'], type=int), config['OUTBOX_PAGE_SIZE']))
+    wait = max(0.0, min(request.args.get('wait', 0, type=float), config['OUTBOX_MAX_WAIT']))
+
+    # Counted before reading, so a commit in between still ends the wait
+    announced = outbox.get_feed().announced
+    events = outbox.events_after(since, limit)
+    if not events and wait:
+        # Hand the connection back to the pool while the long-poll waits
+        db.session.close()
+        if outbox.get_feed().wait(announced, wait):
+            events = outbox.events_after(since, limit)
+
+    return jsonify({
+        'events': [event.to_dict() for event in events],
+        'cursor': events[-1].id if events else since,
+        'more': len(events) == limit
+    }), 200
@@ -1,34 +1,44 @@
-from flask import Blueprint, request, jsonify
+from flask import Blueprint, current_app, request, jsonify
 from flask_jwt_extended import jwt_required, get_jwt
 from app.extensions import db
+from app import stockshm
+from app.querybudget import query_budget
+from app.streaming import json_array, keyset_batches
 from app.models import Order, OrderItem, Client, Product
+from sqlalchemy import insert
 
 bp = Blueprint('orders', __name__, url_prefix='/api/orders')
 
 @bp.route('/', methods=['GET'])
+@query_budget(5, per_batch=4)
 @jwt_required()
 def get_orders():
-    """Get all orders (Admin and Advanced users only)"""
+    """Get all orders, streamed in batches (Admin and Advanced users only)"""
     claims = get_jwt()
     role = claims.get('role')
     
     if role not in ['admin', 'advanced_user']:
         return jsonify({'error': 'Insufficient permissions'}), 403
     
-    orders = Order.query.all()
-    return jsonify([order.to_dict() for order in orders]), 200
+    query = Order.query.options(*Order.eager_options())
+    return json_array(
+        [order.to_dict() for order in orders]
+        for orders in keyset_batches(query, Order.id, current_app.config['STREAM_BATCH_SIZE'])
+    )
 
 @bp.route('/<int:order_id>', methods=['GET'])
+@query_budget(5)
 @jwt_required()
 def get_order(order_id):
     """Get single order"""
-    order = Order.query.get(order_id)
+    order = Order.query.options(*Order.eager_options()).get(order_id)
     if not order:
         return jsonify({'error': 'Order not found'}), 404
     
     return jsonify(order.to_dict()), 200
 
 @bp.route('/', methods=['POST'])
+@query_budget(13)
 def create_order():
     """Create a new order"""
     data = request.get_json()
@@ -56,38 +66,56 @@ def create_order():
     db.session.add(order)
     db.session.flush()
     
-    # Add order items
+    # Load the cart's products and their stock up front instead of per item
+    product_ids = [item_data['product_id'] for item_data in data['items']]
+    products = {
+        product.id: product
+        for product in Product.query.filter(Product.id.in_(product_ids)).all()
+    }
+    versions = stockshm.versions(products)
+    quantities = Product.current_quantities(products.values())
+    
+    # Add order items with one executemany instead of an INSERT ... RETURNING per item
+    rows = []
     for item_data in data['items']:
-        product = Product.query.get(item_data['product_id'])
+        product = products.get(item_data['product_id'])
         if not product:
             db.session.rollback()
             return jsonify({'error': f'Product {item_data["product_id"]} not found'}), 404
         
         # Check stock availability
-        current_quantity = product.get_current_quantity()
+        current_quantity = quantities[product.id]
         if current_quantity < item_data['quantity']:
             db.session.rollback()
             return jsonify({'error': f'Insufficient stock for {product.name}. Available: {current_quantity}'}), 400
         
         price = product.get_discounted_price()
-        order_item = OrderItem(
-            order_id=order.id,
-            product_id=product.id,
-            quantity=item_data['quantity'],
-            price_at_purchase=price
-        )
-        db.session.add(order_item)
+        rows.append({
+            'order_id': order.id,
+            'order_created_at': order.created_at,
+            'product_id': product.id,
+            'quantity': item_data['quantity'],
+            'price_at_purchase': price
+        })
         total_amount += price * item_data['quantity']
     
+    db.session.execute(insert(OrderItem), rows)
     order.total_amount = total_amount
+    order_id = order.id
     db.session.commit()
     
+    # The stock just validated is authoritative; share it with the pod's other workers
+    stockshm.remember(products.values(), quantities, versions)
+    
+    order = Order.query.options(*Order.eager_options()).filter_by(id=order_id).one()
+    
     return jsonify({
         'message': 'Order created successfully',
         'order': order.to_dict()
     }), 201
 
 @bp.route('/<int:order_id>/status', methods=['PATCH'])
+@query_budget(14)
 @jwt_required()
 def update_order_status(order_id):
     """Update order status (Admin and Advanced users only)"""
@@ -109,8 +137,12 @@ def update_order_status(order_id):
     if data['status'] not in valid_statuses:
         return jsonify({'error': 'Invalid status'}), 400
     
+    changed = stockshm.sold_changing(order, order.status, data['status'])
     order.status = data['status']
     db.session.commit()
+    stockshm.invalidate(changed)
+    
+    order = Order.query.options(*Order.eager_options()).filter_by(id=order_id).one()
     
     return jsonify({
         'message': 'Order status updated successfully',
@@ -118,6 +150,7 @@ def update_order_status(order_id):
     }), 200
 
 @bp.route('/<int:order_id>', methods=['DELETE'])
+@query_budget(8)
 @jwt_required()
 def delete_order(order_id):
     """Delete an order (Admin only)"""
@@ -131,19 +164,22 @@ def delete_order(order_id):
     if not order:
         return jsonify({'error': 'Order not found'}), 404
     
+    changed = stockshm.sold_changing(order, order.status, None)
     db.session.delete(order)
     db.session.commit()
+    stockshm.invalidate(changed)
     
     return jsonify({'message': 'Order deleted successfully'}), 200
 
 @bp.route('/client/<string:email>', methods=['GET'])
+@query_budget(5)
 def get_client_orders(email):
     """Get all orders for a specific client by email"""
     client = Client.query.filter_by(email=email).first()
     if not client:
         return jsonify({'error': 'Client not found'}), 404
     
-    orders = Order.query.filter_by(client_id=client.id).all()
+    orders = Order.query.options(*Order.eager_options()).filter_by(client_id=client.id).all()
     return jsonify({
         'client': client.to_dict(),
         'orders': [order.to_dict() for order in orders]
@@ -1,7 +1,11 @@
-from flask import Blueprint, request, jsonify
+from flask import Blueprint, Response, current_app, request, jsonify
 from flask_jwt_extended import jwt_required, get_jwt
 from app.extensions import db
-from app.models import Product, Category, Brand, Size, Color
+from app import copurchase, lowstock, readmodel, stockshm, suggest
+from app.coalesce import coalesce
+from app.querybudget import query_budget
+from app.streaming import json_array, keyset_batches
+from app.models import Product, Category, Brand, Size, Color, Order, OrderItem
 from sqlalchemy import and_, or_
 
 bp = Blueprint('products', __name__, url_prefix='/api/products')
@@ -20,20 +24,71 @@ def require_role(required_roles):
     return decorator
 
 @bp.route('/', methods=['GET'])
+@query_budget(2, per_batch=2)
+@coalesce()
 def get_products():
-    """Get all products"""
-    products = Product.query.all()
-    return jsonify([product.to_dict(include_quantity=True) for product in products]), 200
+    """Get all products from their stored documents, streamed in batches"""
+    batches = keyset_batches(readmodel.product_rows(), Product.id, current_app.config['STREAM_BATCH_SIZE'])
+    return json_array((readmodel.encoded_products(rows) for rows in batches), encoded=True)
+
+@bp.route('/suggest', methods=['GET'])
+@query_budget(0)
+def suggest_products():
+    """Product, brand and category names for type-ahead, most popular first, from memory"""
+    if 'suggest' not in current_app.extensions:
+        return jsonify({'error': 'Suggestions are disabled'}), 404
+    prefix = request.args.get('prefix', '')
+    if not prefix.strip():
+        return jsonify({'error': 'Missing prefix'}), 400
+    
+    index = suggest.get_index()
+    if not index.ready:
+        return jsonify({'error': 'Suggestions are loading, retry shortly'}), 503, {'Retry-After': '1'}
+    
+    limit = max(1, min(request.args.get('limit', index.limit, type=int), index.limit))
+    return jsonify({
+        'prefix': prefix,
+        'suggestions': [
+            {'type': entry.kind, 'id': entry.id, 'name': entry.name}
+            for entry in index.lookup(prefix, limit)
+        ]
+    }), 200
+
+@bp.route('/low-stock', methods=['GET'])
+@query_budget(2)
+@jwt_required()
+@require_role(['admin', 'advanced_user'])
+def get_low_stock():
+    """Products at or below their reorder threshold, furthest below first, from the stock levels"""
+    limit = max(1, min(request.args.get('limit', current_app.config['LOW_STOCK_LIMIT'], type=int),
+                       current_app.config['LOW_STOCK_LIMIT']))
+    rows = lowstock.watchlist(limit)
+    return jsonify({
+        'products': [
+            {
+                'product_id': level.product_id,
+                'name': name,
+                'current_quantity': level.available,
+                'reorder_threshold': level.available - level.margin,
+                'shortfall': -level.margin
+            }
+            for level, name in rows
+        ],
+        'count': len(rows)
+    }), 200
 
 @bp.route('/<int:product_id>', methods=['GET'])
+@query_budget(2)
+@coalesce()
 def get_product(product_id):
-    """Get single product by ID"""
-    product = Product.query.get(product_id)
-    if not product:
+    """Get single product by ID, from its stored document"""
+    row = readmodel.product_rows().filter(Product.id == product_id).first()
+    if not row:
         return jsonify({'error': 'Product not found'}), 404
-    return jsonify(product.to_dict(include_quantity=True)), 200
+    return Response(readmodel.encoded_products([row])[0], mimetype='application/json'), 200
 
 @bp.route('/', methods=['POST'])
+@query_budget(17)
 @jwt_required()
 def create_product():
     """Create a new product (All users can create)"""
@@ -50,6 +105,7 @@ def create_product():
         discount_percentage=data.get('discount_percentage', 0.0),
         gender=data['gender'],
         initial_quantity=data['initial_quantity'],
+        reorder_threshold=data.get('reorder_threshold', 0),
         category_id=data['category_id'],
         brand_id=data['brand_id']
     )
@@ -66,6 +122,8 @@ def create_product():
     
     db.session.add(product)
     db.session.commit()
+    # A reused id must not inherit a deleted product's stock
+    stockshm.invalidate([product.id])
     
     return jsonify({
         'message': 'Product created successfully',
@@ -73,6 +131,7 @@ def create_product():
     }), 201
 
 @bp.route('/<int:product_id>', methods=['PUT'])
+@query_budget(20)
 @jwt_required()
 def update_product(product_id):
     """Update a product"""
@@ -95,6 +154,8 @@ def update_product(product_id):
         product.gender = data['gender']
     if 'initial_quantity' in data:
         product.initial_quantity = data['initial_quantity']
+    if 'reorder_threshold' in data:
+        product.reorder_threshold = data['reorder_threshold']
     if 'category_id' in data:
         product.category_id = data['category_id']
     if 'brand_id' in data:
@@ -111,6 +172,9 @@ def update_product(product_id):
         product.colors = colors
     
     db.session.commit()
+    stockshm.invalidate([product_id])
+    
+    product = Product.query.options(*Product.eager_options()).filter_by(id=product_id).one()
     
     return jsonify({
         'message': 'Product updated successfully',
@@ -118,6 +182,7 @@ def update_product(product_id):
     }), 200
 
 @bp.route('/<int:product_id>', methods=['DELETE'])
+@query_budget(10)
 @jwt_required()
 def delete_product(product_id):
     """Delete a product"""
@@ -127,10 +192,12 @@ def delete_product(product_id):
     
     db.session.delete(product)
     db.session.commit()
+    stockshm.invalidate([product_id])
     
     return jsonify({'message': 'Product deleted successfully'}), 200
 
 @bp.route('/<int:product_id>/discount', methods=['PATCH'])
+@query_budget(13)
 @jwt_required()
 def apply_discount(product_id):
     """Apply discount to a product"""
@@ -145,41 +212,75 @@ def apply_discount(product_id):
     product.discount_percentage = data['discount_percentage']
     db.session.commit()
     
+    product = Product.query.options(*Product.eager_options()).filter_by(id=product_id).one()
+    
     return jsonify({
         'message': 'Discount applied successfully',
         'product': product.to_dict()
     }), 200
 
 @bp.route('/<int:product_id>/quantity', methods=['GET'])
+@query_budget(4)
 def get_product_quantity(product_id):
     """Get real-time product quantity"""
-    product = Product.query.get(product_id)
-    if not product:
-        return jsonify({'error': 'Product not found'}), 404
-    
-    sold_quantity = db.session.query(db.func.sum(db.text('order_items.quantity')))\
-        .select_from(db.text('order_items'))\
-        .join(db.text('orders'), db.text('order_items.order_id = orders.id'))\
-        .filter(db.text('order_items.product_id = :product_id'))\
-        .filter(db.text("orders.status IN ('confirmed', 'shipped', 'delivered')"))\
-        .params(product_id=product_id)\
-        .scalar() or 0
-    
-    current_quantity = product.initial_quantity - sold_quantity
+    cached = stockshm.cached_quantity(product_id)
+    if cached:
+        name, initial_quantity, sold_quantity = cached
+    else:
+        versions = stockshm.versions([product_id])
+        product = Product.query.get(product_id)
+        if not product:
+            return jsonify({'error': 'Product not found'}), 404
+        
+        sold_quantity = db.session.query(db.func.sum(OrderItem.quantity))\
+            .select_from(Order).join(Order.items)\
+            .filter(OrderItem.product_id == product_id)\
+            .filter(Order.status.in_(['confirmed', 'shipped', 'delivered']))\
+            .scalar() or 0
+        sold_quantity += product.archived_sold_quantity
+        stockshm.remember_quantity(product, sold_quantity, versions)
+        name, initial_quantity = product.name, product.initial_quantity
+    
+    current_quantity = initial_quantity - sold_quantity
     
     return jsonify({
-        'product_id': product.id,
-        'name': product.name,
-        'initial_quantity': product.initial_quantity,
+        'product_id': product_id,
+        'name': name,
+        'initial_quantity': initial_quantity,
         'sold_quantity': sold_quantity,
         'current_quantity': current_quantity,
         'in_stock': current_quantity > 0
     }), 200
 
+@bp.route('/<int:product_id>/related', methods=['GET'])
+@query_budget(2)
+@coalesce()
+def get_related_products(product_id):
+    """Products most often bought together with this one, from the co-purchase index"""
+    limit = max(1, min(request.args.get('limit', 10, type=int), current_app.config['COPURCHASE_KEEP']))
+    rows = copurchase.related(product_id, limit)
+    if not rows and not db.session.query(Product.id).filter_by(id=product_id).first():
+        return jsonify({'error': 'Product not found'}), 404
+    
+    return jsonify({
+        'product_id': product_id,
+        'related': [
+            {
+                'product_id': product.id,
+                'name': product.name,
+                'price': product.price,
+                'discounted_price': product.get_discounted_price(),
+                'orders': orders
+            }
+            for product, orders in rows
+        ]
+    }), 200
+
 @bp.route('/search', methods=['GET'])
+@query_budget(4)
 def search_products():
     """Advanced product search with multiple filters"""
-    query = Product.query
+    query = Product.query.options(*Product.eager_options())
     
     # Filter by gender
     gender = request.args.get('gender')
@@ -218,23 +319,29 @@ def search_products():
     availability = request.args.get('availability')
     
     products = query.all()
+    quantities = Product.current_quantities(products)
     
     # Filter by stock if needed
     if availability == 'in_stock':
-        products = [p for p in products if p.get_current_quantity() > 0]
+        products = [p for p in products if quantities[p.id] > 0]
     elif availability == 'out_of_stock':
-        products = [p for p in products if p.get_current_quantity() <= 0]
+        products = [p for p in products if quantities[p.id] <= 0]
     
-    return jsonify([product.to_dict(include_quantity=True) for product in products]), 200
+    return jsonify([
+        product.to_dict(include_quantity=True, current_quantity=quantities[product.id])
+        for product in products
+    ]), 200
 
 # Category Routes
 @bp.route('/categories', methods=['GET'])
+@query_budget(1)
 def get_categories():
     """Get all categories"""
     categories = Category.query.all()
     return jsonify([cat.to_dict() for cat in categories]), 200
 
 @bp.route('/categories', methods=['POST'])
+@query_budget(3)
 @jwt_required()
 def create_category():
     """Create a new category"""
@@ -250,12 +357,14 @@ def create_category():
 
 # Brand Routes
 @bp.route('/brands', methods=['GET'])
+@query_budget(1)
 def get_brands():
     """Get all brands"""
     brands = Brand.query.all()
     return jsonify([brand.to_dict() for brand in brands]), 200
 
 @bp.route('/brands', methods=['POST'])
+@query_budget(3)
 @jwt_required()
 def create_brand():
     """Create a new brand"""
@@ -271,12 +380,14 @@ def create_brand():
 
 # Size Routes
 @bp.route('/sizes', methods=['GET'])
+@query_budget(1)
 def get_sizes():
     """Get all sizes"""
     sizes = Size.query.all()
     return jsonify([size.to_dict() for size in sizes]), 200
 
 @bp.route('/sizes', methods=['POST'])
+@query_budget(3)
 @jwt_required()
 def create_size():
     """Create a new size"""
@@ -292,12 +403,14 @@ def create_size():
 
 # Color Routes
 @bp.route('/colors', methods=['GET'])
+@query_budget(1)
 def get_colors():
     """Get all colors"""
     colors = Color.query.all()
     return jsonify([color.to_dict() for color in colors]), 200
 
 @bp.route('/colors', methods=['POST'])
+@query_budget(3)
 @jwt_required()
 def create_color():
     """Create a new color"""
@@ -1,12 +1,49 @@
 from flask import Blueprint, request, jsonify
 from flask_jwt_extended import jwt_required, get_jwt
 from app.extensions import db
-from app.models import Order, OrderItem, Product
-from sqlalchemy import func, and_
+from app.coalesce import coalesce
+from app.querybudget import query_budget
+from app.models import Order, OrderItem, Product, DailyOrderRollup, MonthlyProductRollup
+from sqlalchemy import Date, func, and_, select, union_all
 from datetime import datetime, timedelta
 
 bp = Blueprint('reports', __name__, url_prefix='/api/reports')
 
+SOLD_STATUSES = ['confirmed', 'shipped', 'delivered']
+
+# Orders of archived months only exist in the rollups (app/partitions.py), so
+# every report adds them to what it finds in the live tables
+
+def sold_by_day(start, end):
+    """Subquery of (day, orders, earnings) for sold orders created between start and end"""
+    day = func.date(Order.created_at, type_=Date)
+    live = select(day.label('day'), func.count(Order.id).label('orders'), func.sum(Order.total_amount).label('earnings'))\
+        .where(Order.created_at >= start, Order.created_at <= end, Order.status.in_(SOLD_STATUSES))\
+        .group_by(day)
+    archived = select(DailyOrderRollup.day, DailyOrderRollup.orders, DailyOrderRollup.total_amount)\
+        .where(DailyOrderRollup.day >= start.date(), DailyOrderRollup.day <= end.date(),
+               DailyOrderRollup.status.in_(SOLD_STATUSES))
+    return union_all(live, archived).subquery('sold_by_day')
+
+def sold_by(keys, joins=()):
+    """Subquery of keys with the units and revenue sold per keys, over every sold order
+
+    joins lead from the keys' table to products.
+    """
+    live = select(*keys, func.sum(OrderItem.quantity).label('quantity'),
+                  func.sum(OrderItem.quantity * OrderItem.price_at_purchase).label('revenue'))
+    archived = select(*keys, func.sum(MonthlyProductRollup.quantity), func.sum(MonthlyProductRollup.revenue))
+    for target, onclause in joins:
+        live, archived = live.join(target, onclause), archived.join(target, onclause)
+    # Joined on both columns, so Postgres joins order_items to orders partition by partition
+    live = live.join(OrderItem, Product.id == OrderItem.product_id)\
+        .join(Order, Order.items.expression)\
+        .where(Order.status.in_(SOLD_STATUSES))\
+        .group_by(*keys)
+    archived = archived.join(MonthlyProductRollup, Product.id == MonthlyProductRollup.product_id)\
+        .group_by(*keys)
+    return union_all(live, archived).subquery('sold')
+
 def require_reports_access():
     """Check if user has access to reports (Admin and Advanced users)"""
     claims = get_jwt()
@@ -16,7 +53,9 @@ def require_reports_access():
     return True
 
 @bp.route('/earnings/daily', methods=['GET'])
+@query_budget(3)
 @jwt_required()
+@coalesce(vary_on_role=True)
 def daily_earnings():
     """Get daily earnings report"""
     if not require_reports_access():
@@ -37,26 +76,39 @@ def daily_earnings():
     end_of_day = datetime.combine(target_date, datetime.max.time())
     
     # Query orders for the day
-    orders = Order.query.filter(
+    orders = Order.query.options(*Order.eager_options(include_items=False)).filter(
         and_(
             Order.created_at >= start_of_day,
             Order.created_at <= end_of_day,
-            Order.status.in_(['confirmed', 'shipped', 'delivered'])
+            Order.status.in_(SOLD_STATUSES)
         )
     ).all()
     
     total_earnings = sum(order.total_amount for order in orders)
     total_orders = len(orders)
     
+    # An archived day has no orders left to list, only its totals
+    archived = False
+    if not orders:
+        archived_orders, archived_earnings = db.session.query(
+            func.sum(DailyOrderRollup.orders), func.sum(DailyOrderRollup.total_amount)
+        ).filter(DailyOrderRollup.day == target_date, DailyOrderRollup.status.in_(SOLD_STATUSES)).one()
+        if archived_orders:
+            archived = True
+            total_orders, total_earnings = int(archived_orders), archived_earnings
+    
     return jsonify({
         'date': target_date.isoformat(),
         'total_earnings': round(total_earnings, 2),
         'total_orders': total_orders,
-        'orders': [order.to_dict(include_items=False) for order in orders]
+        'orders': [order.to_dict(include_items=False) for order in orders],
+        'archived': archived
     }), 200
 
 @bp.route('/earnings/monthly', methods=['GET'])
+@query_budget(2)
 @jwt_required()
+@coalesce(vary_on_role=True)
 def monthly_earnings():
     """Get monthly earnings report"""
     if not require_reports_access():
@@ -77,26 +129,19 @@ def monthly_earnings():
     else:
         end_of_month = datetime(year, month + 1, 1) - timedelta(seconds=1)
     
-    # Query orders for the month
-    orders = Order.query.filter(
-        and_(
-            Order.created_at >= start_of_month,
-            Order.created_at <= end_of_month,
-            Order.status.in_(['confirmed', 'shipped', 'delivered'])
-        )
-    ).all()
+    # Totals per day, summed by the database
+    sold = sold_by_day(start_of_month, end_of_month)
+    days = db.session.query(sold.c.day, func.sum(sold.c.orders), func.sum(sold.c.earnings))\
+        .group_by(sold.c.day)\
+        .order_by(sold.c.day)\
+        .all()
     
-    total_earnings = sum(order.total_amount for order in orders)
-    total_orders = len(orders)
-    
-    # Group by day
-    daily_breakdown = {}
-    for order in orders:
-        day = order.created_at.date().isoformat()
-        if day not in daily_breakdown:
-            daily_breakdown[day] = {'earnings': 0, 'orders': 0}
-        daily_breakdown[day]['earnings'] += order.total_amount
-        daily_breakdown[day]['orders'] += 1
+    daily_breakdown = {
+        day.isoformat(): {'earnings': earnings, 'orders': int(orders)}
+        for day, orders, earnings in days
+    }
+    total_earnings = sum(day['earnings'] for day in daily_breakdown.values())
+    total_orders = sum(day['orders'] for day in daily_breakdown.values())
     
     return jsonify({
         'year': year,
@@ -107,7 +152,9 @@ def monthly_earnings():
     }), 200
 
 @bp.route('/earnings/range', methods=['GET'])
+@query_budget(2)
 @jwt_required()
+@coalesce(vary_on_role=True)
 def earnings_by_range():
     """Get earnings for a date range"""
     if not require_reports_access():
@@ -129,27 +176,21 @@ def earnings_by_range():
     if start_date > end_date:
         return jsonify({'error': 'start_date must be before end_date'}), 400
     
-    # Query orders for the range
-    orders = Order.query.filter(
-        and_(
-            Order.created_at >= start_date,
-            Order.created_at <= end_date,
-            Order.status.in_(['confirmed', 'shipped', 'delivered'])
-        )
-    ).all()
-    
-    total_earnings = sum(order.total_amount for order in orders)
-    total_orders = len(orders)
+    # Totals for the range, summed by the database
+    sold = sold_by_day(start_date, end_date)
+    total_orders, total_earnings = db.session.query(func.sum(sold.c.orders), func.sum(sold.c.earnings)).one()
     
     return jsonify({
         'start_date': start_date.date().isoformat(),
         'end_date': end_date.date().isoformat(),
-        'total_earnings': round(total_earnings, 2),
-        'total_orders': total_orders
+        'total_earnings': round(total_earnings or 0, 2),
+        'total_orders': int(total_orders or 0)
     }), 200
 
 @bp.route('/top-selling-products', methods=['GET'])
+@query_budget(2)
 @jwt_required()
+@coalesce(vary_on_role=True)
 def top_selling_products():
     """Get top selling products"""
     if not require_reports_access():
@@ -158,16 +199,14 @@ def top_selling_products():
     limit = request.args.get('limit', type=int, default=10)
     
     # Query to get top selling products
+    sold = sold_by([Product.id, Product.name])
     top_products = db.session.query(
-        Product.id,
-        Product.name,
-        func.sum(OrderItem.quantity).label('total_sold'),
-        func.sum(OrderItem.quantity * OrderItem.price_at_purchase).label('total_revenue')
-    ).join(OrderItem, Product.id == OrderItem.product_id)\
-     .join(Order, OrderItem.order_id == Order.id)\
-     .filter(Order.status.in_(['confirmed', 'shipped', 'delivered']))\
-     .group_by(Product.id, Product.name)\
-     .order_by(func.sum(OrderItem.quantity).desc())\
+        sold.c.id,
+        sold.c.name,
+        func.sum(sold.c.quantity).label('total_sold'),
+        func.sum(sold.c.revenue).label('total_revenue')
+    ).group_by(sold.c.id, sold.c.name)\
+     .order_by(func.sum(sold.c.quantity).desc())\
      .limit(limit)\
      .all()
     
@@ -176,7 +215,7 @@ def top_selling_products():
         results.append({
             'product_id': product.id,
             'product_name': product.name,
-            'total_sold': product.total_sold,
+            'total_sold': int(product.total_sold),
             'total_revenue': round(float(product.total_revenue), 2)
         })
     
@@ -186,7 +225,9 @@ def top_selling_products():
     }), 200
 
 @bp.route('/sales-by-category', methods=['GET'])
+@query_budget(2)
 @jwt_required()
+@coalesce(vary_on_role=True)
 def sales_by_category():
     """Get sales breakdown by category"""
     if not require_reports_access():
@@ -195,23 +236,20 @@ def sales_by_category():
     from app.models import Category
     
     # Query sales by category
+    sold = sold_by([Category.name], [(Product, Category.id == Product.category_id)])
     category_sales = db.session.query(
-        Category.name,
-        func.sum(OrderItem.quantity).label('total_quantity'),
-        func.sum(OrderItem.quantity * OrderItem.price_at_purchase).label('total_revenue')
-    ).join(Product, Category.id == Product.category_id)\
-     .join(OrderItem, Product.id == OrderItem.product_id)\
-     .join(Order, OrderItem.order_id == Order.id)\
-     .filter(Order.status.in_(['confirmed', 'shipped', 'delivered']))\
-     .group_by(Category.name)\
-     .order_by(func.sum(OrderItem.quantity * OrderItem.price_at_purchase).desc())\
+        sold.c.name,
+        func.sum(sold.c.quantity).label('total_quantity'),
+        func.sum(sold.c.revenue).label('total_revenue')
+    ).group_by(sold.c.name)\
+     .order_by(func.sum(sold.c.revenue).desc())\
      .all()
     
     results = []
     for category in category_sales:
         results.append({
             'category': category.name,
-            'total_quantity_sold': category.total_quantity,
+            'total_quantity_sold': int(category.total_quantity),
             'total_revenue': round(float(category.total_revenue), 2)
         })
     
@@ -220,7 +258,9 @@ def sales_by_category():
     }), 200
 
 @bp.route('/sales-by-brand', methods=['GET'])
+@query_budget(2)
 @jwt_required()
+@coalesce(vary_on_role=True)
 def sales_by_brand():
     """Get sales breakdown by brand"""
     if not require_reports_access():
@@ -229,23 +269,20 @@ def sales_by_brand():
     from app.models import Brand
     
     # Query sales by brand
+    sold = sold_by([Brand.name], [(Product, Brand.id == Product.brand_id)])
     brand_sales = db.session.query(
-        Brand.name,
-        func.sum(OrderItem.quantity).label('total_quantity'),
-        func.sum(OrderItem.quantity * OrderItem.price_at_purchase).label('total_revenue')
-    ).join(Product, Brand.id == Product.brand_id)\
-     .join(OrderItem, Product.id == OrderItem.product_id)\
-     .join(Order, OrderItem.order_id == Order.id)\
-     .filter(Order.status.in_(['confirmed', 'shipped', 'delivered']))\
-     .group_by(Brand.name)\
-     .order_by(func.sum(OrderItem.quantity * OrderItem.price_at_purchase).desc())\
+        sold.c.name,
+        func.sum(sold.c.quantity).label('total_quantity'),
+        func.sum(sold.c.revenue).label('total_revenue')
+    ).group_by(sold.c.name)\
+     .order_by(func.sum(sold.c.revenue).desc())\
      .all()
     
     results = []
     for brand in brand_sales:
         results.append({
             'brand': brand.name,
-            'total_quantity_sold': brand.total_quantity,
+            'total_quantity_sold': int(brand.total_quantity),
             'total_revenue': round(float(brand.total_revenue), 2)
         })
     
@@ -254,23 +291,30 @@ def sales_by_brand():
     }), 200
 
 @bp.route('/order-status-summary', methods=['GET'])
+@query_budget(2)
 @jwt_required()
+@coalesce(vary_on_role=True)
 def order_status_summary():
     """Get summary of orders by status"""
     if not require_reports_access():
         return jsonify({'error': 'Insufficient permissions'}), 403
     
-    # Query order counts by status
+    # Query order counts by status, live and archived
+    live = select(Order.status, func.count(Order.id).label('count'), func.sum(Order.total_amount).label('total_amount'))\
+        .group_by(Order.status)
+    archived = select(DailyOrderRollup.status, func.sum(DailyOrderRollup.orders), func.sum(DailyOrderRollup.total_amount))\
+        .group_by(DailyOrderRollup.status)
+    statuses = union_all(live, archived).subquery()
     status_summary = db.session.query(
-        Order.status,
-        func.count(Order.id).label('count'),
-        func.sum(Order.total_amount).label('total_amount')
-    ).group_by(Order.status).all()
+        statuses.c.status,
+        func.sum(statuses.c.count).label('count'),
+        func.sum(statuses.c.total_amount).label('total_amount')
+    ).group_by(statuses.c.status).all()
     
     results = {}
     for status in status_summary:
         results[status.status] = {
-            'count': status.count,
+            'count': int(status.count),
             'total_amount': round(float(status.total_amount), 2)
         }
     
@@ -1,11 +1,13 @@
 from flask import Blueprint, request, jsonify
 from flask_jwt_extended import jwt_required, get_jwt, get_jwt_identity
 from app.extensions import db
+from app.querybudget import query_budget
 from app.models import User
 
 bp = Blueprint('users', __name__, url_prefix='/api/users')
 
 @bp.route('/', methods=['GET'])
+@query_budget(2)
 @jwt_required()
 def get_users():
     """Get all users (Admin only)"""
@@ -19,6 +21,7 @@ def get_users():
     return jsonify([user.to_dict() for user in users]), 200
 
 @bp.route('/<int:user_id>', methods=['GET'])
+@query_budget(2)
 @jwt_required()
 def get_user(user_id):
     """Get single user (Admin only)"""
@@ -35,6 +38,7 @@ def get_user(user_id):
     return jsonify(user.to_dict()), 200
 
 @bp.route('/<int:user_id>', methods=['PUT'])
+@query_budget(4)
 @jwt_required()
 def update_user(user_id):
     """Update user (Admin only)"""
@@ -69,6 +73,7 @@ def update_user(user_id):
     }), 200
 
 @bp.route('/<int:user_id>', methods=['DELETE'])
+@query_budget(3)
 @jwt_required()
 def delete_user(user_id):
     """Delete user (Admin only)"""
@@ -0,0 +1,185 @@
+"""Slow-query log: statements over SLOW_QUERY_MS, grouped by fingerprint.
+
+Each fingerprint keeps its count, total and worst time, the endpoints that
+issued it and the shape of its bound parameters. The plan of the worst
+execution is captured by a background thread, with EXPLAIN (FORMAT JSON) on
+Postgres and EXPLAIN QUERY PLAN elsewhere, so the request that ran the slow
+statement never waits for it. Entries are per worker process and served on
+/api/admin/slow-queries.
+"""
+import hashlib
+import logging
+import os
+import queue
+import re
+import threading
+import time
+from collections import Counter, OrderedDict
+from datetime import datetime
+from flask import current_app, has_request_context, request
+from app import metrics
+
+logger = logging.getLogger(__name__)
+
+EXPLAINABLE = ('SELECT', 'WITH', 'INSERT', 'UPDATE', 'DELETE')
+
+_STRING = re.compile(r"'(?:[^']|'')*'")
+_NUMBER = re.compile(r'\b\d+(?:\.\d+)?\b')
+_PLACEHOLDER = re.compile(r'%\(\w+\)s|%s|\?|(?<!:):\w+')
+_IN_LIST = re.compile(r'\(\s*\?(?:\s*,\s*\?)*\s*\)')
+
+
+def normalize(statement):
+    """Statement text with literals and placeholders replaced by ?, and IN lists collapsed"""
+    text = ' '.join(statement.split())
+    text = _STRING.sub('?', text)
+    text = _PLACEHOLDER.sub('?', text)
+    text = _NUMBER.sub('?', text)
+    return _IN_LIST.sub('(...)', text)
+
+
+def fingerprint(normalized):
+    return hashlib.sha1(normalized.encode()).hexdigest()[:16]
+
+
+def parameter_shape(parameters, executemany):
+    """Types of the bound parameters, without their values"""
+    if executemany:
+        rows = list(parameters or [])
+        return {'executemany': len(rows), 'row': parameter_shape(rows[0], False) if rows else None}
+    if isinstance(parameters, dict):
+        return {key: type(value).__name__ for key, value in parameters.items()}
+    if isinstance(parameters, (list, tuple)):
+        return [type(value).__name__ for value in parameters]
+    return None
+
+
+class SlowQueryLog:
+    def __init__(self, threshold_ms, max_entries, explain, explain_interval):
+        self.threshold = threshold_ms / 1000
+        self.max_entries = max_entries
+        self.explain = explain
+        self.explain_interval = explain_interval
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.engine = None
+        self.queue = None
+        self.worker_pid = None
+        self.local = threading.local()
+
+    def record(self, statement, parameters, executemany, elapsed, dialect):
+        normalized = normalize(statement)
+        key = fingerprint(normalized)
+        endpoint = request.endpoint if has_request_context() else None
+        elapsed_ms = round(elapsed * 1000, 2)
+        now = time.time()
+        explain = False
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                entry = self.entries[key] = {
+                    'fingerprint': key,
+                    'statement': normalized,
+                    'count': 0,
+                    'total_ms': 0.0,
+                    'max_ms': 0.0,
+                    'endpoints': Counter(),
+                    'parameters': parameter_shape(parameters, executemany),
+                    'plan': None,
+                    'plan_for_ms': None,
+                    'explained_at': 0.0,
+                }
+                while len(self.entries) > self.max_entries:
+                    self.entries.popitem(last=False)
+            self.entries.move_to_end(key)
+            entry['count'] += 1
+            entry['total_ms'] = round(entry['total_ms'] + elapsed_ms, 2)
+            entry['last_seen'] = datetime.utcnow().isoformat() + 'Z'
+            entry['endpoints'][endpoint or '-'] += 1
+            if elapsed_ms > entry['max_ms']:
+                entry['max_ms'] = elapsed_ms
+                # Re-explain a new worst case, at most once per interval per fingerprint
+                if (self.explain and not executemany and now - entry['explained_at'] >= self.explain_interval
+                        and statement.lstrip().upper().startswith(EXPLAINABLE)):
+                    entry['explained_at'] = now
+                    explain = True
+        logger.warning('Slow query (%.1f ms) in %s [%s]: %s', elapsed_ms, endpoint or '-', key, normalized[:300])
+        if explain:
+            self.enqueue(key, statement, parameters, elapsed_ms, dialect)
+
+    def enqueue(self, key, statement, parameters, elapsed_ms, dialect):
+        if self.worker_pid != os.getpid():
+            # First use in this (possibly forked) process
+            self.worker_pid = os.getpid()
+            self.queue = queue.Queue(maxsize=100)
+            threading.Thread(target=self.explain_loop, name='slowlog-explain', daemon=True).start()
+        try:
+            self.queue.put_nowait((key, statement, parameters, elapsed_ms, dialect))
+        except queue.Full:
+            pass
+
+    def explain_loop(self):
+        while True:
+            key, statement, parameters, elapsed_ms, dialect = self.queue.get()
+            prefix = 'EXPLAIN (FORMAT JSON) ' if dialect == 'postgresql' else 'EXPLAIN QUERY PLAN '
+            self.local.explaining = True
+            try:
+                with self.engine.connect() as conn:
+                    rows = conn.exec_driver_sql(prefix + statement, parameters).fetchall()
+                    conn.rollback()
+                plan = rows[0][0] if dialect == 'postgresql' else [list(row) for row in rows]
+            except Exception as error:
+                plan = {'error': str(error)}
+            finally:
+                self.local.explaining = False
+            with self.lock:
+                entry = self.entries.get(key)
+                if entry is not None:
+                    entry['plan'] = plan
+                    entry['plan_for_ms'] = elapsed_ms
+
+    def snapshot(self):
+        """Entries sorted by worst time, without plans"""
+        with self.lock:
+            entries = [dict(entry, endpoints=dict(entry['endpoints'])) for entry in self.entries.values()]
+        for entry in entries:
+            entry['has_plan'] = entry.pop('plan') is not None
+            entry.pop('explained_at')
+        return sorted(entries, key=lambda entry: entry['max_ms'], reverse=True)
+
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return None
+            entry = dict(entry, endpoints=dict(entry['endpoints']))
+        entry.pop('explained_at')
+        return entry
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+    def observe(self, conn, statement, parameters, executemany, elapsed):
+        if elapsed >= self.threshold and not getattr(self.local, 'explaining', False):
+            self.record(statement, parameters, executemany, elapsed, conn.dialect.name)
+
+
+def get_slow_log():
+    return current_app.extensions['slow_query_log']
+
+
+def init_app(app):
+    log = app.extensions['slow_query_log'] = SlowQueryLog(
+        app.config['SLOW_QUERY_MS'],
+        app.config['SLOW_QUERY_MAX_ENTRIES'],
+        app.config['SLOW_QUERY_EXPLAIN'],
+        app.config['SLOW_QUERY_EXPLAIN_INTERVAL'],
+    )
+    if not app.config['SLOW_QUERY_MS']:
+        return
+
+    from app.extensions import db
+    with app.app_context():
+        log.engine = db.engine
+    metrics.observe_statements(app, log.observe)
@@ -1,5 +1,6 @@
 const API_BASE = '/api';
 let token = null;
+let refreshToken = null;
 let currentUser = null;
 let cart = [];
 let categories = [];
@@ -22,6 +23,7 @@ document.getElementById('loginForm').addEventListener('submit', async (e) => {
         
         if (response.ok) {
             token = data.access_token;
+            refreshToken = data.refresh_token;
             currentUser = data.user;
             document.getElementById('loginPage').classList.add('hidden');
             document.getElementById('mainApp').classList.remove('hidden');
@@ -46,8 +48,44 @@ document.getElementById('loginForm').addEventListener('submit', async (e) => {
     }
 });
 
+// Fetch with the access token, renewing it once via the refresh token on 401
+async function authFetch(url, options = {}) {
+    const send = () => fetch(url, {
+        ...options,
+        headers: { ...(options.headers || {}), 'Authorization': `Bearer ${token}` }
+    });
+    let response = await send();
+    if (response.status === 401 && refreshToken && await renewTokens()) {
+        response = await send();
+    }
+    return response;
+}
+
+async function renewTokens() {
+    const response = await fetch(`${API_BASE}/auth/refresh`, {
+        method: 'POST',
+        headers: { 'Authorization': `Bearer ${refreshToken}` }
+    });
+    if (!response.ok) return false;
+    const data = await response.json();
+    token = data.access_token;
+    refreshToken = data.refresh_token;
+    return true;
+}
+
 function logout() {
+    if (token) {
+        fetch(`${API_BASE}/auth/logout`, {
+            method: 'POST',
+            headers: {
+                'Content-Type': 'application/json',
+                'Authorization': `Bearer ${token}`
+            },
+            body: JSON.stringify({ refresh_token: refreshToken })
+        }).catch(() => {});
+    }
     token = null;
+    refreshToken = null;
     currentUser = null;
     cart = [];
     document.getElementById('loginPage').classList.remove('hidden');
@@ -78,52 +116,65 @@ function showTab(tabName) {
 }
 
 // ==================== INITIAL DATA ====================
+// Categories, brands and products in one round trip
 async function loadInitialData() {
-    await loadCategories();
-    await loadBrands();
-    await loadProducts();
-}
-
-async function loadCategories() {
     try {
-        const response = await fetch(`${API_BASE}/products/categories`);
-        categories = await response.json();
-        
-        const selects = ['searchCategory', 'productCategory'];
-        selects.forEach(id => {
-            const select = document.getElementById(id);
-            select.innerHTML = '<option value="">All Categories</option>';
-            categories.forEach(cat => {
-                const option = document.createElement('option');
-                option.value = cat.id;
-                option.textContent = cat.name;
-                select.appendChild(option);
-            });
-        });
+        const [categoryList, brandList, products] = await batchFetch([
+            { path: '/api/products/categories' },
+            { path: '/api/products/brands' },
+            { path: '/api/products/' }
+        ]);
+        showCategories(categoryList);
+        showBrands(brandList);
+        displayProducts(products, 'productsGrid');
     } catch (error) {
-        console.error('Error loading categories:', error);
+        showMessage('messageContainer', 'Error loading data: ' + error.message, 'error');
     }
 }
 
-async function loadBrands() {
-    try {
-        const response = await fetch(`${API_BASE}/products/brands`);
-        brands = await response.json();
-        
-        const selects = ['searchBrand', 'productBrand'];
-        selects.forEach(id => {
-            const select = document.getElementById(id);
-            select.innerHTML = '<option value="">All Brands</option>';
-            brands.forEach(brand => {
-                const option = document.createElement('option');
-                option.value = brand.id;
-                option.textContent = brand.name;
-                select.appendChild(option);
-            });
+// Run GET sub-requests through POST /api/batch; resolves to their bodies, in order
+async function batchFetch(requests) {
+    const response = await authFetch(`${API_BASE}/batch`, {
+        method: 'POST',
+        headers: { 'Content-Type': 'application/json' },
+        body: JSON.stringify({ requests, parallel: true })
+    });
+    const data = await response.json();
+    if (!response.ok) throw new Error(data.error);
+    return data.responses.map(item => {
+        if (item.status >= 400) throw new Error(item.body.error || `${item.status} from ${item.id}`);
+        return item.body;
+    });
+}
+
+function showCategories(list) {
+    categories = list;
+    const selects = ['searchCategory', 'productCategory'];
+    selects.forEach(id => {
+        const select = document.getElementById(id);
+        select.innerHTML = '<option value="">All Categories</option>';
+        categories.forEach(cat => {
+            const option = document.createElement('option');
+            option.value = cat.id;
+            option.textContent = cat.name;
+            select.appendChild(option);
         });
-    } catch (error) {
-        console.error('Error loading brands:', error);
-    }
+    });
+}
+
+function showBrands(list) {
+    brands = list;
+    const selects = ['searchBrand', 'productBrand'];
+    selects.forEach(id => {
+        const select = document.getElementById(id);
+        select.innerHTML = '<option value="">All Brands</option>';
+        brands.forEach(brand => {
+            const option = document.createElement('option');
+            option.value = brand.id;
+            option.textContent = brand.name;
+            select.appendChild(option);
+        });
+    });
 }
 
 // ==================== PRODUCTS ====================
@@ -199,12 +250,65 @@ async function performSearch() {
     }
 }
 
+// Type-ahead: one lookup per keystroke, ignoring answers to older keystrokes
+let suggestions = [];
+let suggestSequence = 0;
+
+async function suggest(event) {
+    const input = event.target;
+    const picked = suggestions.find(item => item.name === input.value);
+    if (picked) {
+        openSuggestion(picked);
+        return;
+    }
+    const prefix = input.value.trim();
+    const sequence = ++suggestSequence;
+    if (!prefix) {
+        document.getElementById('suggestions').innerHTML = '';
+        return;
+    }
+    try {
+        const response = await fetch(`${API_BASE}/products/suggest?prefix=${encodeURIComponent(prefix)}`);
+        if (!response.ok || sequence !== suggestSequence) return;
+        suggestions = (await response.json()).suggestions;
+        const list = document.getElementById('suggestions');
+        list.innerHTML = '';
+        suggestions.forEach(item => {
+            const option = document.createElement('option');
+            option.value = item.name;
+            option.label = item.type;
+            list.appendChild(option);
+        });
+    } catch (error) {
+        // Suggestions are a convenience; typing goes on without them
+    }
+}
+
+async function openSuggestion(item) {
+    if (item.type === 'product') {
+        try {
+            const response = await fetch(`${API_BASE}/products/${item.id}`);
+            displayProducts([await response.json()], 'searchResults');
+        } catch (error) {
+            showMessage('messageContainer', 'Error: ' + error.message, 'error');
+        }
+        return;
+    }
+    document.getElementById(item.type === 'brand' ? 'searchBrand' : 'searchCategory').value = item.id;
+    performSearch();
+}
+
+document.getElementById('searchSuggest').addEventListener('input', suggest);
+
 async function viewProductDetails(productId) {
     try {
-        const response = await fetch(`${API_BASE}/products/${productId}/quantity`);
-        const data = await response.json();
+        const [data, related] = await batchFetch([
+            { path: `/api/products/${productId}/quantity` },
+            { path: `/api/products/${productId}/related?limit=3` }
+        ]);
+        const together = related.related.map(item => item.name).join(', ') || 'No data yet';
         // Simple alert for details as per existing code style, consider a modal in future
-        alert(`Product Details:\n\nName: ${data.name}\nInitial Quantity: ${data.initial_quantity}\nSold: ${data.sold_quantity}\nAvailable: ${data.current_quantity}\nStatus: ${data.in_stock ? 'In Stock' : 'Out of Stock'}`);
+        alert(`Product Details:\n\nName: ${data.name}\nInitial Quantity: ${data.initial_quantity}\nSold: ${data.sold_quantity}\nAvailable: ${data.current_quantity}\nStatus: ${data.in_stock ? 'In Stock' : 'Out of Stock'}\n\nFrequently bought together: ${together}`);
     } catch (error) {
         showMessage('messageContainer', 'Error: ' + error.message, 'error');
     }
@@ -234,7 +338,7 @@ document.getElementById('addProductForm').addEventListener('submit', async (e) =
     };
 
     try {
-        const response = await fetch(`${API_BASE}/products`, {
+        const response = await authFetch(`${API_BASE}/products`, {
             method: 'POST',
             headers: {
                 'Content-Type': 'application/json',
@@ -327,7 +431,7 @@ async function checkout() {
 
     try {
         const orderData = { items: cart.map(i => ({ product_id: i.product_id, quantity: i.quantity })) };
-        const response = await fetch(`${API_BASE}/orders`, {
+        const response = await authFetch(`${API_BASE}/orders`, {
             method: 'POST',
             headers: {
                 'Content-Type': 'application/json',
@@ -357,7 +461,7 @@ async function loadOrders() {
     container.innerHTML = '<p>Loading orders...</p>';
     
     try {
-        const response = await fetch(`${API_BASE}/orders`, {
+        const response = await authFetch(`${API_BASE}/orders`, {
             headers: { 'Authorization': `Bearer ${token}` }
         });
         const orders = await response.json();
@@ -392,7 +496,7 @@ async function loadReports() {
     
     try {
         // Assuming generic analytics endpoint
-        const response = await fetch(`${API_BASE}/reports/dashboard`, { // ADJUST IF NEEDED
+        const response = await authFetch(`${API_BASE}/reports/dashboard`, { // ADJUST IF NEEDED
             headers: { 'Authorization': `Bearer ${token}` }
         });
         
@@ -439,7 +543,7 @@ async function loadUsers() {
     container.innerHTML = '<p>Loading users...</p>';
     
     try {
-        const response = await fetch(`${API_BASE}/users`, {
+        const response = await authFetch(`${API_BASE}/users`, {
             headers: { 'Authorization': `Bearer ${token}` }
         });
         const users = await response.json();
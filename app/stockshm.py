@@ -0,0 +1,278 @@
+"""Per-pod stock table in shared memory.
+
+A file under /dev/shm (STOCK_SHM_PATH) is memory-mapped by every worker on
+the pod and holds one fixed-size slot per product id:
+
+    seq | initial_quantity | sold | loaded_at_ms
+
+seq is a per-slot version counter used as a seqlock: writers make it odd,
+write, then make it even again, and a reader retries when it saw an odd or
+changed seq. Writers take a flock on the file (plus a thread lock, since
+flock does not exclude threads of one process).
+
+Slots are filled from the database on a miss and by checkout, which already
+computes authoritative stock for its cart. A value read from the database
+is only stored if the slot's seq is still the one taken before the read.
+Status changes and order deletions bump the seq of their products' slots
+before they commit and evict the slots after it, so a value read before the
+commit is either refused or evicted, never served. A slot loaded more than
+STOCK_SHM_MAX_AGE seconds ago counts as a miss, which bounds how long a
+change made by another pod can go unseen; on Postgres, app/invalidation.py
+also evicts such slots as soon as the other pod commits. Reads are for
+display only; checkout still validates against the database.
+"""
+import fcntl
+import functools
+import mmap
+import os
+import struct
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from flask import current_app
+from app import invalidation
+
+SOLD_STATUSES = ('confirmed', 'shipped', 'delivered')
+
+MAGIC = b'WSSTOCK1'
+HEADER = struct.Struct('<8sQ')  # magic, slots
+SLOT = struct.Struct('<Qqqq')  # seq, initial_quantity, sold, loaded_at_ms
+SEQ = struct.Struct('<Q')
+VALUES = struct.Struct('<qqq')
+
+
+def now_ms():
+    return int(time.time() * 1000)
+
+
+class StockTable:
+    def __init__(self, path, slots, max_age):
+        self.path = path
+        self.slots = slots
+        self.max_age_ms = int(max_age * 1000)
+        self.size = HEADER.size + slots * SLOT.size
+        self.lock = threading.Lock()
+        self.names = OrderedDict()
+        self.pid = None
+        self.open()
+
+    def open(self):
+        """Map the file, (re)initializing it if it is new or has another layout"""
+        self.fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o600)
+        fcntl.flock(self.fd, fcntl.LOCK_EX)
+        try:
+            if os.fstat(self.fd).st_size >= HEADER.size:
+                magic, slots = HEADER.unpack(os.pread(self.fd, HEADER.size, 0))
+            else:
+                magic, slots = None, None
+            if magic != MAGIC or slots != self.slots:
+                os.ftruncate(self.fd, 0)
+                os.ftruncate(self.fd, self.size)
+                os.pwrite(self.fd, HEADER.pack(MAGIC, self.slots), 0)
+        finally:
+            fcntl.flock(self.fd, fcntl.LOCK_UN)
+        self.map = mmap.mmap(self.fd, self.size)
+        self.pid = os.getpid()
+
+    def ensure_open(self):
+        # A forked worker needs its own file description, or flock would not exclude the others
+        if self.pid != os.getpid():
+            with self.lock:
+                if self.pid != os.getpid():
+                    self.open()
+
+    def offset(self, product_id):
+        if 0 < product_id < self.slots:
+            return HEADER.size + product_id * SLOT.size
+        return None
+
+    @contextmanager
+    def writing(self):
+        self.ensure_open()
+        with self.lock:
+            fcntl.flock(self.fd, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(self.fd, fcntl.LOCK_UN)
+
+    def write_slot(self, offset, initial, sold, loaded_at):
+        seq = SEQ.unpack_from(self.map, offset)[0]
+        SEQ.pack_into(self.map, offset, seq + 1)
+        VALUES.pack_into(self.map, offset + SEQ.size, initial, sold, loaded_at)
+        SEQ.pack_into(self.map, offset, seq + 2)
+
+    def read(self, product_id):
+        """(initial_quantity, sold) if the slot is loaded and fresh, else None"""
+        offset = self.offset(product_id)
+        if offset is None:
+            return None
+        self.ensure_open()
+        for _ in range(5):
+            seq, initial, sold, loaded_at = SLOT.unpack_from(self.map, offset)
+            if seq & 1 or SEQ.unpack_from(self.map, offset)[0] != seq:
+                continue
+            if not loaded_at or now_ms() - loaded_at > self.max_age_ms:
+                return None
+            return initial, sold
+        return None
+
+    def versions(self, product_ids):
+        """{product_id: seq} of the slots, to take before reading their values from the database"""
+        self.ensure_open()
+        return {
+            product_id: SEQ.unpack_from(self.map, offset)[0]
+            for product_id, offset in ((product_id, self.offset(product_id)) for product_id in product_ids)
+            if offset is not None
+        }
+
+    def store(self, values, versions):
+        """Load slots from authoritative {product_id: (initial_quantity, sold)}, read after versions()"""
+        loaded_at = now_ms()
+        with self.writing():
+            for product_id, (initial, sold) in values.items():
+                offset = self.offset(product_id)
+                # Written since versions() was taken: the value may predate that write
+                if offset is not None and SEQ.unpack_from(self.map, offset)[0] == versions.get(product_id):
+                    self.write_slot(offset, initial, sold, loaded_at)
+
+    def touch(self, product_ids):
+        """Bump the seq of slots about to change, so values read before the change are not stored"""
+        with self.writing():
+            for product_id in product_ids:
+                offset = self.offset(product_id)
+                if offset is not None:
+                    self.write_slot(offset, *SLOT.unpack_from(self.map, offset)[1:])
+
+    def invalidate(self, product_ids):
+        with self.writing():
+            for product_id in product_ids:
+                offset = self.offset(product_id)
+                if offset is not None:
+                    self.write_slot(offset, 0, 0, 0)
+                self.names.pop(product_id, None)
+
+    def clear(self):
+        with self.writing():
+            for product_id in range(1, self.slots):
+                offset = self.offset(product_id)
+                if SLOT.unpack_from(self.map, offset)[3]:
+                    self.write_slot(offset, 0, 0, 0)
+            self.names.clear()
+
+    def name(self, product_id):
+        """Product name cached by this worker, under the same age limit"""
+        entry = self.names.get(product_id)
+        if entry is None or now_ms() - entry[1] > self.max_age_ms:
+            return None
+        return entry[0]
+
+    def remember_name(self, product_id, name):
+        with self.lock:
+            self.names[product_id] = (name, now_ms())
+            self.names.move_to_end(product_id)
+            while len(self.names) > self.slots:
+                self.names.popitem(last=False)
+
+
+def get_stock_table():
+    """The pod's StockTable, or None when STOCK_SHM_PATH is unset"""
+    return current_app.extensions.get('stock_table')
+
+
+def current_quantities(products):
+    """Product.current_quantities() served from the stock table where fresh"""
+    from app.models import Product
+    table = get_stock_table()
+    if table is None:
+        return Product.current_quantities(products)
+    quantities, missing = {}, []
+    for product in products:
+        cached = table.read(product.id)
+        if cached is None:
+            missing.append(product)
+        else:
+            quantities[product.id] = cached[0] - cached[1]
+    if missing:
+        taken = versions(product.id for product in missing)
+        loaded = Product.current_quantities(missing)
+        remember(missing, loaded, taken)
+        quantities.update(loaded)
+    return quantities
+
+
+def versions(product_ids):
+    """Slot versions to pass to remember() or remember_quantity(); take them before the database read"""
+    table = get_stock_table()
+    return {} if table is None else table.versions(product_ids)
+
+
+def remember(products, quantities, versions):
+    """Store stock just computed from the database"""
+    table = get_stock_table()
+    if table is not None:
+        table.store({
+            product.id: (product.initial_quantity, product.initial_quantity - quantities[product.id])
+            for product in products
+        }, versions)
+
+
+def cached_quantity(product_id):
+    """(name, initial_quantity, sold) for /quantity without a query, or None"""
+    table = get_stock_table()
+    if table is None:
+        return None
+    cached = table.read(product_id)
+    name = table.name(product_id) if cached else None
+    if name is None:
+        return None
+    return (name,) + cached
+
+
+def remember_quantity(product, sold, versions):
+    table = get_stock_table()
+    if table is not None:
+        table.store({product.id: (product.initial_quantity, sold)}, versions)
+        table.remember_name(product.id, product.name)
+
+
+def sold_changing(order, old_status, new_status):
+    """Before committing an order's move into or out of the sold statuses, touch its products' slots.
+
+    Returns the product ids to invalidate() once the commit is done; new_status
+    is None for a deleted order.
+    """
+    table = get_stock_table()
+    if table is None or (new_status in SOLD_STATUSES) == (old_status in SOLD_STATUSES):
+        return []
+    product_ids = sorted({item.product_id for item in order.items})
+    table.touch(product_ids)
+    return product_ids
+
+
+def invalidate(product_ids):
+    table = get_stock_table()
+    if table is not None:
+        table.invalidate(product_ids)
+
+
+def evict(table, change):
+    """Drop slots another pod changed, and names any worker changed"""
+    if change.ids is None:
+        table.clear()
+    elif change.entity == 'product' or not invalidation.from_this_pod(change):
+        # This pod's writers already updated the shared slots themselves
+        table.invalidate(change.ids)
+
+
+def init_app(app):
+    if not app.config['STOCK_SHM_PATH']:
+        return
+    table = app.extensions['stock_table'] = StockTable(
+        app.config['STOCK_SHM_PATH'],
+        app.config['STOCK_SHM_SLOTS'],
+        app.config['STOCK_SHM_MAX_AGE'],
+    )
+    for entity in ('product', 'stock'):
+        invalidation.subscribe(app, entity, functools.partial(evict, table))
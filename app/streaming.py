@@ -0,0 +1,70 @@
+"""Streamed JSON arrays for large collection responses.
+
+Rows are read in primary-key order, STREAM_BATCH_SIZE at a time, and each
+batch is encoded and sent before the next one is read, so the first byte
+leaves after one batch and memory per request is bounded by the batch size.
+
+The later batches run after the after_request hooks; hooks that account for
+the whole request defer their work with after_body().
+"""
+import itertools
+from flask import Response, current_app, g, has_request_context, stream_with_context
+
+
+def keyset_batches(query, column, batch_size):
+    """Lists of rows from query, batch_size at a time, ordered by the unique column.
+
+    Counts the batches read in g.stream_batches, for @query_budget(per_batch=...).
+    """
+    last = None
+    while True:
+        batch = query.order_by(column)
+        if last is not None:
+            batch = batch.filter(column > last)
+        rows = batch.limit(batch_size).all()
+        if has_request_context():
+            g.stream_batches = g.get('stream_batches', 0) + 1
+        if rows:
+            yield rows
+        if len(rows) < batch_size:
+            return
+        last = getattr(rows[-1], column.key)
+
+
+def after_body(response, callback):
+    """Call callback() once response's body is done: now, or when a streamed body is closed.
+
+    By then the request context of a streamed response is gone, so callback
+    must not touch request or g; capture what it needs beforehand.
+    """
+    if response.is_streamed:
+        response.call_on_close(callback)
+    else:
+        callback()
+
+
+def json_array(batches, encoded=False):
+    """Response streaming the items of batches (lists of JSON-serializable values) as one array.
+
+    With encoded=True the items are already JSON texts and are joined as they are.
+
+    The first batch is read before the response is returned, so errors still
+    become normal error responses. Every later batch issues the same
+    statements again; metrics and @query_budget count them when the body is
+    closed.
+    """
+    batches = iter(batches)
+    first = next(batches, [])
+
+    def generate():
+        dumps = current_app.json.dumps
+        opened = False
+        for items in itertools.chain([first], batches):
+            if not items:
+                continue
+            # One dumps call per batch; [1:-1] drops the batch's own brackets
+            yield (',' if opened else '[') + (','.join(items) if encoded else dumps(items)[1:-1])
+            opened = True
+        yield ']' if opened else '[]'
+
+    return Response(stream_with_context(generate()), mimetype='application/json')
@@ -0,0 +1,165 @@
+"""In-process execution of the sub-requests of POST /api/batch.
+
+Every sub-request goes through the whole app (rate limits, JWT checks, query
+budgets, metrics), carrying the batch request's Authorization header and
+client address unless it sets its own headers. It gets a flask.g of its own,
+but sequential sub-requests share the batch request's app context, so they
+use the same session. The open transaction, and with it the connection, is
+kept from one GET to the next in the same blueprint, since those run under
+the same statement timeout. Everything else starts a new transaction.
+
+With parallel, each run of consecutive GETs is spread over a thread pool,
+each thread with its own app context and session. Writes always run alone
+and in order, so a read listed after a write sees it.
+"""
+import json
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from flask import current_app, g, request
+from werkzeug.exceptions import HTTPException
+from werkzeug.test import EnvironBuilder
+from app.extensions import db
+
+METHODS = ('GET', 'POST', 'PUT', 'PATCH', 'DELETE')
+INHERITED_HEADERS = ('Authorization', 'X-Forwarded-For', 'User-Agent')
+
+_executor = None
+_executor_pid = None
+_executor_lock = threading.Lock()
+
+
+def executor():
+    """This process's thread pool (a forked worker needs its own)"""
+    global _executor, _executor_pid
+    with _executor_lock:
+        if _executor_pid != os.getpid():
+            _executor = ThreadPoolExecutor(current_app.config['BATCH_MAX_PARALLEL'],
+                                           thread_name_prefix='batch')
+            _executor_pid = os.getpid()
+        return _executor
+
+
+def validate(item):
+    """Error message for an unusable sub-request, or None"""
+    if not isinstance(item, dict):
+        return 'Each request must be an object'
+    method = item.get('method', 'GET')
+    path = item.get('path')
+    if method not in METHODS:
+        return f'Unsupported method {method!r}'
+    if not isinstance(path, str) or not path.startswith('/api/'):
+        return 'path must start with /api/'
+    if path.split('?', 1)[0].rstrip('/') == '/api/batch':
+        return 'Batches cannot be nested'
+    if not isinstance(item.get('headers', {}), dict):
+        return 'headers must be an object'
+    return None
+
+
+def blueprint_of(method, path):
+    try:
+        endpoint, _ = current_app.url_map.bind('localhost').match(path.split('?', 1)[0], method)
+    except HTTPException:
+        return None
+    return endpoint.rpartition('.')[0] or None
+
+
+@contextmanager
+def own_globals():
+    """Give a sub-request an empty flask.g and restore the batch request's afterwards"""
+    state = g._get_current_object().__dict__
+    saved = dict(state)
+    state.clear()
+    try:
+        yield
+    finally:
+        state.clear()
+        state.update(saved)
+
+
+def environ(item, inherited, remote_addr):
+    headers = dict(inherited)
+    headers.update(item.get('headers', {}))
+    path, _, query = item['path'].partition('?')
+    builder = EnvironBuilder(
+        path=path, query_string=query, method=item.get('method', 'GET'), headers=headers,
+        json=item['body'] if 'body' in item else None,
+        environ_base={'REMOTE_ADDR': remote_addr},
+    )
+    try:
+        return builder.get_environ()
+    finally:
+        builder.close()
+
+
+def dispatch(app, environ):
+    """(status, parsed body) of one request through the WSGI app"""
+    captured = {}
+
+    def start_response(status, headers, exc_info=None):
+        captured['status'] = int(status.split(' ', 1)[0])
+        captured['headers'] = dict(headers)
+
+    body = app.wsgi_app(environ, start_response)
+    try:
+        data = b''.join(body)
+    finally:
+        if hasattr(body, 'close'):
+            body.close()
+    text = data.decode('utf-8', 'replace')
+    if captured['headers'].get('Content-Type', '').startswith('application/json'):
+        try:
+            return captured['status'], json.loads(text)
+        except ValueError:
+            pass
+    return captured['status'], text
+
+
+def run_in_context(app, environ):
+    with app.app_context():
+        return dispatch(app, environ)
+
+
+def run(items, parallel=False):
+    """Results for items, in order, as dicts with id, status and body"""
+    app = current_app._get_current_object()
+    inherited = {name: request.headers[name] for name in INHERITED_HEADERS if name in request.headers}
+    results = [None] * len(items)
+    pending = []
+    for index, item in enumerate(items):
+        error = validate(item)
+        if error:
+            results[index] = (400, {'error': error})
+        else:
+            pending.append((index, item, environ(item, inherited, request.remote_addr)))
+
+    position = 0
+    while position < len(pending):
+        index, item, sub_environ = pending[position]
+        group = [pending[position]]
+        if parallel and item.get('method', 'GET') == 'GET':
+            while position + len(group) < len(pending) and \
+                    pending[position + len(group)][1].get('method', 'GET') == 'GET':
+                group.append(pending[position + len(group)])
+        if len(group) > 1:
+            futures = [executor().submit(run_in_context, app, env) for _, _, env in group]
+            for (group_index, _, _), future in zip(group, futures):
+                results[group_index] = future.result()
+        else:
+            with own_globals():
+                results[index] = dispatch(app, sub_environ)
+            following = pending[position + 1][1] if position + 1 < len(pending) else None
+            method = item.get('method', 'GET')
+            keep = (following is not None and method == 'GET' and results[index][0] < 400
+                    and following.get('method', 'GET') == 'GET'
+                    and blueprint_of('GET', following['path']) == blueprint_of(method, item['path']))
+            if not keep:
+                db.session.rollback()
+        position += len(group)
+
+    return [
+        {'id': item.get('id', index) if isinstance(item, dict) else index, 'status': status, 'body': body}
+        for index, (item, (status, body)) in enumerate(zip(items, results))
+    ]
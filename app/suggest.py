@@ -0,0 +1,235 @@
+"""In-memory prefix index behind GET /api/products/suggest.
+
+Every worker holds the product, brand and category names in a sorted array
+of keys, one per word of a name onward ("nike air max" is found by "ni",
+"air m" and "max"), so the names starting with a prefix are one bisect away.
+Matches are ranked by popularity: units sold for a product, units sold of
+all their products for a brand or a category. Units sold are read off
+stock_levels (app/lowstock.py) as initial less available units, so loading
+them costs one row per product rather than a pass over the order history.
+
+A short prefix can match a large part of the catalog, so the ranking of
+every prefix matching more than SCAN_LIMIT keys is kept precomputed, each
+merged from its longer prefixes'. A lookup therefore ranks at most
+SCAN_LIMIT keys and never touches the database.
+
+A refresher thread per worker builds the index when the worker starts,
+applies the products, brands and categories that commits announce through
+app/invalidation.py (changed names only; popularity is kept), and rebuilds
+everything every SUGGEST_REFRESH_SECONDS to pick up sales. A failed update is
+retried after a second, then twice as long each time up to
+SUGGEST_REFRESH_SECONDS. Each update builds new arrays and swaps them in, so
+lookups never wait on it.
+"""
+import bisect
+import heapq
+import logging
+import os
+import threading
+import time
+import unicodedata
+from collections import namedtuple
+from flask import current_app
+from sqlalchemy import func, select
+from app import invalidation
+from app.extensions import db
+from app.models import Product, Category, Brand, StockLevel
+
+logger = logging.getLogger(__name__)
+
+# Ranges up to this many keys are ranked on lookup; longer ones are precomputed
+SCAN_LIMIT = 64
+
+# Sorts after any character a key can continue with
+END = '\U0010ffff'
+
+MODELS = {'product': Product, 'brand': Brand, 'category': Category}
+
+Entry = namedtuple('Entry', 'kind id name score')
+Index = namedtuple('Index', 'entries keys ranked')
+
+
+def normalize(text):
+    """Lowercase, unaccented, single-spaced"""
+    decomposed = unicodedata.normalize('NFKD', text.casefold())
+    return ' '.join(''.join(char for char in decomposed if not unicodedata.combining(char)).split())
+
+
+def keys_of(entry):
+    """One key per word of the name onward"""
+    words = normalize(entry.name).split(' ')
+    return [(' '.join(words[start:]), entry.kind, entry.id) for start in range(len(words)) if words[start]]
+
+
+def rank(entry):
+    return -entry.score, entry.name.casefold(), entry.kind, entry.id
+
+
+class PrefixIndex:
+    def __init__(self, limit):
+        self.limit = limit
+        self.index = None
+        self.pending = set()
+        self.rebuild_due = True
+        self.condition = threading.Condition()
+        self.pid = None
+
+    @property
+    def ready(self):
+        return self.index is not None
+
+    def lookup(self, prefix, limit):
+        """Top entries whose name has a word starting with prefix, most popular first"""
+        index = self.index
+        prefix = normalize(prefix)
+        if index is None or not prefix:
+            return []
+        keys = index.keys
+        lo = bisect.bisect_left(keys, (prefix,))
+        hi = bisect.bisect_left(keys, (prefix + END,), lo)
+        if hi - lo > SCAN_LIMIT and prefix in index.ranked:
+            refs = index.ranked[prefix]
+        else:
+            refs = self.top(index.entries, (key[1:] for key in keys[lo:hi]))
+        return [index.entries[ref] for ref in refs[:limit]]
+
+    def top(self, entries, refs):
+        best = {ref: rank(entries[ref]) for ref in refs}
+        return heapq.nsmallest(self.limit, best, key=best.__getitem__)
+
+    def rank_range(self, entries, keys, ranked, dirty, prefix, lo, hi):
+        """Rankings of prefix and of every longer prefix over SCAN_LIMIT keys, reusing clean ones"""
+        if hi - lo <= SCAN_LIMIT:
+            ranked.pop(prefix, None)
+            return self.top(entries, (key[1:] for key in keys[lo:hi]))
+        if prefix in ranked and prefix not in dirty:
+            return ranked[prefix]
+        refs = []
+        position = lo
+        depth = len(prefix)
+        while position < hi:
+            key = keys[position][0]
+            if len(key) == depth:
+                refs.append(keys[position][1:])
+                position += 1
+                continue
+            child = prefix + key[depth]
+            end = bisect.bisect_left(keys, (child + END,), position, hi)
+            refs.extend(self.rank_range(entries, keys, ranked, dirty, child, position, end))
+            position = end
+        ranked[prefix] = self.top(entries, refs)
+        return ranked[prefix]
+
+    def replace(self, entries, keys, changed=None):
+        """Swap in an index over entries; changed is the old and new keys, or None to rank everything anew"""
+        if changed is None:
+            ranked, dirty = {}, set()
+        else:
+            ranked = dict(self.index.ranked)
+            dirty = {key[:length] for key, _, _ in changed for length in range(len(key) + 1)}
+        self.rank_range(entries, keys, ranked, dirty, '', 0, len(keys))
+        self.index = Index(entries, keys, ranked)
+
+    def rebuild(self):
+        """Load every name and the units sold per product"""
+        entries = {}
+        brand_sold, category_sold = {}, {}
+        # A product without a stock level yet counts its archived sales only
+        available = func.coalesce(StockLevel.available, Product.initial_quantity - Product.archived_sold_quantity)
+        for product_id, name, brand_id, category_id, units in db.session.execute(
+                select(Product.id, Product.name, Product.brand_id, Product.category_id,
+                       Product.initial_quantity - available)
+                .outerjoin(StockLevel, StockLevel.product_id == Product.id)):
+            entries[('product', product_id)] = Entry('product', product_id, name, units)
+            brand_sold[brand_id] = brand_sold.get(brand_id, 0) + units
+            category_sold[category_id] = category_sold.get(category_id, 0) + units
+        for kind, model, totals in [('brand', Brand, brand_sold), ('category', Category, category_sold)]:
+            for entity_id, name in db.session.execute(select(model.id, model.name)):
+                entries[(kind, entity_id)] = Entry(kind, entity_id, name, totals.get(entity_id, 0))
+        self.replace(entries, sorted(key for entry in entries.values() for key in keys_of(entry)))
+
+    def apply(self, refs):
+        """Reload the names of refs, keeping their popularity"""
+        entries = dict(self.index.entries)
+        keys = list(self.index.keys)
+        changed = []
+        for kind, model in MODELS.items():
+            ids = [entity_id for ref_kind, entity_id in refs if ref_kind == kind]
+            if not ids:
+                continue
+            names = dict(db.session.execute(select(model.id, model.name).where(model.id.in_(ids))).all())
+            for entity_id in ids:
+                old = entries.pop((kind, entity_id), None)
+                if old is not None:
+                    for key in keys_of(old):
+                        del keys[bisect.bisect_left(keys, key)]
+                        changed.append(key)
+                if entity_id in names:
+                    new = entries[(kind, entity_id)] = Entry(kind, entity_id, names[entity_id],
+                                                             old.score if old else 0)
+                    for key in keys_of(new):
+                        bisect.insort(keys, key)
+                        changed.append(key)
+        self.replace(entries, keys, changed)
+
+    def changed(self, change):
+        """Invalidation subscriber: queue the change for the refresher"""
+        with self.condition:
+            if change.ids is None:
+                self.rebuild_due = True
+            else:
+                self.pending.update((change.entity, entity_id) for entity_id in change.ids)
+            self.condition.notify()
+
+    def start(self):
+        """Start this process's refresher, once per pid (forked workers need their own)"""
+        if self.pid == os.getpid():
+            return
+        with self.condition:
+            if self.pid == os.getpid():
+                return
+            self.pid = os.getpid()
+            self.index = None
+            self.rebuild_due = True
+            app = current_app._get_current_object()
+            threading.Thread(target=self.refresh, args=(app,), name='suggest-refresher', daemon=True).start()
+
+    def refresh(self, app):
+        interval = app.config['SUGGEST_REFRESH_SECONDS']
+        next_rebuild = 0
+        backoff = 0
+        while True:
+            with self.condition:
+                self.condition.wait_for(lambda: self.pending or self.rebuild_due,
+                                        max(0.0, next_rebuild - time.monotonic()))
+                rebuild = self.rebuild_due or self.index is None or time.monotonic() >= next_rebuild
+                refs = self.pending
+                self.rebuild_due, self.pending = False, set()
+            try:
+                with app.app_context():
+                    if rebuild:
+                        self.rebuild()
+                        next_rebuild = time.monotonic() + interval
+                    else:
+                        self.apply(refs)
+                backoff = 0
+            except Exception:
+                backoff = min(backoff * 2 or 1, interval)
+                logger.exception('Updating the suggestion index failed; retrying in %.0f s', backoff)
+                with self.condition:
+                    self.rebuild_due = True
+                # Not woken by changes, which only pile up meanwhile
+                time.sleep(backoff)
+
+
+def get_index():
+    return current_app.extensions['suggest']
+
+
+def init_app(app):
+    if not app.config['SUGGEST_ENABLED']:
+        return
+    index = app.extensions['suggest'] = PrefixIndex(app.config['SUGGEST_LIMIT'])
+    for entity in MODELS:
+        invalidation.subscribe(app, entity, index.changed)
+    app.before_request(index.start)
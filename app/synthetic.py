@@ -0,0 +1,301 @@
+"""Deterministic synthetic dataset for load tests and benchmarks
+
+The same seed and sizes always produce the same rows, whatever the number of
+workers: every chunk draws from its own RNG seeded with (seed, table, first id).
+Postgres is loaded with COPY from a pool of processes, one transaction per
+chunk; other databases fall back to executemany inserts from one process.
+"""
+import bisect
+import csv
+import io
+import itertools
+import math
+import random
+import time
+from datetime import datetime, timedelta
+from multiprocessing import get_context
+from sqlalchemy import create_engine, insert, text
+from app.models import Category, Brand, Size, Color, Product, Client, Order, OrderItem
+from app.models.models import product_sizes, product_colors
+
+CATEGORIES = ['Shirts', 'Pants', 'Jackets', 'Shoes', 'Accessories', 'Dresses', 'Skirts', 'Sweaters',
+              'Shorts', 'Socks', 'Underwear', 'Swimwear', 'Coats', 'Hoodies', 'Suits', 'Hats',
+              'Bags', 'Belts', 'Scarves', 'Gloves']
+BRANDS = ['Nike', 'Adidas', 'Zara', 'H&M', 'Tommy Hilfiger', 'Puma', "Levi's", 'Uniqlo', 'Gap', 'Mango',
+          'Reebok', 'Lacoste', 'Guess', 'Diesel', 'Calvin Klein', 'Hugo Boss', 'Armani', 'Gucci',
+          'Prada', 'Versace', 'Burberry', 'Fila', 'Converse', 'Vans', 'New Balance', 'Asics',
+          'Columbia', 'The North Face', 'Patagonia', 'Timberland']
+SIZES = ['XS', 'S', 'M', 'L', 'XL', 'XXL']
+COLORS = [('Black', '#000000'), ('White', '#FFFFFF'), ('Red', '#FF0000'), ('Blue', '#0000FF'),
+          ('Green', '#008000'), ('Yellow', '#FFFF00'), ('Gray', '#808080'), ('Navy', '#000080'),
+          ('Beige', '#F5F5DC'), ('Brown', '#8B4513')]
+ADJECTIVES = ['Classic', 'Slim', 'Relaxed', 'Vintage', 'Essential', 'Premium', 'Sport', 'Urban',
+              'Organic', 'Lightweight', 'Oversized', 'Tailored']
+FIRST_NAMES = ['Anna', 'Ben', 'Clara', 'David', 'Elena', 'Felix', 'Greta', 'Hugo', 'Ines', 'Jonas',
+               'Kira', 'Luca', 'Mia', 'Noah', 'Olga', 'Paul', 'Rosa', 'Sami', 'Tara', 'Viktor']
+LAST_NAMES = ['Smith', 'Garcia', 'Muller', 'Rossi', 'Novak', 'Silva', 'Kim', 'Nguyen', 'Haddad',
+              'Berisha', 'Kowalski', 'Jensen', 'Dubois', 'Costa', 'Petrov', 'Ahmeti']
+GENDERS = (['Men', 'Women', 'Children'], [45, 45, 10])
+
+# Items per order and units per item
+ITEMS_PER_ORDER = ([1, 2, 3, 4, 5], [45, 30, 15, 7, 3])
+UNITS_PER_ITEM = ([1, 2, 3], [80, 15, 5])
+# Order status by age in days: (max age, statuses, weights)
+STATUS_BY_AGE = [
+    (1, ['pending', 'confirmed', 'cancelled'], [60, 35, 5]),
+    (3, ['pending', 'confirmed', 'shipped', 'cancelled'], [10, 50, 35, 5]),
+    (10, ['confirmed', 'shipped', 'delivered', 'cancelled'], [5, 45, 44, 6]),
+    (None, ['delivered', 'cancelled'], [93, 7]),
+]
+# Share of orders per hour of day (UTC)
+HOUR_WEIGHTS = [1, 1, 1, 1, 1, 2, 3, 5, 6, 7, 8, 8, 9, 8, 8, 8, 9, 10, 11, 12, 11, 8, 5, 2]
+
+PRODUCT_COLUMNS = ['id', 'name', 'description', 'price', 'discount_percentage', 'gender',
+                   'initial_quantity', 'reorder_threshold', 'category_id', 'brand_id', 'created_at', 'updated_at']
+CLIENT_COLUMNS = ['id', 'name', 'email', 'phone', 'address', 'created_at']
+ORDER_COLUMNS = ['id', 'client_id', 'status', 'total_amount', 'created_at', 'updated_at']
+ITEM_COLUMNS = ['order_id', 'order_created_at', 'product_id', 'quantity', 'price_at_purchase']
+
+
+def mean(choices):
+    values, weights = choices
+    return sum(v * w for v, w in zip(values, weights)) / sum(weights)
+
+
+class Plan:
+    """Sizes and distributions shared by every chunk"""
+
+    def __init__(self, products, clients, orders, days=730, seed=42, zipf=1.1, growth=1.5, now=None):
+        self.products = products
+        self.clients = clients
+        self.orders = orders
+        self.days = days
+        self.seed = seed
+        self.zipf = zipf
+        self.growth = growth
+        self.now = (now or datetime.utcnow()).replace(microsecond=0)
+
+        # Zipfian popularity over a shuffled ranking, so the best sellers are not just the low ids
+        rng = self.rng('catalog', 0)
+        self.ranked_products = list(range(1, products + 1))
+        rng.shuffle(self.ranked_products)
+        self.popularity = list(itertools.accumulate(1.0 / rank ** zipf for rank in range(1, products + 1)))
+        self.prices = [0.0] * (products + 1)
+        self.discounts = [0.0] * (products + 1)
+        for product_id in range(1, products + 1):
+            self.prices[product_id] = round(min(max(rng.lognormvariate(3.8, 0.6), 4.99), 999.0), 2)
+            if rng.random() < 0.15:
+                self.discounts[product_id] = rng.choice([10.0, 15.0, 20.0, 30.0])
+
+    def rng(self, table, start):
+        return random.Random(f'{self.seed}:{table}:{start}')
+
+    def expected_units(self):
+        """Units each product is expected to sell across all orders, by product id"""
+        total = self.orders * mean(ITEMS_PER_ORDER) * mean(UNITS_PER_ITEM) / self.popularity[-1]
+        units = [0.0] * (self.products + 1)
+        previous = 0.0
+        for product_id, cumulative in zip(self.ranked_products, self.popularity):
+            units[product_id] = total * (cumulative - previous)
+            previous = cumulative
+        return units
+
+    def pick_product(self, rng):
+        index = bisect.bisect_left(self.popularity, rng.random() * self.popularity[-1])
+        return self.ranked_products[min(index, self.products - 1)]
+
+    def pick_client(self, rng):
+        # Repeat customers: low client ids order far more often than high ones
+        return 1 + min(int(self.clients * rng.random() ** 2), self.clients - 1)
+
+    def order_time(self, rng):
+        """Order volume grows exponentially towards now and follows a daily curve"""
+        u = rng.random()
+        position = math.log1p(u * math.expm1(self.growth)) / self.growth if self.growth else u
+        day = self.now - timedelta(days=self.days * (1 - position))
+        hour = rng.choices(range(24), HOUR_WEIGHTS)[0]
+        created = day.replace(hour=hour, minute=rng.randrange(60), second=rng.randrange(60), microsecond=0)
+        return min(created, self.now)
+
+    def order_status(self, rng, created_at):
+        age = (self.now - created_at).total_seconds() / 86400
+        for max_age, statuses, weights in STATUS_BY_AGE:
+            if max_age is None or age < max_age:
+                return rng.choices(statuses, weights)[0]
+
+
+def dimension_rows():
+    return [
+        (Category.__table__, ['id', 'name'], [(i, name) for i, name in enumerate(CATEGORIES, 1)]),
+        (Brand.__table__, ['id', 'name'], [(i, name) for i, name in enumerate(BRANDS, 1)]),
+        (Size.__table__, ['id', 'name'], [(i, name) for i, name in enumerate(SIZES, 1)]),
+        (Color.__table__, ['id', 'name', 'hex_code'], [(i, *color) for i, color in enumerate(COLORS, 1)]),
+    ]
+
+
+def product_rows(plan, start, stop):
+    rng = plan.rng('products', start)
+    units = plan.expected_units()
+    products, sizes, colors = [], [], []
+    for product_id in range(start, stop):
+        category = rng.randint(1, len(CATEGORIES))
+        brand = rng.randint(1, len(BRANDS))
+        created = plan.now - timedelta(days=plan.days + rng.randint(0, 365))
+        # Enough stock for the orders to come, plus some left over
+        stock = int(units[product_id] * rng.uniform(1.2, 2.0)) + rng.randint(10, 200)
+        # Half its expected sales, so the best sellers come near it. Not drawn, so the rest
+        # of the dataset stays the same
+        threshold = int(units[product_id] / 2)
+        products.append((
+            product_id, f'{BRANDS[brand - 1]} {rng.choice(ADJECTIVES)} {CATEGORIES[category - 1]} {product_id}',
+            '', plan.prices[product_id], plan.discounts[product_id], rng.choices(*GENDERS)[0], stock,
+            threshold, category, brand, created, created,
+        ))
+        sizes.extend((product_id, size) for size in sorted(rng.sample(range(1, len(SIZES) + 1), rng.randint(2, 5))))
+        colors.extend((product_id, color) for color in sorted(rng.sample(range(1, len(COLORS) + 1), rng.randint(1, 4))))
+    return [
+        (Product.__table__, PRODUCT_COLUMNS, products),
+        (product_sizes, ['product_id', 'size_id'], sizes),
+        (product_colors, ['product_id', 'color_id'], colors),
+    ]
+
+
+def client_rows(plan, start, stop):
+    rng = plan.rng('clients', start)
+    clients = []
+    for client_id in range(start, stop):
+        created = plan.now - timedelta(days=plan.days + rng.randint(0, 365))
+        clients.append((
+            client_id, f'{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)}', f'client{client_id}@example.com',
+            f'+1555{rng.randrange(10 ** 7):07d}', f'{rng.randint(1, 999)} Main St', created,
+        ))
+    return [(Client.__table__, CLIENT_COLUMNS, clients)]
+
+
+def order_rows(plan, start, stop):
+    rng = plan.rng('orders', start)
+    orders, items = [], []
+    for order_id in range(start, stop):
+        created = plan.order_time(rng)
+        status = plan.order_status(rng, created)
+        product_ids = {plan.pick_product(rng) for _ in range(rng.choices(*ITEMS_PER_ORDER)[0])}
+        total = 0.0
+        for product_id in sorted(product_ids):
+            quantity = rng.choices(*UNITS_PER_ITEM)[0]
+            price = round(plan.prices[product_id] * (1 - plan.discounts[product_id] / 100), 2)
+            items.append((order_id, created, product_id, quantity, price))
+            total += price * quantity
+        updated = min(created + timedelta(hours=rng.randint(0, 72)), plan.now) if status != 'pending' else created
+        orders.append((order_id, plan.pick_client(rng), status, round(total, 2), created, updated))
+    return [
+        (Order.__table__, ORDER_COLUMNS, orders),
+        (OrderItem.__table__, ITEM_COLUMNS, items),
+    ]
+
+
+def write(conn, table, columns, rows):
+    """COPY on Postgres, executemany elsewhere"""
+    if not rows:
+        return
+    if conn.dialect.name == 'postgresql':
+        buffer = io.StringIO()
+        csv.writer(buffer).writerows(rows)
+        buffer.seek(0)
+        cursor = conn.connection.dbapi_connection.cursor()
+        try:
+            cursor.copy_expert(f'COPY {table.name} ({", ".join(columns)}) FROM STDIN WITH (FORMAT csv)', buffer)
+        finally:
+            cursor.close()
+    else:
+        conn.execute(insert(table), [dict(zip(columns, row)) for row in rows])
+
+
+GENERATORS = {'products': product_rows, 'clients': client_rows, 'orders': order_rows}
+
+_worker = {}
+
+
+def _init_worker(url, plan):
+    _worker['engine'] = create_engine(url)
+    _worker['plan'] = plan
+
+
+def load_chunk(engine, plan, kind, start, stop):
+    """Generate and write one chunk in its own transaction; returns the number of rows written"""
+    batches = GENERATORS[kind](plan, start, stop)
+    with engine.begin() as conn:
+        if conn.dialect.name == 'postgresql':
+            # A crash loses the chunk, which is fine for a dataset we can regenerate
+            conn.execute(text('SET LOCAL synchronous_commit = off'))
+        for table, columns, rows in batches:
+            write(conn, table, columns, rows)
+    return sum(len(rows) for _, _, rows in batches)
+
+
+def _load_chunk(task):
+    return load_chunk(_worker['engine'], _worker['plan'], *task)
+
+
+def chunks(kind, total, size):
+    return [(kind, start, min(start + size, total + 1)) for start in range(1, total + 1, size)]
+
+
+def reset_sequences(conn):
+    for table in ['categories', 'brands', 'sizes', 'colors', 'products', 'clients', 'orders']:
+        conn.execute(text(
+            f"SELECT setval(pg_get_serial_sequence('{table}', 'id'), (SELECT COALESCE(MAX(id), 1) FROM {table}))"
+        ))
+
+
+def generate(url, products=1000, clients=10000, orders=100000, days=730, seed=42, now=None,
+             workers=4, chunk_size=20000, log=print):
+    """Fill an empty, migrated database with a synthetic dataset
+
+    Order dates run up to `now` (default: the current time), so pass it as well
+    as the seed to get identical rows on a later day.
+    """
+    engine = create_engine(url)
+    postgres = engine.dialect.name == 'postgresql'
+    if not postgres:
+        workers = 1  # SQLite allows a single writer
+    plan = Plan(products, clients, orders, days=days, seed=seed, now=now)
+    started = time.perf_counter()
+
+    with engine.begin() as conn:
+        for table, columns, rows in dimension_rows():
+            write(conn, table, columns, rows)
+
+    # Orders reference products and clients, so they go in a second phase
+    phases = [
+        ('products and clients', chunks('products', products, chunk_size) + chunks('clients', clients, chunk_size)),
+        ('orders', chunks('orders', orders, chunk_size)),
+    ]
+    url_string = engine.url.render_as_string(hide_password=False)
+    engine.dispose()  # forked workers open their own connections
+    pool = get_context().Pool(workers, _init_worker, (url_string, plan)) if workers > 1 else None
+    try:
+        for phase, tasks in phases:
+            if pool:
+                results = pool.imap_unordered(_load_chunk, tasks)
+            else:
+                results = (load_chunk(engine, plan, *task) for task in tasks)
+            written = 0
+            for done, rows in enumerate(results, 1):
+                written += rows
+                if done % max(1, len(tasks) // 10) == 0 or done == len(tasks):
+                    elapsed = time.perf_counter() - started
+                    log(f'{phase}: {done}/{len(tasks)} chunks, {written} rows, {elapsed:.1f}s')
+    finally:
+        if pool:
+            pool.close()
+            pool.join()
+
+    if postgres:
+        with engine.begin() as conn:
+            reset_sequences(conn)
+    # Without statistics SQLite drives the stock sums from orders and probes order_items per row
+    with engine.connect().execution_options(isolation_level='AUTOCOMMIT') as conn:
+        conn.execute(text('ANALYZE'))
+    engine.dispose()
+    log(f'Generated {products} products, {clients} clients and {orders} orders '
+        f'in {time.perf_counter() - started:.1f}s')
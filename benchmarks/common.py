@@ -0,0 +1,41 @@
+"""Shared helpers for the benchmark scripts"""
+import os
+import tempfile
+from config import Config
+
+
+def make_config(**overrides):
+    """Config for a benchmark run; uses a throwaway SQLite file unless DATABASE_URL is set"""
+    database_url = os.getenv('DATABASE_URL')
+    if not database_url:
+        fd, path = tempfile.mkstemp(prefix='webstore-bench-', suffix='.db')
+        os.close(fd)
+        database_url = f'sqlite:///{path}'
+    attrs = {
+        'SQLALCHEMY_DATABASE_URI': database_url,
+        'SECRET_KEY': 'benchmark-secret',
+        'JWT_SECRET_KEY': 'benchmark-secret',
+        'RATELIMIT_ENABLED': False,
+        'SCHEMA_CHECK_ON_STARTUP': False,
+    }
+    attrs.update(overrides)
+    return type('BenchmarkConfig', (Config,), attrs)
+
+
+def percentile(samples, pct):
+    """Nearest-rank percentile of a list of numbers"""
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    index = max(0, min(len(ordered) - 1, int(round(pct / 100 * len(ordered))) - 1))
+    return ordered[index]
+
+
+def summarize(latencies):
+    """Latency summary in milliseconds"""
+    return {
+        'count': len(latencies),
+        'p50_ms': round(percentile(latencies, 50) * 1000, 2),
+        'p95_ms': round(percentile(latencies, 95) * 1000, 2),
+        'p99_ms': round(percentile(latencies, 99) * 1000, 2),
+    }
@@ -0,0 +1,120 @@
+"""Before/after query plans for the index pack (migration 0002)
+
+    DATABASE_URL=postgresql+psycopg2://... python -m benchmarks.explain_indexes --orders 500000
+
+Seeds a dataset, calls every read route in-process while capturing the SQL
+it issues, then runs each distinct statement under EXPLAIN ANALYZE twice:
+once inside a transaction that drops the pack's indexes (rolled back
+afterwards) and once with them. On SQLite it prints EXPLAIN QUERY PLAN.
+"""
+import argparse
+import os
+from datetime import datetime, timedelta
+from sqlalchemy import event
+from app import create_app, migrations, synthetic
+from app.extensions import db
+from app.models import User
+from app.migrations import v0002_index_pack as index_pack
+from benchmarks.common import make_config
+
+
+def seed(args):
+    """The admin user plus a synthetic dataset of the requested size"""
+    admin = User(username='admin', email='admin@webstore.com', role='admin')
+    admin.set_password('admin123')
+    db.session.add(admin)
+    db.session.commit()
+    db.session.remove()
+    synthetic.generate(
+        db.engine.url.render_as_string(hide_password=False), products=args.products,
+        clients=args.clients, orders=args.orders, seed=args.seed, workers=args.workers,
+        log=lambda message: None,
+    )
+
+
+def capture(app, paths, headers):
+    """Run each path and collect the distinct SELECT statements it issues"""
+    captured = {}
+    current = []
+
+    def record(conn, cursor, statement, parameters, context, executemany):
+        if statement.lstrip().upper().startswith('SELECT') and current:
+            queries = captured.setdefault(current[0], {})
+            queries.setdefault(statement, parameters)
+
+    event.listen(db.engine, 'before_cursor_execute', record)
+    client = app.test_client()
+    try:
+        for path in paths:
+            current[:] = [path]
+            client.get(path, headers=headers)
+    finally:
+        event.remove(db.engine, 'before_cursor_execute', record)
+    return captured
+
+
+def explain(statement, parameters, drop_indexes):
+    conn = db.engine.connect()
+    postgres = conn.dialect.name == 'postgresql'
+    transaction = conn.begin()
+    try:
+        if drop_indexes:
+            for name, *_ in index_pack.INDEXES:
+                conn.exec_driver_sql(f'DROP INDEX IF EXISTS {name}')
+        prefix = 'EXPLAIN (ANALYZE, BUFFERS) ' if postgres else 'EXPLAIN QUERY PLAN '
+        rows = conn.exec_driver_sql(prefix + statement, parameters).fetchall()
+        return '\n'.join(' | '.join(str(col) for col in row) for row in rows)
+    finally:
+        transaction.rollback()
+        if drop_indexes and not postgres:
+            # pysqlite commits DDL immediately, so the rollback does not restore them
+            with conn.begin():
+                index_pack.upgrade(conn)
+        conn.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--products', type=int, default=2000)
+    parser.add_argument('--clients', type=int, default=20000)
+    parser.add_argument('--orders', type=int, default=100000)
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1)
+    args = parser.parse_args()
+
+    app = create_app(make_config(PASSWORD_HASH_WORKERS=0))
+    with app.app_context():
+        db.drop_all()
+        migrations.drop_version_table(db.engine)
+        migrations.upgrade(db.engine, log=lambda message: None)
+        seed(args)
+        token = app.test_client().post(
+            '/api/auth/login', json={'username': 'admin', 'password': 'admin123'}
+        ).get_json()['access_token']
+
+        today = datetime.utcnow()
+        paths = [
+            '/api/products/', '/api/products/1', '/api/products/1/quantity',
+            '/api/products/search?category=Category 1&size=M&color=Color 2',
+            '/api/orders/', '/api/orders/1', '/api/orders/client/client1@example.com',
+            f'/api/reports/earnings/daily?date={today:%Y-%m-%d}',
+            f'/api/reports/earnings/monthly?year={today.year}&month={today.month}',
+            f'/api/reports/earnings/range?start_date={today - timedelta(days=30):%Y-%m-%d}&end_date={today:%Y-%m-%d}',
+            '/api/reports/top-selling-products', '/api/reports/sales-by-category',
+            '/api/reports/sales-by-brand', '/api/reports/order-status-summary',
+        ]
+        captured = capture(app, paths, {'Authorization': f'Bearer {token}'})
+        for path, queries in captured.items():
+            print('=' * 80)
+            print(path)
+            for statement, parameters in queries.items():
+                print('-' * 80)
+                print(' '.join(statement.split())[:300])
+                print('\n[before]')
+                print(explain(statement, parameters, drop_indexes=True))
+                print('\n[after]')
+                print(explain(statement, parameters, drop_indexes=False))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,83 @@
+"""Login storm: login throughput and latency of unrelated endpoints while it runs
+
+    python -m benchmarks.login_storm --duration 10 --login-threads 16
+
+Runs once with hashing inline on the request threads and once on the process
+pool, and prints one JSON line per mode.
+"""
+import argparse
+import json
+import threading
+import time
+from app import create_app
+from app.extensions import db
+from app.models import User, Category
+from benchmarks.common import make_config, summarize
+
+
+def run(workers, args):
+    app = create_app(make_config(
+        PASSWORD_HASH_WORKERS=workers,
+        PASSWORD_HASH_MAX_CONCURRENCY=args.max_concurrency,
+        PASSWORD_HASH_QUEUE_TIMEOUT=args.queue_timeout,
+    ))
+    with app.app_context():
+        db.drop_all()
+        db.create_all()
+        user = User(username='storm', email='storm@webstore.com', role='simple_user')
+        user.set_password('storm123')
+        db.session.add_all([user, Category(name='Shirts')])
+        db.session.commit()
+
+    deadline = time.perf_counter() + args.duration
+    logins = {'ok': 0, 'busy': 0}
+    browse_latencies = []
+    counter_lock = threading.Lock()
+
+    def login_loop():
+        client = app.test_client()
+        while time.perf_counter() < deadline:
+            response = client.post('/api/auth/login', json={'username': 'storm', 'password': 'storm123'})
+            with counter_lock:
+                logins['ok' if response.status_code == 200 else 'busy'] += 1
+
+    def browse_loop():
+        client = app.test_client()
+        while time.perf_counter() < deadline:
+            start = time.perf_counter()
+            client.get('/api/products/categories')
+            elapsed = time.perf_counter() - start
+            with counter_lock:
+                browse_latencies.append(elapsed)
+
+    threads = [threading.Thread(target=login_loop) for _ in range(args.login_threads)]
+    threads += [threading.Thread(target=browse_loop) for _ in range(args.browse_threads)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    return {
+        'mode': f'pool({workers})' if workers else 'inline',
+        'logins_per_sec': round(logins['ok'] / args.duration, 1),
+        'logins_rejected': logins['busy'],
+        'browse': summarize(browse_latencies),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--duration', type=float, default=10)
+    parser.add_argument('--login-threads', type=int, default=16)
+    parser.add_argument('--browse-threads', type=int, default=4)
+    parser.add_argument('--workers', type=int, default=2)
+    parser.add_argument('--max-concurrency', type=int, default=4)
+    parser.add_argument('--queue-timeout', type=float, default=2.0)
+    args = parser.parse_args()
+
+    for workers in (0, args.workers):
+        print(json.dumps(run(workers, args)))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,129 @@
+"""Serving mode: debug server (python run.py) vs gunicorn, over real HTTP
+
+    python -m benchmarks.serving --duration 10 --concurrency 16
+
+Starts each server on a free port against the same seeded database, drives
+it with keep-alive clients and prints one JSON line per mode.
+"""
+import argparse
+import http.client
+import json
+import os
+import signal
+import socket
+import subprocess
+import sys
+import threading
+import time
+from app import create_app
+from app.extensions import db
+from app.models import Category, Brand
+from benchmarks.common import make_config, summarize
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def wait_for(port, timeout=30):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            socket.create_connection(('127.0.0.1', port), timeout=1).close()
+            return
+        except OSError:
+            time.sleep(0.2)
+    raise RuntimeError(f'server on port {port} did not start')
+
+
+def drive(port, path, duration, concurrency):
+    deadline = time.perf_counter() + duration
+    latencies = []
+    errors = [0]
+    lock = threading.Lock()
+
+    def loop():
+        conn = http.client.HTTPConnection('127.0.0.1', port, timeout=10)
+        while time.perf_counter() < deadline:
+            start = time.perf_counter()
+            try:
+                conn.request('GET', path)
+                response = conn.getresponse()
+                response.read()
+                ok = response.status == 200
+            except (OSError, http.client.HTTPException):
+                conn.close()
+                conn = http.client.HTTPConnection('127.0.0.1', port, timeout=10)
+                ok = False
+            elapsed = time.perf_counter() - start
+            with lock:
+                if ok:
+                    latencies.append(elapsed)
+                else:
+                    errors[0] += 1
+        conn.close()
+
+    threads = [threading.Thread(target=loop) for _ in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return {
+        'requests_per_sec': round(len(latencies) / duration, 1),
+        'errors': errors[0],
+        'latency': summarize(latencies),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--duration', type=float, default=10)
+    parser.add_argument('--concurrency', type=int, default=16)
+    parser.add_argument('--path', default='/api/products/categories')
+    parser.add_argument('--workers', type=int, default=2)
+    parser.add_argument('--threads', type=int, default=4)
+    args = parser.parse_args()
+
+    config = make_config()
+    app = create_app(config)
+    with app.app_context():
+        db.create_all()
+        db.session.add_all([Category(name=f'Category {i}') for i in range(20)])
+        db.session.add_all([Brand(name=f'Brand {i}') for i in range(20)])
+        db.session.commit()
+
+    env = dict(
+        os.environ,
+        DATABASE_URL=config.SQLALCHEMY_DATABASE_URI,
+        SECRET_KEY=config.SECRET_KEY,
+        RATELIMIT_ENABLED='0',
+        GUNICORN_WORKERS=str(args.workers),
+        GUNICORN_THREADS=str(args.threads),
+        GUNICORN_ACCESS_LOG='/dev/null',
+    )
+    modes = {
+        'debug-server': [sys.executable, 'run.py'],
+        f'gunicorn({args.workers}x{args.threads})': ['gunicorn', '-c', 'gunicorn.conf.py', 'run:app'],
+    }
+    for mode, command in modes.items():
+        port = free_port()
+        env['PORT'] = str(port)
+        env['FLASK_ENV'] = 'development' if mode == 'debug-server' else 'production'
+        # New session so the debug server's reloader child is stopped with it
+        server = subprocess.Popen(command, cwd=ROOT, env=env, start_new_session=True,
+                                  stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        try:
+            wait_for(port)
+            result = drive(port, args.path, args.duration, args.concurrency)
+        finally:
+            os.killpg(server.pid, signal.SIGTERM)
+            server.wait()
+        print(json.dumps({'mode': mode, **result}))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,72 @@
+"""Time to first request: from process start to the first 200 from gunicorn
+
+    python -m benchmarks.startup --runs 5
+
+Migrates a fresh database once, then boots a one-worker gunicorn repeatedly
+with and without the startup schema-version check.
+"""
+import argparse
+import http.client
+import json
+import os
+import signal
+import statistics
+import subprocess
+import time
+from app import create_app, migrations
+from app.extensions import db
+from benchmarks.common import make_config
+from benchmarks.serving import ROOT, free_port
+
+
+def first_response(port, timeout=60):
+    deadline = time.perf_counter() + timeout
+    while time.perf_counter() < deadline:
+        try:
+            conn = http.client.HTTPConnection('127.0.0.1', port, timeout=1)
+            conn.request('GET', '/api')
+            if conn.getresponse().status == 200:
+                return
+        except OSError:
+            time.sleep(0.01)
+    raise RuntimeError('server did not answer')
+
+
+def boot_once(env):
+    port = free_port()
+    env = dict(env, PORT=str(port))
+    start = time.perf_counter()
+    server = subprocess.Popen(['gunicorn', '-c', 'gunicorn.conf.py', 'run:app'], cwd=ROOT, env=env,
+                              start_new_session=True,
+                              stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        first_response(port)
+        return time.perf_counter() - start
+    finally:
+        os.killpg(server.pid, signal.SIGTERM)
+        server.wait()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--runs', type=int, default=5)
+    args = parser.parse_args()
+
+    config = make_config()
+    with create_app(config).app_context():
+        migrations.upgrade(db.engine, log=lambda message: None)
+
+    env = dict(os.environ, DATABASE_URL=config.SQLALCHEMY_DATABASE_URI, SECRET_KEY=config.SECRET_KEY,
+               GUNICORN_WORKERS='1', GUNICORN_ACCESS_LOG='/dev/null')
+    for check in ('1', '0'):
+        env['SCHEMA_CHECK_ON_STARTUP'] = check
+        timings = [boot_once(env) for _ in range(args.runs)]
+        print(json.dumps({
+            'schema_check': check == '1',
+            'median_ms': round(statistics.median(timings) * 1000, 1),
+            'max_ms': round(max(timings) * 1000, 1),
+        }))
+
+
+if __name__ == '__main__':
+    main()
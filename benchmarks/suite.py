@@ -0,0 +1,406 @@
+"""End-to-end benchmark suite: catalog, search, checkout and reports
+
+    python -m benchmarks.suite --output benchmarks/results.json --baseline benchmarks/baseline.json
+
+Seeds a synthetic dataset, then runs every scenario against the app either
+in-process (Flask test client, the default) or over HTTP against a gunicorn
+started on a free port (--target server). Each scenario sends a fixed number
+of requests from a fixed number of threads with seeded RNGs, and records
+throughput, p50/p95/p99 latency, time to first byte, bytes on the wire and SQL
+statements per request: counted on the engine in-process, and taken from the
+Server-Timing header over HTTP, where a streamed list's later batches are
+missing because the header leaves before them. Requests send
+--accept-encoding; run once with `identity` to see what compression saves. With --baseline, scenarios that got slower or issue
+more queries than the baseline are listed and the exit status is 1.
+"""
+import argparse
+import http.client
+import json
+import os
+import platform
+import random
+import re
+import signal
+import subprocess
+import sys
+import threading
+import time
+import zlib
+from urllib.parse import quote
+from datetime import datetime, timedelta
+from app import copurchase, create_app, lowstock, metrics, migrations, partitions, readmodel, synthetic
+from app.extensions import db
+from app.models import User
+from benchmarks.common import make_config, percentile
+from benchmarks.serving import ROOT, free_port, wait_for
+
+QUERIES = re.compile(r'desc="(\d+) queries"')
+
+
+def decode(data, encoding):
+    """Parsed JSON body of a possibly compressed response, or None"""
+    try:
+        if encoding == 'gzip':
+            data = zlib.decompress(data, 47)
+        elif encoding == 'br':
+            import brotli
+            data = brotli.decompress(data)
+        elif encoding == 'zstd':
+            import zstandard
+            data = zstandard.ZstdDecompressor().decompressobj().decompress(data)
+        return json.loads(data)
+    except (ValueError, zlib.error):
+        return None
+
+
+class InProcess:
+    """One Flask test client per thread"""
+
+    def __init__(self, app):
+        self.app = app
+        self.local = threading.local()
+        # A request, streamed body included, runs on the thread that sent it
+        metrics.observe_statements(app, self.count_statement)
+
+    def count_statement(self, conn, statement, parameters, executemany, elapsed):
+        self.local.queries = getattr(self.local, 'queries', 0) + 1
+
+    def request(self, method, path, body=None, headers=None):
+        """(status, parsed body, SQL statements, seconds to first body chunk, body bytes)"""
+        if not hasattr(self.local, 'client'):
+            self.local.client = self.app.test_client()
+        self.local.queries = 0
+        start = time.perf_counter()
+        response = self.local.client.open(path, method=method, json=body, headers=headers, buffered=False)
+        chunks = iter(response.response)
+        first = next(chunks, b'')
+        ttfb = time.perf_counter() - start
+        data = first + b''.join(chunks)
+        response.close()
+        return (response.status_code, decode(data, response.headers.get('Content-Encoding')),
+                self.local.queries, ttfb, len(data))
+
+    def close(self):
+        pass
+
+
+class Server:
+    """One keep-alive HTTP connection per thread to a local gunicorn"""
+
+    def __init__(self, config, workers, threads, extra_env=None):
+        self.port = free_port()
+        env = dict(
+            os.environ,
+            DATABASE_URL=config.SQLALCHEMY_DATABASE_URI,
+            SECRET_KEY=config.SECRET_KEY,
+            FLASK_ENV='production',
+            RATELIMIT_ENABLED='0',
+            METRICS_SERVER_TIMING='1',
+            SCHEMA_CHECK_ON_STARTUP='0',
+            PASSWORD_HASH_WORKERS='0',
+            PORT=str(self.port),
+            GUNICORN_WORKERS=str(workers),
+            GUNICORN_THREADS=str(threads),
+            GUNICORN_ACCESS_LOG='/dev/null',
+        )
+        env.update(extra_env or {})
+        self.process = subprocess.Popen(['gunicorn', '-c', 'gunicorn.conf.py', 'run:app'], cwd=ROOT, env=env,
+                                        start_new_session=True, stdout=subprocess.DEVNULL,
+                                        stderr=subprocess.DEVNULL)
+        wait_for(self.port)
+        self.local = threading.local()
+
+    def request(self, method, path, body=None, headers=None):
+        if not hasattr(self.local, 'conn'):
+            self.local.conn = http.client.HTTPConnection('127.0.0.1', self.port, timeout=60)
+        headers = dict(headers or {})
+        payload = None
+        if body is not None:
+            payload = json.dumps(body)
+            headers['Content-Type'] = 'application/json'
+        start = time.perf_counter()
+        try:
+            self.local.conn.request(method, path, payload, headers)
+            response = self.local.conn.getresponse()
+            # gunicorn sends the headers together with the first body chunk
+            ttfb = time.perf_counter() - start
+            data = response.read()
+        except (OSError, http.client.HTTPException):
+            self.local.conn.close()
+            del self.local.conn
+            return 0, None, None, 0.0, 0
+        match = QUERIES.search(response.getheader('Server-Timing', ''))
+        return (response.status, decode(data, response.getheader('Content-Encoding')),
+                int(match.group(1)) if match else None, ttfb, len(data))
+
+    def close(self):
+        os.killpg(self.process.pid, signal.SIGTERM)
+        self.process.wait()
+
+
+def seed_dataset(app, products, clients, orders, seed, end_date):
+    """Migrate a fresh schema, add the admin user and generate the synthetic dataset"""
+    with app.app_context():
+        db.drop_all()
+        migrations.drop_version_table(db.engine)
+        migrations.upgrade(db.engine, log=lambda message: None)
+        admin = User(username='admin', email='admin@webstore.com', role='admin')
+        admin.set_password('admin123')
+        db.session.add(admin)
+        db.session.commit()
+        db.session.remove()
+        partitions.create_upcoming(db.engine, app.config['PARTITION_MONTHS_AHEAD'],
+                                   since=end_date - timedelta(days=730), log=lambda message: None)
+        synthetic.generate(db.engine.url.render_as_string(hide_password=False), products=products,
+                           clients=clients, orders=orders, seed=seed, now=end_date,
+                           log=lambda message: print(message, file=sys.stderr))
+        readmodel.rebuild()
+        copurchase.build(app.config['COPURCHASE_KEEP'])
+        lowstock.build()
+        db.engine.dispose()
+
+
+def scenarios(args, end_date):
+    """(name, threads, needs auth, request factory) for every scenario"""
+    products, clients = args.products, args.clients
+
+    def product_id(rng):
+        # Browsing concentrates on popular products, like the orders do
+        return 1 + min(int(products * rng.random() ** 3), products - 1)
+
+    def browse(rng):
+        return 'GET', rng.choice([
+            f'/api/products/{product_id(rng)}',
+            f'/api/products/{product_id(rng)}/quantity',
+            '/api/products/categories',
+            '/api/products/brands',
+        ]), None
+
+    def search(rng):
+        filters = {
+            'gender': rng.choice(['Men', 'Women', 'Children']),
+            'category': rng.choice(synthetic.CATEGORIES),
+            'brand': rng.choice(synthetic.BRANDS),
+            'size': rng.choice(synthetic.SIZES),
+            'color': rng.choice(synthetic.COLORS)[0],
+            'price_min': rng.choice([10, 20, 50]),
+            'price_max': rng.choice([100, 200, 500]),
+            'availability': 'in_stock',
+        }
+        chosen = rng.sample(sorted(filters), rng.randint(1, 3))
+        return 'GET', '/api/products/search?' + '&'.join(f'{key}={filters[key]}' for key in chosen), None
+
+    def typeahead(rng):
+        # Each keystroke of a brand, category or product word
+        word = rng.choice(synthetic.BRANDS + synthetic.CATEGORIES + synthetic.ADJECTIVES)
+        return 'GET', f'/api/products/suggest?prefix={quote(word[:rng.randint(1, len(word))])}', None
+
+    def checkout(cart_size):
+        def make(rng):
+            client_id = rng.randint(1, clients)
+            items = [{'product_id': pid, 'quantity': 1}
+                     for pid in sorted({product_id(rng) for _ in range(cart_size)})]
+            body = {'client': {'name': f'Client {client_id}', 'email': f'client{client_id}@example.com'},
+                    'items': items}
+            return 'POST', '/api/orders/', body
+        return make
+
+    def related(rng):
+        return 'GET', f'/api/products/{product_id(rng)}/related', None
+
+    def fixed(path):
+        return lambda rng: ('GET', path, None)
+
+    day = end_date - timedelta(days=1)
+    month_start = (end_date - timedelta(days=30)).replace(day=1)
+    result = [
+        ('catalog_browse', args.threads, False, browse),
+        ('catalog_list', args.threads, False, fixed('/api/products/')),
+        ('search_filters', args.threads, False, search),
+        ('suggest_typeahead', args.threads, False, typeahead),
+        ('catalog_related', args.threads, False, related),
+        ('stock_low_list', args.threads, True, fixed('/api/products/low-stock?limit=50')),
+    ]
+    for size in args.cart_sizes:
+        result.append((f'checkout_cart_{size}', 1, False, checkout(size)))
+    result.append(('checkout_concurrent', args.checkout_threads, False, checkout(3)))
+    result += [
+        ('report_daily', args.threads, True, fixed(f'/api/reports/earnings/daily?date={day:%Y-%m-%d}')),
+        ('report_monthly', args.threads, True,
+         fixed(f'/api/reports/earnings/monthly?year={month_start.year}&month={month_start.month}')),
+        ('report_range', args.threads, True,
+         fixed(f'/api/reports/earnings/range?start_date={end_date - timedelta(days=30):%Y-%m-%d}'
+               f'&end_date={end_date:%Y-%m-%d}')),
+        ('report_top_selling', args.threads, True, fixed('/api/reports/top-selling-products?limit=10')),
+        ('report_by_category', args.threads, True, fixed('/api/reports/sales-by-category')),
+        ('report_by_brand', args.threads, True, fixed('/api/reports/sales-by-brand')),
+        ('report_status_summary', args.threads, True, fixed('/api/reports/order-status-summary')),
+    ]
+    return result
+
+
+def run_scenario(target, name, threads, headers, make_request, requests, seed, warmup=5):
+    rng = random.Random(f'{seed}:{name}:warmup')
+    for _ in range(warmup):
+        target.request(*make_request(rng), headers)
+
+    per_thread = [requests // threads + (1 if i < requests % threads else 0) for i in range(threads)]
+    latencies, queries, ttfbs, sizes = [], [], [], []
+    errors = [0]
+    lock = threading.Lock()
+
+    def loop(index):
+        rng = random.Random(f'{seed}:{name}:{index}')
+        for _ in range(per_thread[index]):
+            method, path, body = make_request(rng)
+            start = time.perf_counter()
+            status, _, statements, ttfb, size = target.request(method, path, body, headers)
+            elapsed = time.perf_counter() - start
+            with lock:
+                if 200 <= status < 300:
+                    latencies.append(elapsed)
+                    ttfbs.append(ttfb)
+                    sizes.append(size)
+                    if statements is not None:
+                        queries.append(statements)
+                else:
+                    errors[0] += 1
+
+    workers = [threading.Thread(target=loop, args=(i,)) for i in range(threads)]
+    started = time.perf_counter()
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    wall = time.perf_counter() - started
+    return {
+        'requests': len(latencies),
+        'errors': errors[0],
+        'threads': threads,
+        'throughput_rps': round(len(latencies) / wall, 1),
+        'p50_ms': round(percentile(latencies, 50) * 1000, 2),
+        'p95_ms': round(percentile(latencies, 95) * 1000, 2),
+        'p99_ms': round(percentile(latencies, 99) * 1000, 2),
+        'ttfb_p50_ms': round(percentile(ttfbs, 50) * 1000, 2),
+        'bytes_per_request': round(sum(sizes) / len(sizes)) if sizes else None,
+        'queries_per_request': round(sum(queries) / len(queries), 2) if queries else None,
+        'max_queries': max(queries) if queries else None,
+    }
+
+
+def compare(results, baseline, tolerance, min_delta_ms=5.0):
+    """Regressions against a baseline results file, as human-readable lines"""
+    regressions = []
+    for name, current in results['scenarios'].items():
+        before = baseline.get('scenarios', {}).get(name)
+        if not before:
+            continue
+        if current['errors'] > before['errors']:
+            regressions.append(f"{name}: {current['errors']} errors (baseline {before['errors']})")
+        if before['max_queries'] is not None and current['max_queries'] is not None \
+                and current['max_queries'] > before['max_queries']:
+            regressions.append(f"{name}: up to {current['max_queries']} queries per request "
+                               f"(baseline {before['max_queries']})")
+        if current['p95_ms'] > before['p95_ms'] * (1 + tolerance) \
+                and current['p95_ms'] - before['p95_ms'] > min_delta_ms:
+            regressions.append(f"{name}: p95 {current['p95_ms']} ms (baseline {before['p95_ms']} ms)")
+        if before.get('bytes_per_request') and current['bytes_per_request'] \
+                and current['bytes_per_request'] > before['bytes_per_request'] * (1 + tolerance):
+            regressions.append(f"{name}: {current['bytes_per_request']} bytes per response "
+                               f"(baseline {before['bytes_per_request']})")
+        if current['throughput_rps'] < before['throughput_rps'] * (1 - tolerance):
+            regressions.append(f"{name}: {current['throughput_rps']} req/s (baseline {before['throughput_rps']})")
+    return regressions
+
+
+def git_revision():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--target', choices=['inprocess', 'server'], default='inprocess')
+    parser.add_argument('--products', type=int, default=1000)
+    parser.add_argument('--clients', type=int, default=10000)
+    parser.add_argument('--orders', type=int, default=20000)
+    parser.add_argument('--end-date', type=lambda value: datetime.strptime(value, '%Y-%m-%d'),
+                        default=datetime(2026, 1, 1), help='Newest order in the dataset')
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--skip-seed', action='store_true', help='Reuse the dataset already at DATABASE_URL')
+    parser.add_argument('--requests', type=int, default=100, help='Requests per scenario')
+    parser.add_argument('--warmup', type=int, default=5, help='Unrecorded requests before each scenario')
+    parser.add_argument('--threads', type=int, default=4)
+    parser.add_argument('--checkout-threads', type=int, default=8)
+    parser.add_argument('--cart-sizes', type=int, nargs='+', default=[1, 5, 20])
+    parser.add_argument('--accept-encoding', default='gzip',
+                        help='Accept-Encoding sent with every request (identity disables compression)')
+    parser.add_argument('--only', nargs='+', help='Run only these scenarios')
+    parser.add_argument('--workers', type=int, default=2, help='gunicorn workers (--target server)')
+    parser.add_argument('--worker-threads', type=int, default=4, help='gunicorn threads (--target server)')
+    parser.add_argument('--output', default='benchmarks/results.json')
+    parser.add_argument('--baseline', help='Results file to compare against')
+    parser.add_argument('--tolerance', type=float, default=0.25,
+                        help='Allowed relative p95/throughput regression')
+    parser.add_argument('--min-delta-ms', type=float, default=5.0,
+                        help='Ignore p95 regressions smaller than this')
+    args = parser.parse_args()
+
+    config = make_config(PASSWORD_HASH_WORKERS=0, METRICS_SERVER_TIMING=True)
+    app = create_app(config)
+    if not args.skip_seed:
+        seed_dataset(app, args.products, args.clients, args.orders, args.seed, args.end_date)
+
+    target = Server(config, args.workers, args.worker_threads) if args.target == 'server' else InProcess(app)
+    results = {
+        'revision': git_revision(),
+        'python': platform.python_version(),
+        'target': args.target,
+        'database': app.config['SQLALCHEMY_DATABASE_URI'].split(':', 1)[0],
+        'dataset': {'products': args.products, 'clients': args.clients, 'orders': args.orders,
+                    'seed': args.seed, 'end_date': f'{args.end_date:%Y-%m-%d}'},
+        'requests_per_scenario': args.requests,
+        'accept_encoding': args.accept_encoding,
+        'scenarios': {},
+    }
+    try:
+        status, body, *_ = target.request('POST', '/api/auth/login',
+                                         {'username': 'admin', 'password': 'admin123'})
+        if status != 200:
+            raise RuntimeError(f'admin login failed with {status}')
+        anonymous = {'Accept-Encoding': args.accept_encoding}
+        auth = dict(anonymous, Authorization=f"Bearer {body['access_token']}")
+        for name, threads, needs_auth, make_request in scenarios(args, args.end_date):
+            if args.only and name not in args.only:
+                continue
+            result = run_scenario(target, name, threads, auth if needs_auth else anonymous,
+                                  make_request, args.requests, args.seed, args.warmup)
+            results['scenarios'][name] = result
+            print(json.dumps({'scenario': name, **result}))
+    finally:
+        target.close()
+
+    with open(args.output, 'w') as f:
+        json.dump(results, f, indent=2)
+        f.write('\n')
+    print(f'Results written to {args.output}', file=sys.stderr)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        for key in ['target', 'database', 'dataset', 'requests_per_scenario', 'accept_encoding']:
+            if baseline.get(key) != results[key]:
+                sys.exit(f'Baseline {key} is {baseline.get(key)!r}, this run used {results[key]!r}')
+        regressions = compare(results, baseline, args.tolerance, args.min_delta_ms)
+        for line in regressions:
+            print(f'REGRESSION {line}', file=sys.stderr)
+        if regressions:
+            sys.exit(1)
+        print('No regressions against the baseline', file=sys.stderr)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,118 @@
+"""Thundering herd: many identical reads arriving at once, with and without coalescing
+
+    python -m benchmarks.thundering_herd --herd 16 --rounds 20
+    python -m benchmarks.thundering_herd --target server --workers 4
+
+Seeds the suite's synthetic dataset, then for every path releases --herd
+threads at the same instant, --rounds times, and records their latency and the
+SQL statements the whole round issued (as the suite counts them). Runs once with
+coalescing off, once coalescing within each worker and, with --target server,
+once more with COALESCE_LOCK_DIR set so the workers coalesce with each other.
+Prints one JSON line per mode and path.
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime
+from app import create_app
+from benchmarks.common import make_config, summarize
+from benchmarks.suite import InProcess, Server, seed_dataset
+
+
+def lock_dir():
+    return tempfile.mkdtemp(prefix='webstore-coalesce-', dir='/dev/shm' if os.path.isdir('/dev/shm') else None)
+
+
+def make_target(config, mode, args):
+    enabled = mode != 'off'
+    directory = lock_dir() if mode == 'pod' else None
+    if args.target == 'server':
+        return Server(config, args.workers, args.worker_threads, extra_env={
+            'COALESCE_ENABLED': '1' if enabled else '0',
+            'COALESCE_LOCK_DIR': directory or '',
+        })
+    return InProcess(create_app(type('HerdConfig', (config,), {
+        'COALESCE_ENABLED': enabled,
+        'COALESCE_LOCK_DIR': directory,
+    })))
+
+
+def run_herd(target, path, headers, herd, rounds):
+    barrier = threading.Barrier(herd)
+    latencies = []
+    statements = [0] * rounds
+    errors = []
+    lock = threading.Lock()
+
+    def client():
+        for index in range(rounds):
+            barrier.wait()
+            start = time.perf_counter()
+            status, _, queries, _, _ = target.request('GET', path, headers=headers)
+            elapsed = time.perf_counter() - start
+            with lock:
+                latencies.append(elapsed)
+                statements[index] += queries or 0
+                if status != 200:
+                    errors.append(status)
+
+    threads = [threading.Thread(target=client) for _ in range(herd)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return {
+        **summarize(latencies),
+        'statements_per_round': round(sum(statements) / rounds, 1),
+        'errors': len(errors),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--target', choices=['inprocess', 'server'], default='inprocess')
+    parser.add_argument('--products', type=int, default=1000)
+    parser.add_argument('--clients', type=int, default=2000)
+    parser.add_argument('--orders', type=int, default=5000)
+    parser.add_argument('--end-date', type=lambda value: datetime.strptime(value, '%Y-%m-%d'),
+                        default=datetime(2026, 1, 1), help='Newest order in the dataset')
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--skip-seed', action='store_true', help='Reuse the dataset already at DATABASE_URL')
+    parser.add_argument('--herd', type=int, default=16, help='Identical requests released at once')
+    parser.add_argument('--rounds', type=int, default=20)
+    parser.add_argument('--paths', nargs='+', default=['/api/products/', '/api/reports/sales-by-category'])
+    parser.add_argument('--accept-encoding', default='gzip')
+    parser.add_argument('--workers', type=int, default=2, help='gunicorn workers (--target server)')
+    parser.add_argument('--worker-threads', type=int, default=16, help='gunicorn threads (--target server)')
+    args = parser.parse_args()
+
+    config = make_config(PASSWORD_HASH_WORKERS=0, METRICS_SERVER_TIMING=True)
+    if not args.skip_seed:
+        seed_dataset(create_app(config), args.products, args.clients, args.orders, args.seed, args.end_date)
+
+    modes = ['off', 'worker'] + (['pod'] if args.target == 'server' else [])
+    for mode in modes:
+        target = make_target(config, mode, args)
+        try:
+            status, body, *_ = target.request('POST', '/api/auth/login',
+                                             {'username': 'admin', 'password': 'admin123'})
+            if status != 200:
+                raise RuntimeError(f'admin login failed with {status}')
+            headers = {'Accept-Encoding': args.accept_encoding,
+                       'Authorization': f"Bearer {body['access_token']}"}
+            for path in args.paths:
+                # One unrecorded round warms connections and caches
+                run_herd(target, path, headers, args.herd, 1)
+                result = run_herd(target, path, headers, args.herd, args.rounds)
+                print(json.dumps({'mode': mode, 'path': path, 'herd': args.herd, **result}))
+                sys.stdout.flush()
+        finally:
+            target.close()
+
+
+if __name__ == '__main__':
+    main()
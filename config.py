@@ -1,4 +1,5 @@
 import os
+from datetime import timedelta
 
 class Config:
     # Database credentials
@@ -9,11 +10,165 @@ class Config:
     DB_PORT = os.getenv("DB_PORT", "5433")
 
     # SQLAlchemy settings
-    SQLALCHEMY_DATABASE_URI = (
-        f"postgresql://{DB_USER}:{DB_PASSWORD}@{DB_HOST}:{DB_PORT}/{DB_NAME}"
+    SQLALCHEMY_DATABASE_URI = os.getenv(
+        "DATABASE_URL",
+        f"postgresql+psycopg2://{DB_USER}:{DB_PASSWORD}@{DB_HOST}:{DB_PORT}/{DB_NAME}"
     )
     SQLALCHEMY_TRACK_MODIFICATIONS = False
 
+    # Connection pool, per worker process. With INVALIDATION_NOTIFY on, each worker also holds
+    # one LISTEN connection outside the pool (app/invalidation.py), so keep
+    # pods x GUNICORN_WORKERS x (DB_POOL_SIZE + DB_MAX_OVERFLOW + 1) below Postgres max_connections,
+    # less superuser_reserved_connections and the migrate and maintenance jobs.
+    # Production at its HPA ceiling: 10 x 2 x (2 + 1 + 1) = 80 of the default 100.
+    DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "2"))
+    DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "1"))
+    DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "10"))
+    DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", "1800"))
+    DB_POOL_PRE_PING = os.getenv("DB_POOL_PRE_PING", "1") == "1"
+    DB_PGBOUNCER = os.getenv("DB_PGBOUNCER", "0") == "1"  # PgBouncer in transaction pooling mode
+
+    # statement_timeout in milliseconds, per blueprint with a default for the rest
+    DB_STATEMENT_TIMEOUT_MS = int(os.getenv("DB_STATEMENT_TIMEOUT_MS", "5000"))
+    STATEMENT_TIMEOUTS_MS = {
+        "products": int(os.getenv("STATEMENT_TIMEOUT_CATALOG_MS", "1000")),
+        "auth": int(os.getenv("STATEMENT_TIMEOUT_AUTH_MS", "1000")),
+        "reports": int(os.getenv("STATEMENT_TIMEOUT_REPORTS_MS", "30000")),
+    }
+
+    # Startup only compares the schema version; migrations run via flask db-upgrade
+    SCHEMA_CHECK_ON_STARTUP = os.getenv("SCHEMA_CHECK_ON_STARTUP", "1") == "1"
+
+    # Add Server-Timing (app and db time, query count) to every response
+    METRICS_SERVER_TIMING = os.getenv("METRICS_SERVER_TIMING", "0") == "1"
+
+    # Response compression (see app/compression.py): gzip, br and zstd (brotli and zstandard are in
+    # requirements.txt). Buffered bodies under COMPRESSION_MIN_SIZE bytes are sent as is.
+    COMPRESSION_ENABLED = os.getenv("COMPRESSION_ENABLED", "1") == "1"
+    COMPRESSION_MIN_SIZE = int(os.getenv("COMPRESSION_MIN_SIZE", "1024"))
+    COMPRESSION_LEVELS = {
+        "gzip": int(os.getenv("COMPRESSION_GZIP_LEVEL", "6")),
+        "br": int(os.getenv("COMPRESSION_BROTLI_QUALITY", "5")),
+        "zstd": int(os.getenv("COMPRESSION_ZSTD_LEVEL", "3")),
+    }
+    # Rows per batch for streamed collection responses (GET /api/products/, GET /api/orders/)
+    STREAM_BATCH_SIZE = int(os.getenv("STREAM_BATCH_SIZE", "500"))
+
+    # Cross-replica cache invalidation (see app/invalidation.py): commits NOTIFY what they changed and
+    # every worker LISTENs on INVALIDATION_CHANNEL. Postgres only. LISTEN needs a session of its own, so
+    # with DB_PGBOUNCER set INVALIDATION_LISTEN_URL to a direct connection.
+    INVALIDATION_NOTIFY = os.getenv("INVALIDATION_NOTIFY", "1") == "1"
+    INVALIDATION_CHANNEL = os.getenv("INVALIDATION_CHANNEL", "webstore_invalidation")
+    INVALIDATION_LISTEN_URL = os.getenv("INVALIDATION_LISTEN_URL")
+
+    # Change feed (/api/changes, see app/outbox.py). A long-poll waits at most OUTBOX_MAX_WAIT seconds, and
+    # at most OUTBOX_MAX_WAITERS of them hold a thread per worker. flask prune-outbox keeps OUTBOX_RETENTION_DAYS.
+    OUTBOX_PAGE_SIZE = int(os.getenv("OUTBOX_PAGE_SIZE", "500"))
+    OUTBOX_MAX_WAIT = float(os.getenv("OUTBOX_MAX_WAIT", "25"))
+    OUTBOX_MAX_WAITERS = int(os.getenv("OUTBOX_MAX_WAITERS", "2"))
+    OUTBOX_RETENTION_DAYS = int(os.getenv("OUTBOX_RETENTION_DAYS", "7"))
+
+    # POST /api/batch (see app/subrequests.py): sub-requests per batch, and threads per worker for
+    # running a batch's consecutive GETs in parallel. Each of those threads checks out its own pooled
+    # connection, so the threads are capped at DB_POOL_SIZE + DB_MAX_OVERFLOW - 1, keeping one for
+    # the batch request itself; raise the pool to run more.
+    BATCH_MAX_REQUESTS = int(os.getenv("BATCH_MAX_REQUESTS", "50"))
+    BATCH_MAX_PARALLEL = max(1, min(int(os.getenv("BATCH_MAX_PARALLEL", "4")),
+                                    DB_POOL_SIZE + DB_MAX_OVERFLOW - 1))
+
+    # Per-pod stock table in shared memory (see app/stockshm.py); unset disables it. Product ids at or
+    # above STOCK_SHM_SLOTS always go to the database. Stock shown may lag by STOCK_SHM_MAX_AGE seconds,
+    # or only until the invalidation notice arrives on Postgres.
+    STOCK_SHM_PATH = os.getenv("STOCK_SHM_PATH")
+    STOCK_SHM_SLOTS = int(os.getenv("STOCK_SHM_SLOTS", "262144"))
+    STOCK_SHM_MAX_AGE = float(os.getenv("STOCK_SHM_MAX_AGE", "5"))
+
+    # Type-ahead suggestions (/api/products/suggest, see app/suggest.py) from an in-memory index per worker.
+    # SUGGEST_LIMIT caps the suggestions per lookup; popularity is reloaded every SUGGEST_REFRESH_SECONDS.
+    SUGGEST_ENABLED = os.getenv("SUGGEST_ENABLED", "1") == "1"
+    SUGGEST_LIMIT = int(os.getenv("SUGGEST_LIMIT", "10"))
+    SUGGEST_REFRESH_SECONDS = float(os.getenv("SUGGEST_REFRESH_SECONDS", "900"))
+
+    # Co-purchase index (/api/products/<id>/related, see app/copurchase.py): each product keeps its
+    # COPURCHASE_KEEP strongest partners, built once by flask db-upgrade and updated by order confirmations.
+    COPURCHASE_KEEP = int(os.getenv("COPURCHASE_KEEP", "50"))
+
+    # Low-stock watchlist (/api/products/low-stock, see app/lowstock.py): at most LOW_STOCK_LIMIT products per
+    # read. With LOW_STOCK_EVENTS, products crossing their reorder threshold also go on the /api/changes feed.
+    LOW_STOCK_LIMIT = int(os.getenv("LOW_STOCK_LIMIT", "500"))
+    LOW_STOCK_EVENTS = os.getenv("LOW_STOCK_EVENTS", "0") == "1"
+
+    # Monthly order partitions and archival (see app/partitions.py): flask maintain-partitions creates
+    # PARTITION_MONTHS_AHEAD months ahead and archives months older than ORDER_RETENTION_MONTHS to ORDER_ARCHIVE_DIR.
+    PARTITION_MONTHS_AHEAD = int(os.getenv("PARTITION_MONTHS_AHEAD", "3"))
+    ORDER_RETENTION_MONTHS = int(os.getenv("ORDER_RETENTION_MONTHS", "24"))
+    ORDER_ARCHIVE_DIR = os.getenv("ORDER_ARCHIVE_DIR", "archive")
+
+    # Single-flight coalescing of identical concurrent reads (see app/coalesce.py). With
+    # COALESCE_LOCK_DIR (on tmpfs) the pod's workers coalesce with each other too.
+    COALESCE_ENABLED = os.getenv("COALESCE_ENABLED", "1") == "1"
+    COALESCE_LOCK_DIR = os.getenv("COALESCE_LOCK_DIR")
+    COALESCE_TIMEOUT = float(os.getenv("COALESCE_TIMEOUT", "10"))
+
+    # Query budgets declared with @query_budget: log overruns, or raise when enforced (tests).
+    # QUERY_DEBUG also logs statements repeated N_PLUS_ONE_THRESHOLD times in one request.
+    QUERY_BUDGET_ENFORCE = os.getenv("QUERY_BUDGET_ENFORCE", "0") == "1"
+    QUERY_DEBUG = os.getenv("QUERY_DEBUG", "1" if os.getenv("FLASK_ENV") == "development" else "0") == "1"
+    N_PLUS_ONE_THRESHOLD = int(os.getenv("N_PLUS_ONE_THRESHOLD", "3"))
+
+    # Slow-query log (see app/slowlog.py); 0 disables it. Plans are re-captured for a new worst
+    # case at most every SLOW_QUERY_EXPLAIN_INTERVAL seconds per statement fingerprint.
+    SLOW_QUERY_MS = float(os.getenv("SLOW_QUERY_MS", "500"))
+    SLOW_QUERY_EXPLAIN = os.getenv("SLOW_QUERY_EXPLAIN", "1") == "1"
+    SLOW_QUERY_EXPLAIN_INTERVAL = float(os.getenv("SLOW_QUERY_EXPLAIN_INTERVAL", "300"))
+    SLOW_QUERY_MAX_ENTRIES = int(os.getenv("SLOW_QUERY_MAX_ENTRIES", "200"))
+
+    # Request profiling (see app/profiling.py): admins send X-Profile: 1, or sample a share of traffic.
+    # PROFILE_MODE is "cprofile" (deterministic, pstats) or "sampler" (stack samples, collapsed stacks).
+    PROFILE_HEADER_ENABLED = os.getenv("PROFILE_HEADER_ENABLED", "1") == "1"
+    PROFILE_SAMPLE_RATE = float(os.getenv("PROFILE_SAMPLE_RATE", "0"))
+    PROFILE_MODE = os.getenv("PROFILE_MODE", "cprofile")
+    PROFILE_SAMPLER_INTERVAL_MS = float(os.getenv("PROFILE_SAMPLER_INTERVAL_MS", "5"))
+    PROFILE_BUFFER_SIZE = int(os.getenv("PROFILE_BUFFER_SIZE", "20"))
+
+    # JWT: short-lived access tokens, renewed with rotating refresh tokens
+    SECRET_KEY = os.getenv("SECRET_KEY", "dev-secret-key-change-in-prod")
+    JWT_ACCESS_TOKEN_EXPIRES = timedelta(minutes=int(os.getenv("JWT_ACCESS_TOKEN_MINUTES", "15")))
+    JWT_REFRESH_TOKEN_EXPIRES = timedelta(days=int(os.getenv("JWT_REFRESH_TOKEN_DAYS", "30")))
+
+    # Password hashing (method string uses Werkzeug's format, e.g. "pbkdf2:sha256:600000")
+    PASSWORD_HASH_METHOD = os.getenv("PASSWORD_HASH_METHOD", "scrypt:32768:8:1")
+    PASSWORD_SALT_LENGTH = int(os.getenv("PASSWORD_SALT_LENGTH", "16"))
+    PASSWORD_HASH_WORKERS = int(os.getenv("PASSWORD_HASH_WORKERS", "2"))  # 0 hashes inline
+    PASSWORD_HASH_MAX_CONCURRENCY = int(os.getenv("PASSWORD_HASH_MAX_CONCURRENCY", "4"))
+    PASSWORD_HASH_QUEUE_TIMEOUT = float(os.getenv("PASSWORD_HASH_QUEUE_TIMEOUT", "2.0"))
+
+    # Admission control per endpoint class (see app/ratelimit.py)
+    RATELIMIT_ENABLED = os.getenv("RATELIMIT_ENABLED", "1") == "1"
+    # "<requests per second>/<burst>" per client (JWT identity, else IP)
+    RATELIMIT_RATES = {
+        "catalog": os.getenv("RATELIMIT_CATALOG", "20/40"),
+        "checkout": os.getenv("RATELIMIT_CHECKOUT", "2/10"),
+        "reports": os.getenv("RATELIMIT_REPORTS", "1/5"),
+        "auth": os.getenv("RATELIMIT_AUTH", "5/10"),
+    }
+    RATELIMIT_ROLE_MULTIPLIERS = {"admin": 5, "advanced_user": 2}
+    # In-flight requests per class, per worker process, out of its GUNICORN_THREADS threads; 0 disables
+    # a cap. The defaults keep a thread for checkout: catalog gets all threads but one, reports and auth
+    # all but two, and RATELIMIT_SHARED_CONCURRENCY holds the capped classes together to all but one.
+    WORKER_THREADS = int(os.getenv("GUNICORN_THREADS", "4"))
+    RATELIMIT_CONCURRENCY = {
+        "catalog": int(os.getenv("CONCURRENCY_CATALOG", str(max(1, WORKER_THREADS - 1)))),
+        "checkout": int(os.getenv("CONCURRENCY_CHECKOUT", "0")),
+        "reports": int(os.getenv("CONCURRENCY_REPORTS", str(max(1, min(2, WORKER_THREADS - 2))))),
+        "auth": int(os.getenv("CONCURRENCY_AUTH", str(max(1, WORKER_THREADS - 2)))),
+    }
+    RATELIMIT_SHARED_CONCURRENCY = int(os.getenv("CONCURRENCY_SHARED", str(max(1, WORKER_THREADS - 1))))
+    RATELIMIT_MAX_KEYS = int(os.getenv("RATELIMIT_MAX_KEYS", "100000"))
+    # Reverse proxies in front of the app that append to X-Forwarded-For. Client addresses (rate limit
+    # keys among them) are taken that many entries from the right, through werkzeug's ProxyFix; 0 trusts none.
+    TRUSTED_PROXY_HOPS = int(os.getenv("TRUSTED_PROXY_HOPS", "0"))
+
 
 # Ensure the config is used if running directly (optional)
 if __name__ == "__main__":
@@ -0,0 +1,39 @@
+"""Gunicorn settings for production serving, read from the environment.
+
+    gunicorn -c gunicorn.conf.py run:app
+
+Values come from the webshop-config ConfigMap (02-configmaps-secrets.yaml).
+"""
+import os
+
+bind = f"0.0.0.0:{os.getenv('PORT', '5000')}"
+
+# Prefork workers, each with a small thread pool
+workers = int(os.getenv("GUNICORN_WORKERS", "2"))
+threads = int(os.getenv("GUNICORN_THREADS", "4"))
+worker_class = "gthread"
+
+# Import the app once in the master so workers fork with it already loaded
+preload_app = True
+
+keepalive = int(os.getenv("GUNICORN_KEEPALIVE", "5"))
+timeout = int(os.getenv("GUNICORN_TIMEOUT", "30"))
+graceful_timeout = int(os.getenv("GUNICORN_GRACEFUL_TIMEOUT", "30"))
+max_requests = int(os.getenv("GUNICORN_MAX_REQUESTS", "0"))
+max_requests_jitter = int(os.getenv("GUNICORN_MAX_REQUESTS_JITTER", "0"))
+
+accesslog = os.getenv("GUNICORN_ACCESS_LOG", "-")
+errorlog = "-"
+
+
+def post_fork(server, worker):
+    """Drop any connections inherited from the master so each worker opens its own"""
+    from run import app
+    from app.extensions import db
+    with app.app_context():
+        db.engine.dispose(close=False)
+    # Listen for invalidations and build the suggestion index before the first request arrives
+    app.extensions['invalidation'].start()
+    if 'suggest' in app.extensions:
+        with app.app_context():
+            app.extensions['suggest'].start()
@@ -1,6 +1,10 @@
+import os
+from datetime import datetime, timedelta
+import click
 from flask import render_template
 from app import create_app
 from app.extensions import db
+from app import copurchase, denylist, lowstock, migrations, outbox, partitions, readmodel, synthetic
 from app.models import User, Category, Brand, Size, Color, Product
 
 app = create_app()
@@ -25,15 +29,120 @@ def api_info():
         }
     }
 
+@app.cli.command('db-upgrade')
+def db_upgrade_command():
+    """Apply pending schema migrations"""
+    version = migrations.upgrade(db.engine)
+    print(f"Database schema is at version {version}")
+    written = readmodel.rebuild(missing_only=True)
+    if written:
+        print(f"Built {written} missing product documents")
+    if not copurchase.is_built():
+        print(f"Built {copurchase.build(app.config['COPURCHASE_KEEP'])} co-purchase counts")
+    if not lowstock.is_built():
+        print(f"Built {lowstock.build()} stock levels")
+    partitions.create_upcoming(db.engine, app.config['PARTITION_MONTHS_AHEAD'])
+
+@app.cli.command('db-version')
+def db_version_command():
+    """Show the applied and latest schema versions"""
+    with db.engine.connect() as conn:
+        current = migrations.current_version(conn)
+    print(f"Applied: {current}, latest: {migrations.head()}")
+
+@app.cli.command('rebuild-product-documents')
+def rebuild_product_documents_command():
+    """Rebuild every product's stored catalog document"""
+    print(f"Rebuilt {readmodel.rebuild()} product documents")
+
+@app.cli.command('build-copurchases')
+@click.option('--force', is_flag=True, help='Recount even though archived months would drop out of the counts')
+def build_copurchases_command(force):
+    """Recount which products are bought together from the order history"""
+    with db.engine.connect() as conn:
+        archived = partitions.has_archives(conn)
+    if archived and not force:
+        raise click.UsageError('Archived months are not recounted and would be lost; pass --force to rebuild anyway')
+    print(f"Built {copurchase.build(app.config['COPURCHASE_KEEP'])} co-purchase counts")
+
+@app.cli.command('build-stock-levels')
+def build_stock_levels_command():
+    """Recompute every product's stock level for the low-stock watchlist"""
+    print(f"Built {lowstock.build()} stock levels")
+
+@app.cli.command('maintain-partitions')
+@click.option('--months-ahead', type=int, help='Months of order partitions to create ahead; defaults to PARTITION_MONTHS_AHEAD')
+@click.option('--retain', type=int, help='Months of orders to keep live; defaults to ORDER_RETENTION_MONTHS')
+@click.option('--archive-dir', help='Where archived months are written; defaults to ORDER_ARCHIVE_DIR')
+@click.option('--keep-tables', is_flag=True, help='Detach old partitions and keep them as plain tables instead (Postgres)')
+def maintain_partitions_command(months_ahead, retain, archive_dir, keep_tables):
+    """Create upcoming order partitions and archive the months past retention"""
+    if keep_tables and db.engine.dialect.name != 'postgresql':
+        raise click.UsageError('--keep-tables needs Postgres; SQLite has no partitions to detach')
+    config = app.config
+    partitions.create_upcoming(db.engine, config['PARTITION_MONTHS_AHEAD'] if months_ahead is None else months_ahead)
+    months = partitions.archive(db.engine, config['ORDER_RETENTION_MONTHS'] if retain is None else retain,
+                                archive_dir or config['ORDER_ARCHIVE_DIR'], keep_tables)
+    print(f"Archived {len(months)} months of orders")
+
+@app.cli.command('prune-outbox')
+@click.option('--days', type=int, help='Days of change feed events to keep; defaults to OUTBOX_RETENTION_DAYS')
+def prune_outbox_command(days):
+    """Delete change feed events past the retention period"""
+    days = app.config['OUTBOX_RETENTION_DAYS'] if days is None else days
+    print(f"Deleted {outbox.prune(days)} change feed events")
+
+@app.cli.command('prune-revoked-tokens')
+def prune_revoked_tokens_command():
+    """Delete revoked token ids whose tokens have expired"""
+    print(f"Deleted {denylist.get_denylist().prune()} revoked token ids")
+
+@app.cli.command('seed-synthetic')
+@click.option('--products', default=100000, show_default=True)
+@click.option('--clients', default=1000000, show_default=True)
+@click.option('--orders', default=10000000, show_default=True)
+@click.option('--days', default=730, show_default=True, help='Order history length')
+@click.option('--end-date', type=click.DateTime(), help='Newest order date; defaults to now')
+@click.option('--seed', default=42, show_default=True)
+@click.option('--workers', default=os.cpu_count() or 1, show_default=True, help='Loader processes (Postgres only)')
+@click.option('--chunk-size', default=20000, show_default=True, help='Rows per transaction')
+def seed_synthetic_command(products, clients, orders, days, end_date, seed, workers, chunk_size):
+    """Replace the database with a large synthetic dataset"""
+    print("Dropping all tables...")
+    db.drop_all()
+    migrations.drop_version_table(db.engine)
+    migrations.upgrade(db.engine)
+
+    admin = User(username='admin', email='admin@webstore.com', role='admin')
+    admin.set_password('admin123')
+    db.session.add(admin)
+    db.session.commit()
+    db.session.remove()
+    # Partitions for the whole history, or every order would land in the default ones
+    partitions.create_upcoming(db.engine, app.config['PARTITION_MONTHS_AHEAD'],
+                               since=(end_date or datetime.utcnow()) - timedelta(days=days))
+
+    synthetic.generate(
+        db.engine.url.render_as_string(hide_password=False),
+        products=products, clients=clients, orders=orders, days=days, seed=seed,
+        now=end_date, workers=workers, chunk_size=chunk_size,
+    )
+    print(f"Built {readmodel.rebuild()} product documents")
+    print(f"Built {copurchase.build(app.config['COPURCHASE_KEEP'])} co-purchase counts")
+    print(f"Built {lowstock.build()} stock levels")
+    print("Admin: username=admin, password=admin123")
+
 @app.cli.command('init-db')
 def init_db_command():
     """Initialize the database with sample data"""
     with app.app_context():
         print("Dropping all tables...")
         db.drop_all()
+        migrations.drop_version_table(db.engine)
         
         print("Creating all tables...")
-        db.create_all()
+        migrations.upgrade(db.engine)
+        partitions.create_upcoming(db.engine, app.config['PARTITION_MONTHS_AHEAD'])
         
         print("Creating admin user...")
         admin = User(username='admin', email='admin@webstore.com', role='admin')
@@ -167,4 +276,7 @@ def init_db_command():
         print("="*50 + "\n")
 
 if __name__ == '__main__':
-    app.run(host="0.0.0.0", debug=True, port=5000)
+    if os.getenv('FLASK_ENV', 'development') != 'development':
+        # Never serve real traffic from the debug server
+        os.execvp('gunicorn', ['gunicorn', '-c', 'gunicorn.conf.py', 'run:app'])
+    app.run(host="0.0.0.0", debug=True, port=int(os.getenv('PORT', '5000')))
@@ -0,0 +1,125 @@
+"""Shared fixtures: an app on a fresh database, its schema built by the migrations as in production.
+
+Runs against a temporary SQLite file, or Postgres when TEST_DATABASE_URL is set:
+
+    python -m pytest -q tests
+"""
+import os
+
+import pytest
+from sqlalchemy import MetaData, event
+
+from app import create_app, migrations
+from app.extensions import db
+from app.models import User, Category, Brand, Size, Color, Product, Client, Order, OrderItem
+from config import Config
+
+
+def make_app(tmp_path, **overrides):
+    database_url = os.getenv("TEST_DATABASE_URL") or f"sqlite:///{tmp_path / 'test.db'}"
+
+    class TestConfig(Config):
+        TESTING = True
+        SQLALCHEMY_DATABASE_URI = database_url
+        SECRET_KEY = "test-secret"
+        QUERY_BUDGET_ENFORCE = True
+        QUERY_DEBUG = True
+        PASSWORD_HASH_METHOD = "pbkdf2:sha256:1000"
+        PASSWORD_HASH_WORKERS = 0
+        RATELIMIT_ENABLED = False
+        SCHEMA_CHECK_ON_STARTUP = False
+        # Its background build would show up in the statement counts
+        SUGGEST_ENABLED = False
+
+    for key, value in overrides.items():
+        setattr(TestConfig, key, value)
+
+    app = create_app(TestConfig)
+    with app.app_context():
+        reset_schema(db.engine)
+        migrations.upgrade(db.engine, log=lambda message: None)
+    return app
+
+
+def reset_schema(engine):
+    """Drop every table, including those only the migrations know about"""
+    with engine.begin() as conn:
+        if conn.dialect.name == "postgresql":
+            conn.exec_driver_sql("DROP SCHEMA public CASCADE")
+            conn.exec_driver_sql("CREATE SCHEMA public")
+        else:
+            metadata = MetaData()
+            metadata.reflect(conn)
+            metadata.drop_all(conn)
+
+
+def seed(app, products=6, orders=6):
+    """A small catalog with orders spread over a few clients"""
+    with app.app_context():
+        admin = User(username="admin", email="admin@example.com", role="admin")
+        admin.set_password("admin123")
+        db.session.add(admin)
+
+        categories = [Category(name=f"Category {i}") for i in range(3)]
+        brands = [Brand(name=f"Brand {i}") for i in range(3)]
+        sizes = [Size(name=f"Size {i}") for i in range(3)]
+        colors = [Color(name=f"Color {i}") for i in range(3)]
+        db.session.add_all(categories + brands + sizes + colors)
+
+        for i in range(products):
+            product = Product(
+                name=f"Product {i}", price=10 + i, gender="Men", initial_quantity=1000,
+                category=categories[i % 3], brand=brands[i % 3]
+            )
+            product.sizes = sizes[:2]
+            product.colors = colors[:2]
+            db.session.add(product)
+
+        clients = [Client(name=f"Client {i}", email=f"client{i}@example.com") for i in range(3)]
+        db.session.add_all(clients)
+        db.session.flush()
+
+        for i in range(orders):
+            order = Order(client=clients[i % 3], status="confirmed", total_amount=20)
+            order.items = [
+                OrderItem(product_id=(i % products) + 1, quantity=1, price_at_purchase=10),
+                OrderItem(product_id=((i + 1) % products) + 1, quantity=1, price_at_purchase=10),
+            ]
+            db.session.add(order)
+        db.session.commit()
+
+
+class StatementCounter:
+    def __init__(self, app):
+        with app.app_context():
+            self.engine = db.engine
+        self.count = 0
+
+    def __call__(self, *args):
+        self.count += 1
+
+    def __enter__(self):
+        event.listen(self.engine, "before_cursor_execute", self)
+        return self
+
+    def __exit__(self, *exc):
+        event.remove(self.engine, "before_cursor_execute", self)
+
+
+@pytest.fixture
+def app(tmp_path):
+    app = make_app(tmp_path)
+    seed(app)
+    return app
+
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
+
+
+@pytest.fixture
+def auth(client):
+    response = client.post("/api/auth/login", json={"username": "admin", "password": "admin123"})
+    assert response.status_code == 200
+    return {"Authorization": f"Bearer {response.get_json()['access_token']}"}
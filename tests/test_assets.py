@@ -0,0 +1,68 @@
+"""Fingerprinted, precompressed static assets (app/assets.py)"""
+import gzip
+import os
+
+from app.assets import AssetManifest, asset_url
+from conftest import make_app
+
+
+def test_manifest_names_assets_after_their_content(tmp_path):
+    folder = tmp_path / "static"
+    (folder / "css").mkdir(parents=True)
+    (folder / "css" / "site.css").write_text("body { color: red; }\n" * 50)
+    (folder / "logo.bin").write_bytes(b"\x00\x01")
+
+    manifest = AssetManifest(str(folder))
+    css = manifest.get("css/site.css")
+    assert css.name == f"css/site.{css.etag}.css"
+    assert manifest.by_name[css.name] is css
+    assert gzip.decompress(css.bodies["gzip"]) == css.bodies[None]
+    assert list(manifest.get("logo.bin").bodies) == [None]
+
+    same = AssetManifest(str(folder)).get("css/site.css")
+    assert same.name == css.name
+
+
+def test_assets_are_served_immutable_and_negotiated(tmp_path):
+    app = make_app(tmp_path)
+    client = app.test_client()
+    with app.test_request_context():
+        url = asset_url("css/style.css")
+    assert url.startswith("/assets/css/style.") and url.endswith(".css")
+
+    response = client.get(url, headers={"Accept-Encoding": "gzip"})
+    assert response.status_code == 200
+    assert response.headers["Content-Encoding"] == "gzip"
+    assert "immutable" in response.headers["Cache-Control"]
+    assert "Accept-Encoding" in response.headers["Vary"]
+    etag = response.headers["ETag"]
+
+    plain = client.get(url, headers={"Accept-Encoding": "identity"})
+    assert "Content-Encoding" not in plain.headers
+    assert gzip.decompress(response.data) == plain.data
+    assert client.get(url, headers={"Accept-Encoding": "gzip", "If-None-Match": etag}).status_code == 304
+    assert client.get("/assets/css/style.000000000000.css").status_code == 404
+
+
+def test_edits_are_picked_up_only_in_debug_mode(tmp_path):
+    folder = tmp_path / "static"
+    folder.mkdir()
+    source = folder / "app.js"
+    source.write_text("let a = 1;\n")
+    app = make_app(tmp_path)
+    app.extensions["assets"] = AssetManifest(str(folder))
+
+    def url():
+        with app.test_request_context():
+            return asset_url("app.js")
+
+    first = url()
+    source.write_text("let a = 2;\n")
+    os.utime(source, (1, 1))
+    assert url() == first
+
+    # run.py turns debug on after create_app, so it is read per request
+    app.debug = True
+    edited = url()
+    assert edited != first
+    assert app.test_client().get(edited).data == b"let a = 2;\n"
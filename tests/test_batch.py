@@ -0,0 +1,27 @@
+"""POST /api/batch (app/subrequests.py)"""
+import pytest
+
+
+@pytest.mark.parametrize("parallel", [False, True])
+def test_batch_runs_each_request_through_the_app(client, auth, parallel):
+    response = client.post("/api/batch", headers=auth, json={"parallel": parallel, "requests": [
+        {"id": "categories", "path": "/api/products/categories"},
+        {"id": "brands", "path": "/api/products/brands"},
+        {"id": "discount", "method": "PATCH", "path": "/api/products/1/discount",
+         "body": {"discount_percentage": 20}},
+        {"id": "product", "path": "/api/products/1"},
+        {"id": "quantity", "path": "/api/products/1/quantity"},
+        {"id": "anonymous", "path": "/api/users/", "headers": {"Authorization": ""}},
+        {"id": "missing", "path": "/api/products/999"},
+        {"id": "nested", "method": "POST", "path": "/api/batch"},
+    ]})
+    responses = {item["id"]: item for item in response.get_json()["responses"]}
+    assert list(responses) == ["categories", "brands", "discount", "product", "quantity",
+                               "anonymous", "missing", "nested"]
+    assert responses["categories"]["body"] == client.get("/api/products/categories").get_json()
+    assert responses["discount"]["status"] == 200
+    assert responses["product"]["body"]["discount_percentage"] == 20
+    assert responses["quantity"]["body"]["product_id"] == 1
+    assert responses["anonymous"]["status"] == 401
+    assert responses["missing"]["status"] == 404
+    assert responses["nested"]["status"] == 400
@@ -0,0 +1,48 @@
+"""Single-flight sharing of identical reads (app/coalesce.py)"""
+import time
+
+import pytest
+
+from conftest import StatementCounter
+
+
+def test_concurrent_identical_reads_share_one_computation(app, monkeypatch):
+    from concurrent.futures import ThreadPoolExecutor
+    from app import readmodel
+
+    encoded_products = readmodel.encoded_products
+
+    def slow_encoded_products(rows):
+        # Keep the first request in flight until the others have arrived
+        time.sleep(0.3)
+        return encoded_products(rows)
+
+    monkeypatch.setattr(readmodel, "encoded_products", slow_encoded_products)
+
+    def fetch(_):
+        return app.test_client().get("/api/products/").get_json()
+
+    with StatementCounter(app) as single:
+        expected = fetch(0)
+    with StatementCounter(app) as counter, ThreadPoolExecutor(8) as pool:
+        results = list(pool.map(fetch, range(8)))
+    assert results == [expected] * 8
+    assert counter.count == single.count
+
+
+def test_failed_stream_is_not_shared(tmp_path):
+    from app.coalesce import Flight, SingleFlight, Tee
+
+    def broken():
+        yield b"["
+        raise RuntimeError("database went away")
+
+    flights = SingleFlight(str(tmp_path / "locks"), 1)
+    flight = flights.flights["key"] = Flight()
+    flight.start(200, [])
+    tee = Tee(flights, "key", flight, broken(), flights.acquire("key")[0])
+    with pytest.raises(RuntimeError):
+        list(tee)
+    tee.close()
+    assert flight.body.failed and "key" not in flights.flights
+    assert not list((tmp_path / "locks").glob("*.result"))
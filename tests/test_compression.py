@@ -0,0 +1,61 @@
+"""Accept-Encoding negotiation and chunked compression of streamed bodies (app/compression.py)"""
+import gzip
+import json
+import zlib
+
+import pytest
+from flask import jsonify
+
+from conftest import make_app, seed
+
+
+@pytest.fixture
+def app(tmp_path):
+    app = make_app(tmp_path, STREAM_BATCH_SIZE=10)
+    seed(app, products=40)
+
+    @app.route("/big")
+    def big():
+        return jsonify([{"name": f"Product {i}", "price": i} for i in range(200)])
+
+    @app.route("/small")
+    def small():
+        return jsonify({"ok": True})
+
+    return app
+
+
+def test_buffered_responses_are_negotiated(app):
+    client = app.test_client()
+    plain = client.get("/big", headers={"Accept-Encoding": "identity"})
+    assert "Content-Encoding" not in plain.headers
+    assert plain.headers["Vary"] == "Accept-Encoding"
+
+    response = client.get("/big", headers={"Accept-Encoding": "gzip;q=0.5, deflate"})
+    assert response.headers["Content-Encoding"] == "gzip"
+    assert int(response.headers["Content-Length"]) == len(response.data) < len(plain.data)
+    assert gzip.decompress(response.data) == plain.data
+
+    # Under COMPRESSION_MIN_SIZE
+    assert "Content-Encoding" not in client.get("/small", headers={"Accept-Encoding": "gzip"}).headers
+
+
+@pytest.mark.parametrize("encoding, module", [("br", "brotli"), ("zstd", "zstandard")])
+def test_preferred_encoding_wins(app, encoding, module):
+    pytest.importorskip(module)
+    response = app.test_client().get("/big", headers={"Accept-Encoding": f"gzip;q=0.5, {encoding}"})
+    assert response.headers["Content-Encoding"] == encoding
+
+
+def test_streamed_chunks_decode_as_they_arrive(app):
+    response = app.test_client().get("/api/products/", headers={"Accept-Encoding": "gzip"}, buffered=False)
+    assert response.headers["Content-Encoding"] == "gzip"
+    assert "Content-Length" not in response.headers
+
+    decoder = zlib.decompressobj(47)
+    pieces = [decoder.decompress(chunk) for chunk in response.response]
+    response.close()
+    # Every batch is flushed, so each decodes without waiting for the next; the last chunk is the trailer
+    assert len(pieces) >= 5 and all(pieces[:-1])
+    assert decoder.eof
+    assert [product["id"] for product in json.loads(b"".join(pieces))] == list(range(1, 41))
@@ -0,0 +1,27 @@
+"""Co-purchase index (app/copurchase.py)"""
+from app import copurchase
+from app.extensions import db
+from app.models import Order, ProductCopurchase
+
+
+def test_copurchase_counts_follow_orders(app, client, auth):
+    def counts():
+        with app.app_context():
+            return sorted((row.product_id, row.related_product_id, row.orders)
+                          for row in ProductCopurchase.query.filter(ProductCopurchase.orders > 0))
+
+    with app.app_context():
+        copurchase.build(app.config["COPURCHASE_KEEP"])
+        db.session.get(Order, 1).status = "pending"
+        db.session.commit()
+
+    client.patch("/api/orders/1/status", json={"status": "confirmed"}, headers=auth)
+    client.patch("/api/orders/2/status", json={"status": "cancelled"}, headers=auth)
+    client.delete("/api/orders/3", headers=auth)
+    incremental = counts()
+    with app.app_context():
+        copurchase.build(app.config["COPURCHASE_KEEP"])
+    assert incremental == counts()
+
+    related = client.get("/api/products/1/related").get_json()["related"]
+    assert [(item["product_id"], item["orders"]) for item in related] == [(6, 1), (2, 1)]
@@ -0,0 +1,66 @@
+"""Connection pool metrics and per-blueprint statement timeouts (app/database.py)"""
+from sqlalchemy import event
+
+from app import database
+from app.extensions import db
+from conftest import make_app, seed
+
+
+class RecordingConnection:
+    class dialect:
+        name = "postgresql"
+
+    def __init__(self):
+        self.statements = []
+
+    def exec_driver_sql(self, statement):
+        self.statements.append(statement)
+
+
+def sample(text, name):
+    return next(float(line.rsplit(" ", 1)[1]) for line in text.splitlines() if line.startswith(name))
+
+
+def test_pool_checkouts_and_waits_are_exported(tmp_path):
+    app = make_app(tmp_path, SQLALCHEMY_ENGINE_OPTIONS={
+        "poolclass": database.InstrumentedQueuePool, "pool_size": 2, "max_overflow": 1,
+    })
+    seed(app)
+    client = app.test_client()
+    before = client.get("/metrics").get_data(as_text=True)
+    assert client.get("/api/products/1").status_code == 200
+    after = client.get("/metrics").get_data(as_text=True)
+
+    assert sample(after, "db_pool_checkouts_total") > sample(before, "db_pool_checkouts_total")
+    assert sample(after, "db_pool_wait_seconds_count") > sample(before, "db_pool_wait_seconds_count")
+    assert sample(after, 'db_pool_connections{state="checked_out"}') == 0
+    assert sample(after, 'db_pool_connections{state="idle"}') >= 1
+
+
+def test_engine_options_size_the_pool_and_set_the_default_timeout(tmp_path):
+    app = make_app(tmp_path)
+    config = dict(app.config, SQLALCHEMY_DATABASE_URI="postgresql://shop@db/shop", SQLALCHEMY_ENGINE_OPTIONS=None)
+    options = database.engine_options(config)
+    assert options["poolclass"] is database.InstrumentedQueuePool
+    assert (options["pool_size"], options["max_overflow"]) == (config["DB_POOL_SIZE"], config["DB_MAX_OVERFLOW"])
+    assert f"-c statement_timeout={config['DB_STATEMENT_TIMEOUT_MS']} " in options["connect_args"]["options"]
+
+    assert "connect_args" not in database.engine_options(dict(config, DB_PGBOUNCER=True))
+    assert database.engine_options(dict(app.config, SQLALCHEMY_ENGINE_OPTIONS=None)) == {}
+
+
+def test_each_transaction_gets_its_blueprints_timeout(tmp_path):
+    app = make_app(tmp_path, DB_STATEMENT_TIMEOUT_MS=5000, STATEMENT_TIMEOUTS_MS={"reports": 30000})
+    assert event.contains(db.session, "after_begin", database.set_statement_timeout)
+
+    for path, expected in [("/api/reports/sales-by-brand", 30000), ("/api/products/1", 5000)]:
+        connection = RecordingConnection()
+        with app.test_request_context(path):
+            database.set_statement_timeout(None, None, connection)
+        assert connection.statements == [f"SET LOCAL statement_timeout = {expected}"]
+
+    # Outside a request (migrations, CLI commands) the connection's own default applies
+    connection = RecordingConnection()
+    with app.app_context():
+        database.set_statement_timeout(None, None, connection)
+    assert connection.statements == []
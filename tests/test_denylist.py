@@ -0,0 +1,42 @@
+"""Revoked tokens (app/denylist.py)"""
+from sqlalchemy import event
+
+from app.extensions import db
+from conftest import make_app, seed
+
+
+def test_revoked_tokens_are_refused_by_every_worker(tmp_path):
+    # Two workers: separate apps on the same database
+    client, other = make_app(tmp_path).test_client(), make_app(tmp_path).test_client()
+    seed(client.application)
+    tokens = client.post("/api/auth/login", json={"username": "admin", "password": "admin123"}).get_json()
+    refresh = {"Authorization": f"Bearer {tokens['refresh_token']}"}
+
+    assert client.post("/api/auth/refresh", headers=refresh).status_code == 200
+    assert other.post("/api/auth/refresh", headers=refresh).status_code == 401
+
+    access = {"Authorization": f"Bearer {tokens['access_token']}"}
+    assert other.get("/api/auth/me", headers=access).status_code == 200
+    client.post("/api/auth/logout", headers=access)
+    assert other.get("/api/auth/me", headers=access).status_code == 401
+
+
+def test_lookup_shares_the_request_connection(tmp_path):
+    app = make_app(tmp_path)
+    seed(app)
+    client = app.test_client()
+    token = client.post("/api/auth/login", json={"username": "admin", "password": "admin123"}).get_json()
+    with app.app_context():
+        engine = db.engine
+    checkouts = []
+
+    def checkout(*args):
+        checkouts.append(args)
+
+    event.listen(engine, "checkout", checkout)
+    try:
+        response = client.get("/api/auth/me", headers={"Authorization": f"Bearer {token['access_token']}"})
+    finally:
+        event.remove(engine, "checkout", checkout)
+    assert response.status_code == 200
+    assert len(checkouts) == 1
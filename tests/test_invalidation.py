@@ -0,0 +1,30 @@
+"""Change announcements to caches (app/invalidation.py)"""
+import json
+import time
+
+from conftest import StatementCounter, make_app, seed
+
+
+def test_commits_announce_changes_to_caches(tmp_path):
+    app = make_app(tmp_path, STOCK_SHM_PATH=str(tmp_path / "stock"))
+    seed(app)
+    client = app.test_client()
+    token = client.post(
+        "/api/auth/login", json={"username": "admin", "password": "admin123"}
+    ).get_json()["access_token"]
+    bus = app.extensions["invalidation"]
+    changes = []
+    bus.subscribe("stock", changes.append)
+
+    # Order 1 holds products 1 and 2
+    client.patch("/api/orders/1/status", json={"status": "cancelled"},
+                 headers={"Authorization": f"Bearer {token}"})
+    assert [change.ids for change in changes] == [{1, 2}]
+
+    # A notice from another pod evicts the shared stock slot
+    client.get("/api/products/1/quantity")
+    bus.receive(json.dumps({"origin": "other-pod:1", "version": 1, "at": time.time(),
+                            "changes": {"stock": [1]}}))
+    with StatementCounter(app) as counter:
+        assert client.get("/api/products/1/quantity").get_json()["current_quantity"] == 999
+    assert counter.count > 0
@@ -0,0 +1,43 @@
+"""Stock levels and the low-stock watchlist (app/lowstock.py)"""
+from app import lowstock
+from app.extensions import db
+from app.models import Order, OrderItem, StockLevel
+from conftest import make_app, seed
+
+
+def test_low_stock_watchlist_follows_orders(tmp_path):
+    app = make_app(tmp_path, LOW_STOCK_EVENTS=True)
+    seed(app)
+    client = app.test_client()
+    token = client.post("/api/auth/login", json={"username": "admin", "password": "admin123"})
+    auth = {"Authorization": f"Bearer {token.get_json()['access_token']}"}
+
+    def levels():
+        with app.app_context():
+            return sorted((row.product_id, row.available, row.margin) for row in StockLevel.query)
+
+    # Product 1 has sold 2 of its 1000
+    client.put("/api/products/1", json={"reorder_threshold": 990}, headers=auth)
+    cursor = client.get("/api/changes/", headers=auth).get_json()["cursor"]
+    with app.app_context():
+        db.session.add(Order(client_id=1, status="pending", total_amount=90, items=[
+            OrderItem(product_id=1, quantity=9, price_at_purchase=10),
+            OrderItem(product_id=2, quantity=1, price_at_purchase=10),
+        ]))
+        db.session.commit()
+    client.patch("/api/orders/7/status", json={"status": "confirmed"}, headers=auth)
+    client.delete("/api/orders/1", headers=auth)
+    incremental = levels()
+    with app.app_context():
+        lowstock.build()
+    assert incremental == levels()
+
+    low = client.get("/api/products/low-stock", headers=auth).get_json()
+    assert low["products"] == [{"product_id": 1, "name": "Product 0", "current_quantity": 990,
+                                "reorder_threshold": 990, "shortfall": 0}]
+    # Order 6 also had one of product 1
+    client.delete("/api/orders/6", headers=auth)
+    assert client.get("/api/products/low-stock", headers=auth).get_json()["count"] == 0
+    events = client.get(f"/api/changes/?since={cursor}", headers=auth).get_json()["events"]
+    assert [(event["id"], event["action"]) for event in events if event["entity"] == "product"] == [
+        (1, "low_stock"), (1, "restocked")]
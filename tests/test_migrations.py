@@ -0,0 +1,43 @@
+"""Versioned migrations (app/migrations), including those that run outside a transaction"""
+import types
+
+import pytest
+from sqlalchemy import create_engine, inspect, text
+
+from app import migrations
+
+
+def migration(version, statement, transactional=True, seen=None):
+    def upgrade(conn):
+        conn.exec_driver_sql(statement)
+        if seen is not None:
+            seen.append(conn.connection.dbapi_connection.in_transaction)
+    module = types.SimpleNamespace(upgrade=upgrade)
+    if not transactional:
+        module.TRANSACTIONAL = False
+    return version, f"step{version}", module
+
+
+def test_non_transactional_migrations_run_on_their_own(tmp_path, monkeypatch):
+    engine = create_engine(f"sqlite:///{tmp_path / 'migrations.db'}")
+    seen = []
+    monkeypatch.setattr(migrations, "available", lambda: [
+        migration(1, "CREATE TABLE a (id INTEGER)"),
+        migration(2, "CREATE INDEX ix_a_id ON a (id)", transactional=False, seen=seen),
+        migration(3, "CREATE TABLE IF NOT EXISTS b (id INTEGER)"),
+        migration(4, "CREATE TABLE c (id INTEGER"),
+    ])
+
+    with pytest.raises(Exception):
+        migrations.upgrade(engine, log=lambda message: None)
+
+    # 4 failed, so 3 went unrecorded with it; 1 and 2 were committed before 3 started
+    assert seen == [False]
+    with engine.connect() as conn:
+        assert migrations.current_version(conn) == 2
+        assert conn.execute(text("SELECT name FROM schema_version ORDER BY version")).scalars().all() \
+            == ["step1", "step2"]
+    assert "ix_a_id" in [index["name"] for index in inspect(engine).get_indexes("a")]
+
+    assert migrations.upgrade(engine, target=3, log=lambda message: None) == 3
+    assert "b" in inspect(engine).get_table_names()
@@ -0,0 +1,27 @@
+"""The /api/changes feed (app/outbox.py)"""
+import threading
+import time
+
+
+def test_change_feed_follows_commits(app, client, auth):
+    cursor = client.get("/api/changes/", headers=auth).get_json()["cursor"]
+
+    client.patch("/api/products/1/discount", json={"discount_percentage": 10}, headers=auth)
+    client.patch("/api/orders/1/status", json={"status": "shipped"}, headers=auth)
+    feed = client.get(f"/api/changes/?since={cursor}", headers=auth).get_json()
+    assert [(e["entity"], e["id"], e["action"]) for e in feed["events"]] == [
+        ("product", 1, "updated"), ("order", 1, "updated"),
+    ]
+    assert feed["events"][0]["fields"] == ["discount_percentage"]
+    assert feed["events"][1]["status"] == "shipped"
+
+    # A long-poll returns as soon as another request commits
+    def delete_later():
+        time.sleep(0.2)
+        app.test_client().delete("/api/orders/2", headers=auth)
+
+    threading.Thread(target=delete_later).start()
+    start = time.perf_counter()
+    feed = client.get(f"/api/changes/?since={feed['cursor']}&wait=5", headers=auth).get_json()
+    assert time.perf_counter() - start < 2
+    assert [(e["entity"], e["id"], e["action"]) for e in feed["events"]] == [("order", 2, "deleted")]
@@ -0,0 +1,31 @@
+"""Monthly partitions and archival (app/partitions.py)"""
+import gzip
+import json
+from datetime import date, datetime
+
+from app import partitions
+from app.extensions import db
+from app.models import Order, OrderItem
+
+
+def test_archived_months_stay_in_reports_and_stock(app, client, auth, tmp_path):
+    reports = ["/api/products/1/quantity", "/api/reports/top-selling-products", "/api/reports/sales-by-brand",
+               "/api/reports/order-status-summary", "/api/reports/earnings/monthly?year=2020&month=3",
+               "/api/reports/earnings/range?start_date=2020-01-01&end_date=2099-12-31"]
+    with app.app_context():
+        for day, status in [(15, "delivered"), (15, "cancelled"), (20, "shipped")]:
+            order = Order(client_id=1, status=status, total_amount=30, created_at=datetime(2020, 3, day, 12))
+            order.items = [OrderItem(product_id=1, quantity=3, price_at_purchase=10)]
+            db.session.add(order)
+        db.session.commit()
+    before = [client.get(path, headers=auth).get_json() for path in reports]
+
+    with app.app_context():
+        assert partitions.archive(db.engine, 1, str(tmp_path / "archive"), log=lambda message: None) == [date(2020, 3, 1)]
+        assert Order.query.filter(Order.created_at < datetime(2020, 4, 1)).count() == 0
+    with gzip.open(tmp_path / "archive" / "orders-2020-03.jsonl.gz", "rt") as archived:
+        assert [json.loads(line)["items"][0]["quantity"] for line in archived] == [3, 3, 3]
+
+    assert [client.get(path, headers=auth).get_json() for path in reports] == before
+    daily = client.get("/api/reports/earnings/daily?date=2020-03-15", headers=auth).get_json()
+    assert (daily["archived"], daily["total_orders"], daily["total_earnings"]) == (True, 1, 30)
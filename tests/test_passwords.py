@@ -0,0 +1,43 @@
+"""Password hashing in a bounded process pool (app/passwords.py)"""
+import threading
+
+from app import passwords
+from conftest import make_app, seed
+
+
+def test_logins_hash_in_the_process_pool(tmp_path):
+    app = make_app(tmp_path, PASSWORD_HASH_WORKERS=1)
+    seed(app)
+    client = app.test_client()
+
+    assert client.post("/api/auth/login", json={"username": "admin", "password": "admin123"}).status_code == 200
+    assert client.post("/api/auth/login", json={"username": "admin", "password": "wrong"}).status_code == 401
+
+
+def test_login_is_refused_when_no_hashing_slot_frees_up(tmp_path, monkeypatch):
+    app = make_app(tmp_path, PASSWORD_HASH_MAX_CONCURRENCY=1, PASSWORD_HASH_QUEUE_TIMEOUT=0.05)
+    seed(app)
+    entered, release = threading.Event(), threading.Event()
+    check = passwords.check_password_hash
+
+    def slow_check(pwhash, password):
+        entered.set()
+        release.wait(5)
+        return check(pwhash, password)
+
+    monkeypatch.setattr(passwords, "check_password_hash", slow_check)
+    credentials = {"username": "admin", "password": "admin123"}
+    statuses = []
+    first = threading.Thread(
+        target=lambda: statuses.append(app.test_client().post("/api/auth/login", json=credentials).status_code))
+    first.start()
+    try:
+        assert entered.wait(5)
+        response = app.test_client().post("/api/auth/login", json=credentials)
+    finally:
+        release.set()
+        first.join()
+
+    assert response.status_code == 503
+    assert response.headers["Retry-After"] == "1"
+    assert statuses == [200]
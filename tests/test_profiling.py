@@ -0,0 +1,64 @@
+"""Opt-in request profiles and their download routes (app/profiling.py)"""
+import os
+import pstats
+import socket
+import time
+
+import pytest
+
+from conftest import make_app, seed
+
+
+@pytest.fixture
+def app(tmp_path):
+    app = make_app(tmp_path, STREAM_BATCH_SIZE=10, PROFILE_SAMPLER_INTERVAL_MS=1)
+    seed(app, products=40)
+
+    @app.route("/slow")
+    def slow():
+        time.sleep(0.05)
+        return "done"
+
+    return app
+
+
+def test_cprofile_covers_the_whole_streamed_body(client, auth, tmp_path):
+    with client.get("/api/products/", headers={**auth, "X-Profile": "1"}) as response:
+        assert len(response.get_json()) == 40
+    profile_id = response.headers["X-Profile-Id"]
+    assert response.headers["X-Profile-Worker"] == f"{socket.gethostname()}:{os.getpid()}"
+
+    listed = client.get("/api/admin/profiles", headers=auth).get_json()
+    assert listed[0]["id"] == int(profile_id) and listed[0]["pid"] == os.getpid()
+    # Five keyset batches, all issued after the response was returned
+    assert listed[0]["sql_count"] == 9
+
+    detail = client.get(f"/api/admin/profiles/{profile_id}", headers=auth).get_json()
+    assert len(detail["statements"]) == 9
+    assert any("get_products" in row["function"] for row in detail["top_functions"])
+
+    download = client.get(f"/api/admin/profiles/{profile_id}/pstats", headers=auth)
+    assert download.headers["Content-Disposition"] == f"attachment; filename=profile-{profile_id}.prof"
+    (tmp_path / "profile.prof").write_bytes(download.data)
+    assert pstats.Stats(str(tmp_path / "profile.prof")).total_calls > 0
+    assert client.get(f"/api/admin/profiles/{profile_id}/collapsed", headers=auth).status_code == 404
+
+
+def test_sampler_profiles_download_as_collapsed_stacks(client, auth):
+    response = client.get("/slow", headers={**auth, "X-Profile": "sampler"})
+    profile_id = response.headers["X-Profile-Id"]
+
+    collapsed = client.get(f"/api/admin/profiles/{profile_id}/collapsed", headers=auth)
+    assert collapsed.status_code == 200
+    lines = collapsed.get_data(as_text=True).splitlines()
+    assert lines and all(line.rsplit(" ", 1)[1].isdigit() for line in lines)
+    assert any("slow (" in line for line in lines)
+    assert client.get(f"/api/admin/profiles/{profile_id}/pstats", headers=auth).status_code == 404
+
+
+def test_only_admins_can_ask_for_a_profile(client, auth):
+    assert "X-Profile-Id" not in client.get("/slow", headers={"X-Profile": "1"}).headers
+
+    missing = client.get("/api/admin/profiles/999999", headers=auth)
+    assert missing.status_code == 404
+    assert missing.get_json()["pid"] == os.getpid()
@@ -0,0 +1,151 @@
+"""Every route stays within its @query_budget, and the N+1 detector reports repeated lazy loads"""
+import logging
+
+import pytest
+from flask import jsonify
+
+from app.extensions import db
+from app.models import Order
+from app.querybudget import QueryBudgetExceeded
+from conftest import StatementCounter, make_app, seed
+
+
+def test_every_route_stays_within_budget(app, client, auth):
+    """QUERY_BUDGET_ENFORCE raises QueryBudgetExceeded out of the test client on overrun"""
+    cart = {
+        "client": {"name": "Client 1", "email": "client1@example.com"},
+        "items": [{"product_id": i, "quantity": 1} for i in range(1, 6)],
+    }
+    product = {
+        "name": "New", "price": 5, "gender": "Women", "initial_quantity": 3,
+        "category_id": 1, "brand_id": 1, "size_ids": [1, 2], "color_ids": [1], "reorder_threshold": 5,
+    }
+    calls = [
+        ("get", "/api/products/", None, 200),
+        ("get", "/api/products/1", None, 200),
+        ("get", "/api/products/1/quantity", None, 200),
+        ("get", "/api/products/1/related", None, 200),
+        ("get", "/api/products/99/related", None, 404),
+        ("get", "/api/products/low-stock", None, 200),
+        ("get", "/api/products/search?gender=Men&category=Category&brand=Brand"
+                "&size=Size&color=Color&price_min=1&availability=in_stock", None, 200),
+        ("get", "/api/products/categories", None, 200),
+        ("get", "/api/products/brands", None, 200),
+        ("get", "/api/products/sizes", None, 200),
+        ("get", "/api/products/colors", None, 200),
+        ("post", "/api/products/", product, 201),
+        ("put", "/api/products/1", {"name": "Renamed", "initial_quantity": 900, "reorder_threshold": 50,
+                                    "size_ids": [3], "color_ids": [2, 3]}, 200),
+        ("patch", "/api/products/1/discount", {"discount_percentage": 10}, 200),
+        ("post", "/api/products/categories", {"name": "New"}, 201),
+        ("post", "/api/products/brands", {"name": "New"}, 201),
+        ("post", "/api/products/sizes", {"name": "New"}, 201),
+        ("post", "/api/products/colors", {"name": "New"}, 201),
+        ("get", "/api/orders/", None, 200),
+        ("get", "/api/orders/1", None, 200),
+        ("get", "/api/orders/client/client1@example.com", None, 200),
+        ("post", "/api/orders/", cart, 201),
+        ("patch", "/api/orders/1/status", {"status": "shipped"}, 200),
+        ("delete", "/api/orders/2", None, 200),
+        ("get", "/api/reports/earnings/daily", None, 200),
+        ("get", "/api/reports/earnings/monthly", None, 200),
+        ("get", "/api/reports/earnings/range?start_date=2000-01-01&end_date=2100-01-01", None, 200),
+        ("get", "/api/reports/top-selling-products", None, 200),
+        ("get", "/api/reports/sales-by-category", None, 200),
+        ("get", "/api/reports/sales-by-brand", None, 200),
+        ("get", "/api/reports/order-status-summary", None, 200),
+        ("post", "/api/auth/register", {"username": "bob", "email": "bob@example.com", "password": "pw"}, 201),
+        ("get", "/api/auth/me", None, 200),
+        ("get", "/api/users/", None, 200),
+        ("get", "/api/users/2", None, 200),
+        ("put", "/api/users/2", {"email": "robert@example.com", "password": "pw2"}, 200),
+        ("delete", "/api/users/2", None, 200),
+        ("delete", "/api/products/7", None, 200),
+        ("get", "/api/admin/profiles", None, 200),
+        ("get", "/api/admin/slow-queries", None, 200),
+        ("get", "/api/changes/", None, 200),
+        ("get", "/api/changes/?since=0", None, 200),
+        ("post", "/api/batch", {"requests": [{"path": "/api/products/sizes"}]}, 200),
+    ]
+    for method, path, body, status in calls:
+        response = getattr(client, method)(path, json=body, headers=auth)
+        assert response.status_code == status, (method, path, response.get_json())
+        response.close()
+
+    missing = [
+        endpoint for endpoint, view in app.view_functions.items()
+        if endpoint.split(".")[0] in app.blueprints and not hasattr(view, "query_budget")
+    ]
+    assert not missing, f"routes without @query_budget: {missing}"
+
+
+@pytest.mark.parametrize("path", [
+    "/api/products/",
+    "/api/products/search?gender=Men",
+    "/api/orders/",
+    "/api/orders/client/client1@example.com",
+    "/api/reports/earnings/daily",
+])
+def test_statement_count_does_not_grow_with_rows(tmp_path, path):
+    """40 rows are four more STREAM_BATCH_SIZE batches than 4; only per_batch may grow per batch"""
+    counts = []
+    for size in (4, 40):
+        app = make_app(tmp_path, STREAM_BATCH_SIZE=10)
+        seed(app, products=size, orders=size)
+        client = app.test_client()
+        token = client.post(
+            "/api/auth/login", json={"username": "admin", "password": "admin123"}
+        ).get_json()["access_token"]
+        # Closing the response runs the budget check over the whole streamed body
+        with StatementCounter(app) as counter, \
+                client.get(path, headers={"Authorization": f"Bearer {token}"}) as response:
+            assert len(response.get_json()) > 0
+        assert response.status_code == 200
+        counts.append(counter.count)
+        view = app.view_functions[app.url_map.bind("").match(path.split("?")[0])[0]]
+        with app.app_context():
+            db.session.remove()
+            db.engine.dispose()
+    allowed = counts[0] + 4 * getattr(view, "query_budget_per_batch", 0)
+    assert counts[1] <= allowed, f"{path}: {counts[0]} statements for 4 rows, {counts[1]} for 40"
+
+
+def test_n_plus_one_is_reported_with_call_site(app, client, caplog):
+    @app.route("/lazy-orders")
+    def lazy_orders():
+        return jsonify([order.to_dict() for order in Order.query.all()])
+
+    with caplog.at_level(logging.WARNING, logger="app.querybudget"):
+        assert client.get("/lazy-orders").status_code == 200
+
+    reports = [r.getMessage() for r in caplog.records if "Possible N+1" in r.getMessage()]
+    assert reports, "repeated lazy loads were not reported"
+    assert any("FROM clients" in message for message in reports)
+    assert all("app/models/models.py" in message for message in reports)
+
+
+def test_budget_overrun_is_logged_when_not_enforced(tmp_path, caplog, monkeypatch):
+    app = make_app(tmp_path, QUERY_BUDGET_ENFORCE=False)
+    seed(app)
+    monkeypatch.setattr(app.view_functions["products.get_products"], "query_budget", 1)
+
+    with caplog.at_level(logging.WARNING, logger="app.querybudget"):
+        with app.test_client().get("/api/products/") as response:
+            assert response.status_code == 200
+
+    assert any("budget is 1" in r.getMessage() for r in caplog.records)
+
+
+def test_streamed_batches_count_against_the_budget(tmp_path, monkeypatch):
+    """Statements of batches read after the response is returned are checked when the body closes"""
+    app = make_app(tmp_path, STREAM_BATCH_SIZE=10)
+    seed(app, products=40)
+    client = app.test_client()
+    with client.get("/api/products/") as response:
+        assert len(response.get_json()) == 40
+
+    monkeypatch.setattr(app.view_functions["products.get_products"], "query_budget_per_batch", 1)
+    response = client.get("/api/products/")
+    assert response.status_code == 200
+    with pytest.raises(QueryBudgetExceeded, match="budget is 6"):
+        response.close()
@@ -0,0 +1,53 @@
+"""Rate limits and concurrency caps (app/ratelimit.py)"""
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from conftest import make_app, seed
+
+RATES = {"catalog": "1000/1000", "checkout": "1000/1000", "reports": "1000/1000", "auth": "1000/1000"}
+
+
+def test_checkout_is_admitted_while_catalog_is_saturated(tmp_path):
+    app = make_app(tmp_path, RATELIMIT_ENABLED=True, RATELIMIT_RATES=RATES,
+                   RATELIMIT_CONCURRENCY={"catalog": 3, "checkout": 0, "reports": 2, "auth": 2},
+                   RATELIMIT_SHARED_CONCURRENCY=3)
+    seed(app)
+    entered, release = threading.Semaphore(0), threading.Event()
+    sizes = app.view_functions["products.get_sizes"]
+
+    def blocking_sizes():
+        entered.release()
+        release.wait(5)
+        return sizes()
+
+    app.view_functions["products.get_sizes"] = blocking_sizes
+    cart = {"client": {"name": "Client 1", "email": "client1@example.com"},
+            "items": [{"product_id": 1, "quantity": 1}]}
+    with ThreadPoolExecutor(3) as pool:
+        held = [pool.submit(app.test_client().get, "/api/products/sizes") for _ in range(3)]
+        for _ in held:
+            assert entered.acquire(timeout=5)
+        try:
+            client = app.test_client()
+            assert client.get("/api/products/colors").status_code == 503
+            # Auth has slots of its own left, but the shared cap keeps the last thread for checkout
+            assert client.post("/api/auth/login", json={"username": "admin", "password": "x"}).status_code == 503
+            assert client.post("/api/orders/", json=cart).status_code == 201
+        finally:
+            release.set()
+        assert [future.result().status_code for future in held] == [200] * 3
+    assert app.test_client().get("/api/products/colors").status_code == 200
+
+
+def test_forwarded_for_cannot_mint_fresh_buckets(tmp_path):
+    app = make_app(tmp_path, RATELIMIT_ENABLED=True, TRUSTED_PROXY_HOPS=1,
+                   RATELIMIT_RATES=dict(RATES, catalog="0.001/2"))
+    seed(app)
+    client = app.test_client()
+
+    def get(forged):
+        # The proxy appends the address it saw; everything left of it comes from the client
+        return client.get("/api/products/sizes", headers={"X-Forwarded-For": f"{forged}, 203.0.113.7"}).status_code
+
+    assert [get(f"10.0.0.{n}") for n in range(3)] == [200, 200, 429]
+    assert client.get("/api/products/sizes", headers={"X-Forwarded-For": "203.0.113.8"}).status_code == 200
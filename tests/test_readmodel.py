@@ -0,0 +1,18 @@
+"""Stored product documents (app/readmodel.py)"""
+from app.extensions import db
+from app.models import Category, Size
+
+
+def test_product_documents_follow_related_changes(app, client, auth):
+    """Stored catalog documents are rebuilt when a product or what it links to changes"""
+    client.patch("/api/products/1/discount", json={"discount_percentage": 50}, headers=auth)
+    with app.app_context():
+        db.session.get(Category, 1).name = "Renamed"
+        db.session.get(Size, 1).name = "XL"
+        db.session.commit()
+
+    product = client.get("/api/products/1").get_json()
+    assert product["discounted_price"] == 5
+    assert product["category"]["name"] == "Renamed"
+    assert "XL" in [size["name"] for size in product["sizes"]]
+    assert product["current_quantity"] == 998
@@ -0,0 +1,44 @@
+"""Slow statements grouped by fingerprint, with the plan of the worst run (app/slowlog.py)"""
+import time
+
+from app.slowlog import fingerprint, normalize, parameter_shape
+from conftest import make_app, seed
+
+
+def test_literals_and_placeholders_share_a_fingerprint():
+    assert normalize("SELECT * FROM orders WHERE id = 42 AND status = 'it''s'") \
+        == "SELECT * FROM orders WHERE id = ? AND status = ?"
+    assert normalize("SELECT * FROM t2 WHERE a IN (%s, %s,%s) AND b = %(b_1)s AND c = :c AND d::text = ?") \
+        == "SELECT * FROM t2 WHERE a IN (...) AND b = ? AND c = ? AND d::text = ?"
+    assert normalize("SELECT price\n    FROM products WHERE price > 9.99") == "SELECT price FROM products WHERE price > ?"
+
+    assert fingerprint(normalize("SELECT 1 FROM t WHERE id IN (1, 2)")) \
+        == fingerprint(normalize("SELECT 1 FROM t WHERE id IN (?, ?, ?, ?)"))
+    assert parameter_shape({"id": 1, "name": "x"}, False) == {"id": "int", "name": "str"}
+    assert parameter_shape([(1, "x"), (2, "y")], True) == {"executemany": 2, "row": ["int", "str"]}
+
+
+def test_worst_run_is_explained_in_the_background(tmp_path):
+    # Every statement counts as slow
+    app = make_app(tmp_path, SLOW_QUERY_MS=0.0001)
+    seed(app)
+    client = app.test_client()
+    token = client.post("/api/auth/login", json={"username": "admin", "password": "admin123"})
+    auth = {"Authorization": f"Bearer {token.get_json()['access_token']}"}
+    client.delete("/api/admin/slow-queries", headers=auth)
+
+    assert client.get("/api/products/1", headers=auth).status_code == 200
+    entries = client.get("/api/admin/slow-queries", headers=auth).get_json()
+    entry = next(entry for entry in entries if "products.get_product" in entry["endpoints"]
+                 and entry["statement"].startswith("SELECT") and "FROM products" in entry["statement"])
+    assert entry["count"] == 1 and entry["max_ms"] > 0
+
+    deadline = time.monotonic() + 5
+    while True:
+        detail = client.get(f"/api/admin/slow-queries/{entry['fingerprint']}", headers=auth).get_json()
+        if detail["plan"] is not None or time.monotonic() > deadline:
+            break
+        time.sleep(0.02)
+    # EXPLAIN QUERY PLAN rows on SQLite, one JSON document on Postgres
+    assert isinstance(detail["plan"], (list, dict)) and "error" not in detail["plan"]
+    assert detail["plan_for_ms"] == entry["max_ms"]
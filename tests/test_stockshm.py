@@ -0,0 +1,46 @@
+"""Per-pod stock table in shared memory (app/stockshm.py)"""
+from sqlalchemy import event
+
+from app.extensions import db
+from conftest import StatementCounter, make_app, seed
+
+
+def test_stock_reads_come_from_shared_memory(tmp_path):
+    app = make_app(tmp_path, STOCK_SHM_PATH=str(tmp_path / "stock"))
+    seed(app)
+    client = app.test_client()
+    token = client.post(
+        "/api/auth/login", json={"username": "admin", "password": "admin123"}
+    ).get_json()["access_token"]
+    auth = {"Authorization": f"Bearer {token}"}
+
+    assert client.get("/api/products/1/quantity").get_json()["current_quantity"] == 998
+    with StatementCounter(app) as counter:
+        assert client.get("/api/products/1/quantity").get_json()["current_quantity"] == 998
+    assert counter.count == 0
+
+    # Order 1 holds products 1 and 2; cancelling it returns their units
+    client.patch("/api/orders/1/status", json={"status": "cancelled"}, headers=auth)
+    assert client.get("/api/products/1/quantity").get_json()["current_quantity"] == 999
+    with StatementCounter(app) as counter:
+        assert client.get("/api/products/1/quantity").get_json()["current_quantity"] == 999
+    assert counter.count == 0
+    assert client.get("/api/products/2").get_json()["current_quantity"] == 999
+
+    # Another worker's read that started before a status change must not store its stock
+    table = app.extensions["stock_table"]
+    versions = table.versions([1])
+    client.patch("/api/orders/1/status", json={"status": "confirmed"}, headers=auth)
+    table.store({1: (1000, 1)}, versions)
+    assert table.read(1) is None
+
+    # Nor may one that loads the committed stock before the change reaches the table
+    def load_committed(session):
+        table.store({1: (1000, 1)}, table.versions([1]))
+
+    event.listen(db.session, "after_commit", load_committed)
+    try:
+        client.patch("/api/orders/1/status", json={"status": "pending"}, headers=auth)
+    finally:
+        event.remove(db.session, "after_commit", load_committed)
+    assert client.get("/api/products/1/quantity").get_json()["current_quantity"] == 999
@@ -0,0 +1,40 @@
+"""Type-ahead suggestions (app/suggest.py)"""
+import time
+
+from app.extensions import db
+from app.models import Order, OrderItem
+from conftest import StatementCounter, make_app, seed
+
+
+def test_suggestions_come_from_memory(tmp_path):
+    app = make_app(tmp_path, SUGGEST_ENABLED=True)
+    seed(app)
+    with app.app_context():
+        order = Order(client_id=1, status="delivered", total_amount=50)
+        order.items = [OrderItem(product_id=4, quantity=5, price_at_purchase=10)]
+        db.session.add(order)
+        db.session.commit()
+    client = app.test_client()
+    response = client.post("/api/auth/login", json={"username": "admin", "password": "admin123"})
+    auth = {"Authorization": f"Bearer {response.get_json()['access_token']}"}
+
+    def suggest(prefix, until=lambda names: True):
+        # The index is built in the background after the first request
+        deadline = time.monotonic() + 5
+        while True:
+            response = client.get(f"/api/products/suggest?prefix={prefix}")
+            names = [s["name"] for s in response.get_json().get("suggestions", [])]
+            if response.status_code == 200 and until(names) or time.monotonic() > deadline:
+                return response, names
+            time.sleep(0.01)
+
+    suggest("pro")
+    with StatementCounter(app) as counter:
+        response, names = suggest("PRO")
+    assert response.status_code == 200 and counter.count == 0
+    assert names[0] == "Product 3" and len(names) == 6
+    assert suggest("brand 1")[0].get_json()["suggestions"] == [{"type": "brand", "id": 2, "name": "Brand 1"}]
+
+    # New names are indexed as they are committed
+    client.post("/api/products/brands", json={"name": "Prada"}, headers=auth)
+    assert suggest("pr", until=lambda names: "Prada" in names)[1][-1] == "Prada"
@@ -0,0 +1,75 @@
+"""The synthetic dataset loader (app/synthetic.py)"""
+import csv
+import io
+from datetime import datetime
+from types import SimpleNamespace
+
+from sqlalchemy import create_engine, text
+
+from app import synthetic
+from app.models import Client
+from conftest import make_app
+
+NOW = datetime(2026, 1, 1)
+
+
+class CopyCursor:
+    def __init__(self, copies):
+        self.copies = copies
+        self.closed = False
+
+    def copy_expert(self, sql, buffer):
+        self.copies.append((sql, buffer.read()))
+
+    def close(self):
+        self.closed = True
+
+
+def dataset(tmp_path, name, **sizes):
+    (tmp_path / name).mkdir()
+    app = make_app(tmp_path / name)
+    url = app.config["SQLALCHEMY_DATABASE_URI"]
+    synthetic.generate(url, now=NOW, log=lambda message: None, **sizes)
+    engine = create_engine(url)
+    try:
+        with engine.connect() as conn:
+            return {
+                table: conn.execute(text(f"SELECT * FROM {table} ORDER BY 1, 2")).all()
+                for table in ("products", "clients", "orders", "order_items", "product_sizes")
+            }
+    finally:
+        engine.dispose()
+
+
+def test_postgres_rows_go_through_copy_as_csv():
+    copies = []
+    cursor = CopyCursor(copies)
+    conn = SimpleNamespace(dialect=SimpleNamespace(name="postgresql"),
+                           connection=SimpleNamespace(dbapi_connection=SimpleNamespace(cursor=lambda: cursor)))
+    rows = [(1, "Levi's, \"501\"", "a@example.com", None, "Main St 1\nCity", datetime(2025, 5, 1, 12, 30))]
+
+    synthetic.write(conn, Client.__table__, synthetic.CLIENT_COLUMNS, rows)
+
+    (sql, body), = copies
+    assert sql == "COPY clients (id, name, email, phone, address, created_at) FROM STDIN WITH (FORMAT csv)"
+    # An unquoted empty field is NULL to COPY ... csv
+    assert list(csv.reader(io.StringIO(body))) == [
+        ["1", "Levi's, \"501\"", "a@example.com", "", "Main St 1\nCity", "2025-05-01 12:30:00"]]
+    assert cursor.closed
+
+
+def test_the_same_seed_loads_the_same_rows(tmp_path):
+    sizes = dict(products=30, clients=40, orders=120, chunk_size=25)
+    first = dataset(tmp_path, "first", **sizes)
+    assert first == dataset(tmp_path, "second", **sizes)
+
+    assert [len(first[table]) for table in ("products", "clients", "orders")] == [30, 40, 120]
+    products = {row.id: row for row in first["products"]}
+    totals = {}
+    for item in first["order_items"]:
+        assert item.product_id in products
+        totals[item.order_id] = totals.get(item.order_id, 0) + item.quantity * item.price_at_purchase
+    for order in first["orders"]:
+        assert str(order.created_at) <= str(NOW)
+        assert 1 <= order.client_id <= 40
+        assert round(totals[order.id], 2) == order.total_amount